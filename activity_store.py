@@ -0,0 +1,248 @@
+# activity_store.py
+
+import bisect
+import json
+import os
+import threading
+from datetime import datetime
+
+from config import ACTIVITY_FILE, ACTIVITY_PAGE_SIZE
+from search_index import SearchIndex
+
+# --- Activity Log File ---
+# Case activity entries live in an append-only file, one JSON object per line:
+#   {"case_id": 3, "timestamp": "2025-07-23 10:15:00", "description": "...", "user": "admin"}
+# Deleting a case appends a tombstone ({"case_id": 3, "purged": true}) instead of rewriting
+# the file. Only an index of (timestamp, byte offset) per case is kept in memory; the entries
+# of a page are read from disk when a case is shown.
+
+class ActivityStore:
+    """Append-only activity log with a per-case index on timestamp."""
+
+    def __init__(self, path=ACTIVITY_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._index = {}        # case_id -> sorted list of (timestamp, offset)
+        self._indexed_size = 0  # Bytes of the file covered by the index
+        self._file_id = None    # (st_dev, st_ino) of the indexed file, to notice replacements
+        self._search = None     # Text index of the descriptions (keyed by offset), built on the first search
+
+    # --- Index Maintenance ---
+    def _refresh(self):
+        """Brings the index up to date with the file, scanning only lines appended since the last call. Caller holds _lock."""
+        try:
+            stat_result = os.stat(self.path)
+        except FileNotFoundError:
+            self._index, self._indexed_size, self._file_id = {}, 0, None
+            self._reset_search()
+            return
+        file_id = (stat_result.st_dev, stat_result.st_ino)
+        if file_id != self._file_id or stat_result.st_size < self._indexed_size:
+            self._index, self._indexed_size, self._file_id = {}, 0, file_id # Replaced or truncated: rebuild
+            self._reset_search()
+        if stat_result.st_size == self._indexed_size:
+            return
+        with open(self.path, "rb") as f:
+            f.seek(self._indexed_size)
+            offset = self._indexed_size
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break # Incomplete trailing entry, picked up once it is complete
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    entry = None
+                if entry is not None:
+                    self._index_entry(entry, offset)
+                offset += len(line)
+            self._indexed_size = offset
+
+    def _reset_search(self):
+        """Empties the text index (if built) before a rescan re-fills it. Caller holds _lock."""
+        if self._search is not None:
+            self._search = SearchIndex(["description"])
+
+    def _index_entry(self, entry, offset):
+        case_id = entry.get("case_id")
+        if entry.get("purged"):
+            for _, purged_offset in self._index.pop(case_id, []):
+                if self._search is not None:
+                    self._search.remove(purged_offset)
+        else:
+            bisect.insort(self._index.setdefault(case_id, []), (entry.get("timestamp") or "", offset))
+            if self._search is not None:
+                self._search.add(offset, entry)
+
+    def _append_lines(self, entries):
+        """Appends entries with one write + fsync, then indexes them like any other new lines. Caller holds _lock."""
+        payload = "".join(json.dumps(entry, ensure_ascii=False) + "\n" for entry in entries)
+        self._refresh()
+        if os.path.exists(self.path) and os.path.getsize(self.path) > self._indexed_size:
+            payload = "\n" + payload # Close a torn trailing line (crash mid-append) so it is skipped
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        self._refresh()
+
+    # --- Public API ---
+    def append(self, case_id, description, user=None, timestamp=None):
+        """Records one activity for a case and returns the stored entry."""
+        entry = {
+            "case_id": int(case_id),
+            "timestamp": timestamp or datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "description": description,
+            "user": user,
+        }
+        with self._lock:
+            self._append_lines([entry])
+        return entry
+
+    def import_entries(self, case_id, entries):
+        """Bulk-appends existing entries ({"timestamp", "description", ...}) for a case."""
+        entries = [dict(entry, case_id=int(case_id)) for entry in entries if isinstance(entry, dict)]
+        if entries:
+            with self._lock:
+                self._append_lines(entries)
+
+    def purge_case(self, case_id):
+        """Hides every activity of a case (used when the case is deleted)."""
+        with self._lock:
+            self._append_lines([{"case_id": int(case_id), "purged": True}])
+
+    def count(self, case_id, since=None, until=None):
+        """Number of activities of a case, optionally limited to timestamps in [since, until]."""
+        with self._lock:
+            self._refresh()
+            return len(self._select(case_id, since, until))
+
+    def page(self, case_id, page=0, page_size=ACTIVITY_PAGE_SIZE, newest_first=True, since=None, until=None):
+        """Returns one page of a case's activities; only the entries on that page are read from disk."""
+        with self._lock:
+            self._refresh()
+            selected = self._select(case_id, since, until)
+            if newest_first:
+                selected = selected[::-1]
+            return self._read([offset for _, offset in selected[page * page_size:(page + 1) * page_size]])
+
+    def search(self, query, limit):
+        """
+        [(score, entry)] of the activities of live cases whose description matches query
+        (see search_index.SearchIndex.ranked), best first. The text index is built by
+        rescanning the file on the first search and kept up to date from then on.
+        """
+        with self._lock:
+            if self._search is None:
+                self._search = SearchIndex(["description"])
+                self._index, self._indexed_size = {}, 0 # Rescan so that every entry gets indexed
+            self._refresh()
+            ranked = self._search.ranked(query, limit)
+            return list(zip([score for score, _ in ranked], self._read([offset for _, offset in ranked])))
+
+    def entries_since(self, offset=0):
+        """
+        (file ID, end offset, entries) of the complete lines from a byte offset on,
+        tombstones included; used by snapshots to copy the log in increments.
+        """
+        with self._lock:
+            try:
+                f = open(self.path, "rb")
+            except FileNotFoundError:
+                return None, 0, []
+            with f:
+                stat_result = os.fstat(f.fileno())
+                f.seek(offset)
+                end, entries = offset, []
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break
+                    end += len(line)
+                    try:
+                        entries.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        continue # Blank line closing a torn entry
+            return [stat_result.st_dev, stat_result.st_ino], end, entries
+
+    def replace(self, entries):
+        """Replaces the whole log with entries (point-in-time restore); every process re-indexes the new file."""
+        with self._lock:
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write("".join(json.dumps(entry, ensure_ascii=False) + "\n" for entry in entries))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+            self._refresh()
+
+    def _read(self, offsets):
+        """Entries stored at the given offsets. Caller holds _lock."""
+        entries = []
+        if offsets:
+            with open(self.path, "rb") as f:
+                for offset in offsets:
+                    f.seek(offset)
+                    entries.append(json.loads(f.readline()))
+        return entries
+
+    def _select(self, case_id, since, until):
+        """Index slice of a case between two timestamps (strings compare chronologically). Caller holds _lock."""
+        items = self._index.get(int(case_id), [])
+        start = bisect.bisect_left(items, (since,)) if since else 0
+        end = bisect.bisect_right(items, (until, float("inf"))) if until else len(items)
+        return items[start:end]
+
+
+# --- Module-level Store ---
+# One store per process, shared by all Streamlit sessions like the data cache.
+_store = ActivityStore()
+
+def add_activity(case_id, description, user=None):
+    """Records a new activity for a case."""
+    return _store.append(case_id, description, user=user)
+
+def count_activities(case_id):
+    """Number of recorded activities of a case."""
+    return _store.count(case_id)
+
+def get_activities(case_id, page=0, page_size=ACTIVITY_PAGE_SIZE):
+    """One page of a case's activities, newest first."""
+    return _store.page(case_id, page, page_size)
+
+def search_activities(query, limit):
+    """Best-matching activities as [(score, entry)]."""
+    return _store.search(query, limit)
+
+def purge_case_activities(case_id):
+    """Hides the activities of a deleted case."""
+    _store.purge_case(case_id)
+
+def activity_log_since(offset=0):
+    """(file ID, end offset, entries) of the activity log from a byte offset on."""
+    return _store.entries_since(offset)
+
+def replace_activity_log(entries):
+    """Replaces the activity log with entries (point-in-time restore)."""
+    _store.replace(entries)
+
+def import_case_logs(case_rows):
+    """
+    Moves activity_log lists still embedded in case records (data saved before the
+    activity store existed) into the store. Cases that already have entries are skipped,
+    so this is safe to run on every load until the old column is gone.
+    Returns the number of imported entries.
+    """
+    imported = 0
+    for row in case_rows:
+        log = row.get("activity_log")
+        if isinstance(log, str):
+            try:
+                log = json.loads(log)
+            except json.JSONDecodeError:
+                log = []
+        if not log or row.get("case_id") is None:
+            continue
+        case_id = int(row["case_id"])
+        if _store.count(case_id) == 0:
+            _store.import_entries(case_id, log)
+            imported += len(log)
+    return imported
@@ -0,0 +1,121 @@
+# archive.py
+
+import os
+import threading
+import pandas as pd
+from datetime import date, timedelta
+
+from config import ARCHIVE_DIR, ARCHIVE_RULES
+from schema import TABLE_KEYS, build_table, concat_tables, columns_of_kind, encode_table
+from storage_backends import PartitionedStorage
+
+# --- Cold Partitions ---
+# Archived rows are kept encoded, as in the stores, in one compact JSON file per table
+# in ARCHIVE_DIR. A table's archive is only read and typed when it is searched, added
+# to or restored from, and is then kept in memory until its file changes.
+# Moving rows in and out of the working set is done by data_persistence, which also
+# updates the hot store.
+
+def cold_rows(table, df, today=None):
+    """Boolean mask of the rows of a working-set table that its ARCHIVE_RULES entry sends to the archive."""
+    rule = ARCHIVE_RULES[table]
+    cutoff = pd.Timestamp((today or date.today()) - timedelta(days=rule["older_than_days"]))
+    mask = df[rule["date_column"]] < cutoff
+    for col, value in rule["match"].items():
+        mask &= df[col] == value
+    return mask
+
+class ArchiveStore:
+    """Cold rows moved out of the working set, one file per table."""
+
+    def __init__(self, archive_dir=ARCHIVE_DIR):
+        self._files = PartitionedStorage(archive_dir)
+        self._lock = threading.Lock()
+        self._frames = {} # table -> (file signature, typed DataFrame)
+
+    def _signature(self, table):
+        try:
+            stat_result = os.stat(self._files.table_path(table))
+        except FileNotFoundError:
+            return None
+        return (stat_result.st_mtime_ns, stat_result.st_size)
+
+    def _load(self, table):
+        """The typed archive of a table, re-read only if its file changed. Caller holds _lock."""
+        signature = self._signature(table)
+        cached = self._frames.get(table)
+        if cached is None or cached[0] != signature:
+            rows = self._files.load([table])[0].get(table) or []
+            cached = self._frames[table] = (signature, build_table(table, rows))
+        return cached[1]
+
+    def _write(self, table, df):
+        self._files.write_tables({table: encode_table(table, df)})
+        self._frames[table] = (self._signature(table), df)
+
+    def load(self, table):
+        """Typed DataFrame of a table's archived rows."""
+        with self._lock:
+            return self._load(table)
+
+    def add(self, table, df):
+        """Adds typed rows to a table's archive, replacing archived rows with the same key."""
+        with self._lock:
+            archived = self._load(table)
+            key_col = TABLE_KEYS[table]
+            kept = archived[~archived[key_col].isin(df[key_col])]
+            self._write(table, concat_tables(table, [kept, df]) if not kept.empty else df.reset_index(drop=True))
+
+    def replace(self, table, rows):
+        """Replaces a table's archive with encoded rows (point-in-time restore)."""
+        with self._lock:
+            self._write(table, build_table(table, rows))
+
+    def remove(self, table, keys):
+        """Drops the rows with the given keys from a table's archive."""
+        with self._lock:
+            archived = self._load(table)
+            mask = archived[TABLE_KEYS[table]].isin(keys)
+            if mask.any():
+                self._write(table, archived[~mask].reset_index(drop=True))
+
+    def search(self, table, text=""):
+        """
+        Archived rows of a table whose text or category columns contain text
+        (case-insensitive), or whose ID equals it. Empty text returns every row.
+        """
+        df = self.load(table)
+        text = text.strip()
+        if not text or df.empty:
+            return df
+        mask = pd.Series(False, index=df.index)
+        for col in columns_of_kind(table, "text") + columns_of_kind(table, "category"):
+            mask |= df[col].astype(str).str.contains(text, case=False, regex=False, na=False)
+        if text.isdigit():
+            mask |= df[TABLE_KEYS[table]] == int(text)
+        return df[mask]
+
+
+# --- Module-level Archive ---
+# One archive per process, shared by all Streamlit sessions.
+_store = ArchiveStore()
+
+def load_archive(table):
+    """Every archived row of a table (typed)."""
+    return _store.load(table)
+
+def add_to_archive(table, df):
+    """Writes typed rows into the archive of a table."""
+    _store.add(table, df)
+
+def remove_from_archive(table, keys):
+    """Deletes rows from the archive of a table (after they were restored)."""
+    _store.remove(table, keys)
+
+def replace_archive(table, rows):
+    """Replaces the archive of a table with encoded rows (point-in-time restore)."""
+    _store.replace(table, rows)
+
+def search_archive(table, text=""):
+    """Archived rows of a table matching a search text."""
+    return _store.search(table, text)
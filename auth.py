@@ -1,8 +1,8 @@
 # auth.py
 
 import streamlit as st
-import pandas as pd # Import pandas for DataFrame operations
 from config import USERS # Import initial user credentials from config
+from data_persistence import make_change # Change records passed to save_data_func
 
 def authenticate_user(save_data_func):
     """
@@ -58,20 +58,18 @@ def authenticate_user(save_data_func):
                     # Fallback to initial config users if not found in loaded data (first run)
                     elif username in USERS and USERS[username] == password:
                         # If authenticated via config, add to session_state.users for persistence
-                        if not st.session_state.users.empty and username not in st.session_state.users['username'].values:
-                            new_user_df = pd.DataFrame([{"username": username, "password": password}])
-                            st.session_state.users = pd.concat([st.session_state.users, new_user_df], ignore_index=True)
-                            save_data_func() # Save the new user
-                        elif st.session_state.users.empty: # If users DataFrame was empty
-                            st.session_state.users = pd.DataFrame([{"username": username, "password": password}])
-                            save_data_func()
+                        if st.session_state.users.empty or username not in st.session_state.users['username'].values:
+                            saved = save_data_func([make_change("users", "insert", username, {"username": username, "password": password})]) # Save the new user
+                        else:
+                            saved = True
                         
-                        st.session_state.authenticated = True
-                        st.session_state.username = username
-                        # Set query parameter for persistence
-                        st.experimental_set_query_params(auth_token=username)
-                        st.success(f"تم تسجيل الدخول بنجاح! مرحباً، {username}!")
-                        st.rerun()
+                        if saved: # A rejected save has already shown its error
+                            st.session_state.authenticated = True
+                            st.session_state.username = username
+                            # Set query parameter for persistence
+                            st.experimental_set_query_params(auth_token=username)
+                            st.success(f"تم تسجيل الدخول بنجاح! مرحباً، {username}!")
+                            st.rerun()
                     else:
                         st.error("اسم المستخدم أو كلمة المرور غير صحيحة.")
 
@@ -92,13 +90,11 @@ def authenticate_user(save_data_func):
                         st.error("اسم المستخدم هذا موجود بالفعل. يرجى اختيار اسم مستخدم آخر.")
                     else:
                         # Add new user to session state and save
-                        new_user_df = pd.DataFrame([{"username": new_username, "password": new_password}])
-                        st.session_state.users = pd.concat([st.session_state.users, new_user_df], ignore_index=True)
-                        save_data_func()
-                        st.success(f"✅ تم إنشاء الحساب بنجاح لـ {new_username}! يمكنك الآن تسجيل الدخول.")
-                        # Optionally, log them in directly after signup
-                        # st.session_state.authenticated = True
-                        # st.session_state.username = new_username
-                        # st.experimental_set_query_params(auth_token=new_username)
-                        # st.rerun()
+                        if save_data_func([make_change("users", "insert", new_username, {"username": new_username, "password": new_password})]):
+                            st.success(f"✅ تم إنشاء الحساب بنجاح لـ {new_username}! يمكنك الآن تسجيل الدخول.")
+                            # Optionally, log them in directly after signup
+                            # st.session_state.authenticated = True
+                            # st.session_state.username = new_username
+                            # st.experimental_set_query_params(auth_token=new_username)
+                            # st.rerun()
         return False
@@ -0,0 +1,111 @@
+# background_writer.py
+
+import atexit
+import threading
+import time
+
+from config import WRITER_DEBOUNCE_SECONDS, WRITER_MAX_DELAY_SECONDS, WRITER_RETRY_SECONDS, WRITER_MAX_ATTEMPTS, WRITER_SHUTDOWN_TIMEOUT_SECONDS
+
+class BackgroundWriter:
+    """
+    Single writer thread that persists queued saves off the request thread.
+
+    Saves submitted in quick succession are coalesced: their change records are
+    concatenated into one batch. The thread waits until no new save has arrived for
+    WRITER_DEBOUNCE_SECONDS, but never delays a write by more than
+    WRITER_MAX_DELAY_SECONDS.
+
+    A batch that fails is retried on its own every WRITER_RETRY_SECONDS, ahead of the
+    saves queued meanwhile. After WRITER_MAX_ATTEMPTS failures it is handed to discard
+    and the writer moves on, so one bad batch can't hold up every later save.
+    """
+
+    def __init__(self, write_changes, discard):
+        self._write_changes = write_changes # Callable(changes) persisting change records
+        self._discard = discard             # Callable(changes, error) for batches that keep failing
+        self._condition = threading.Condition()
+        self._pending_changes = []
+        self._failed = None # (changes, attempts) of the batch being retried
+        self._first_queued_at = None
+        self._last_queued_at = None
+        self._in_flight = False
+        self.last_error = None
+        self._thread = threading.Thread(target=self._run, name="mojaz-background-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.flush, WRITER_SHUTDOWN_TIMEOUT_SECONDS) # Don't lose queued saves on shutdown
+
+    def submit(self, changes):
+        """Queues a save (a list of change records) and returns immediately."""
+        with self._condition:
+            self._pending_changes.extend(changes)
+            now = time.monotonic()
+            if self._first_queued_at is None:
+                self._first_queued_at = now
+            self._last_queued_at = now
+            self._condition.notify_all()
+
+    def busy(self):
+        """True while saves are queued or being written, i.e. the store lags behind memory."""
+        with self._condition:
+            return self._has_pending() or self._in_flight
+
+    def pending_tables(self):
+        """Returns the names of the tables with queued, unwritten saves."""
+        with self._condition:
+            failed = self._failed[0] if self._failed else []
+            return {change["table"] for change in self._pending_changes + failed}
+
+    def flush(self, timeout=None):
+        """Blocks until every queued save has been written (or given up on). Returns False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            self._first_queued_at = 0 if self._has_pending() else None # Skip the debounce wait
+            self._condition.notify_all()
+            while self._has_pending() or self._in_flight:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+        return True
+
+    def _has_pending(self):
+        return self._failed is not None or bool(self._pending_changes)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._has_pending():
+                    self._condition.wait()
+                # Debounce: wait for the burst of saves to settle (a failed batch has already waited)
+                while self._failed is None:
+                    now = time.monotonic()
+                    quiet_for = now - self._last_queued_at
+                    waited = now - self._first_queued_at
+                    if quiet_for >= WRITER_DEBOUNCE_SECONDS or waited >= WRITER_MAX_DELAY_SECONDS:
+                        break
+                    self._condition.wait(min(WRITER_DEBOUNCE_SECONDS - quiet_for, WRITER_MAX_DELAY_SECONDS - waited))
+                if self._failed is not None:
+                    (changes, attempts), self._failed = self._failed, None
+                else:
+                    changes, attempts, self._pending_changes = self._pending_changes, 0, []
+                    self._first_queued_at = self._last_queued_at = None
+                self._in_flight = True
+
+            try:
+                self._write_changes(changes)
+                self.last_error = None
+            except Exception as e:
+                self.last_error = e
+                attempts += 1
+                if attempts >= WRITER_MAX_ATTEMPTS:
+                    print(f"Background write failed {attempts} times, giving up on {len(changes)} changes: {e}")
+                    self._discard(changes, e)
+                else:
+                    print(f"Background write failed, retrying in {WRITER_RETRY_SECONDS}s: {e}")
+                    with self._condition:
+                        self._failed = (changes, attempts) # Retried alone, before anything queued meanwhile
+                    time.sleep(WRITER_RETRY_SECONDS)
+            finally:
+                with self._condition:
+                    self._in_flight = False
+                    self._condition.notify_all()
@@ -0,0 +1,497 @@
+# benchmarks.py
+
+import argparse
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+import pandas as pd
+from datetime import date, timedelta
+
+from config import REMINDER_RELATED_TYPES, CASE_TYPE_OPTIONS, CASE_STATUS_OPTIONS, CASE_PRIORITY_OPTIONS, CLIENT_TYPE_OPTIONS, TIME_ENTRY_CATEGORIES
+from schema import TABLE_NAMES, TABLE_SCHEMAS, TABLE_KEYS, build_table
+
+# Run with: python benchmarks.py <benchmark> [options]
+# Results are printed; redirect to bench_output.txt to keep them (ignored by git).
+
+# --- Synthetic Data ---
+# Share of the requested row count given to each table
+_TABLE_SHARES = {"clients": 0.1, "cases": 0.2, "invoices": 0.25, "reminders": 0.2, "time_entries": 0.25}
+
+def generate_records(total_rows, seed=42):
+    """Builds raw records ({table: [row dicts]}, as stored in the JSON file) totalling about total_rows rows."""
+    rng = random.Random(seed)
+    counts = {table: max(1, int(total_rows * share)) for table, share in _TABLE_SHARES.items()}
+    start = date(2020, 1, 1)
+    day = lambda: (start + timedelta(days=rng.randrange(2000))).isoformat()
+    n_clients, n_cases = counts["clients"], counts["cases"]
+
+    data = {
+        "clients": [
+            {"client_id": i, "name": f"عميل {i}", "phone": f"05{rng.randrange(10**8):08d}", "email": f"client{i}@example.com",
+             "notes": "", "type": rng.choice(CLIENT_TYPE_OPTIONS), "address": "الرياض", "company_name": "", "secondary_contact": ""}
+            for i in range(1, n_clients + 1)
+        ],
+        "cases": [
+            {"case_id": i, "client_id": rng.randint(1, n_clients), "case_name": f"قضية {i}", "case_type": rng.choice(CASE_TYPE_OPTIONS),
+             "status": rng.choice(CASE_STATUS_OPTIONS), "court_date": day(), "opposing_party": "", "case_description": "",
+             "responsible_lawyer": "admin", "notes": "", "priority": rng.choice(CASE_PRIORITY_OPTIONS)}
+            for i in range(1, n_cases + 1)
+        ],
+        "invoices": [
+            {"invoice_id": i, "client_id": rng.randint(1, n_clients), "case_id": rng.randint(0, n_cases),
+             "amount": round(rng.uniform(100, 50000), 2), "paid": rng.random() < 0.5, "date": day(), "due_date": day()}
+            for i in range(1, counts["invoices"] + 1)
+        ],
+        "reminders": [
+            {"reminder_id": i, "related_type": "قضية", "related_id": rng.randint(1, n_cases), "description": f"تذكير {i}",
+             "date": day(), "is_completed": rng.random() < 0.3}
+            for i in range(1, counts["reminders"] + 1)
+        ],
+        "users": [{"username": "admin", "password": "admin"}],
+        "time_entries": [
+            {"entry_id": i, "client_id": rng.randint(1, n_clients), "case_id": rng.randint(0, n_cases), "date": day(),
+             "hours": round(rng.uniform(0.25, 8), 2), "category": rng.choice(TIME_ENTRY_CATEGORIES), "description": ""}
+            for i in range(1, counts["time_entries"] + 1)
+        ],
+    }
+    return data
+
+def _directory_size(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+def _timed(func, repeat):
+    """Returns (best wall time in seconds, last result) over repeat calls."""
+    best, result = None, None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+# --- Snapshot Formats ---
+def bench_snapshot(row_counts, repeat=3, compressions=("lz4", "uncompressed")):
+    """Cold-start time and size of the JSON data file vs. the columnar backend."""
+    from storage_backends import JsonStorage, ColumnarStorage
+
+    print(f"{'rows':>9} {'format':<22} {'size MB':>9} {'write s':>9} {'cold start s':>13}")
+    for total_rows in row_counts:
+        data = generate_records(total_rows)
+        workdir = tempfile.mkdtemp(prefix="mojaz_bench_")
+        try:
+            # Current format: json.dump(..., indent=4), then parse and type every table on load
+            json_storage = JsonStorage(data_file=os.path.join(workdir, "data.json"), journal_enabled=False)
+            write_time, _ = _timed(lambda: json_storage.write_all(data), 1)
+            load_time, _ = _timed(lambda: {t: build_table(t, rows) for t, rows in json_storage.load()[0].items()}, repeat)
+            size = _directory_size(json_storage.data_file)
+            print(f"{total_rows:>9} {'json indent=4':<22} {size / 2**20:>9.1f} {write_time:>9.2f} {load_time:>13.3f}")
+
+            frames = {table: build_table(table, data[table]) for table in TABLE_NAMES}
+            for compression in compressions:
+                columnar = ColumnarStorage(os.path.join(workdir, f"columnar_{compression}"), compression=compression)
+                write_time, _ = _timed(lambda: columnar.write_tables(frames), 1)
+                load_time, loaded = _timed(lambda: columnar.load()[0], repeat)
+                assert all(loaded[t].equals(frames[t]) for t in TABLE_NAMES), "columnar round trip changed the data"
+                size = _directory_size(columnar.columnar_dir)
+                print(f"{total_rows:>9} {'columnar ' + compression:<22} {size / 2**20:>9.1f} {write_time:>9.2f} {load_time:>13.3f}")
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+# --- Column Dtypes ---
+def _object_dtypes(name, df):
+    """The frame as typed before the schema registry: int64 IDs, object strings and datetime.date objects."""
+    df = df.copy()
+    for col, spec in TABLE_SCHEMAS[name].items():
+        if spec["kind"] == "id":
+            df[col] = df[col].astype("int64")
+        elif spec["kind"] == "category":
+            df[col] = df[col].astype(object)
+        elif spec["kind"] == "date":
+            df[col] = df[col].dt.date
+    return df
+
+def bench_dtypes(row_counts, repeat=5):
+    """Memory footprint and filter/groupby time with the registry's dtypes vs. object columns."""
+    today = date.today()
+    print(f"{'rows':>9} {'dtypes':<10} {'memory MB':>10} {'filter ms':>10} {'groupby ms':>11}")
+    for total_rows in row_counts:
+        data = generate_records(total_rows)
+        typed = {table: build_table(table, data[table]) for table in TABLE_NAMES}
+        variants = {"registry": (typed, pd.Timestamp(today)), "object": ({t: _object_dtypes(t, df) for t, df in typed.items()}, today)}
+        for label, (frames, today_value) in variants.items():
+            memory = sum(df.memory_usage(deep=True).sum() for df in frames.values())
+            cases, reminders = frames["cases"], frames["reminders"]
+            filter_time, _ = _timed(lambda: (
+                len(cases[cases["status"] == "مغلقة"]),
+                len(reminders[(reminders["date"] >= today_value) & ~reminders["is_completed"]]),
+            ), repeat)
+            groupby_time, _ = _timed(lambda: (
+                cases.groupby("status", observed=True).size(),
+                frames["time_entries"].groupby("category", observed=True)["hours"].sum(),
+            ), repeat)
+            print(f"{total_rows:>9} {label:<10} {memory / 2**20:>10.1f} {filter_time * 1000:>10.2f} {groupby_time * 1000:>11.2f}")
+
+# --- Streaming Loads ---
+def bench_stream(row_counts, memory_limit_mb=64):
+    """Peak traced memory and time of json.load + build_table vs. the streaming loader on the same DATA_FILE."""
+    import tracemalloc
+    from storage_backends import JsonStorage
+    from json_stream import load_tables_streaming
+
+    print(f"{'rows':>9} {'file MB':>8} {'loader':<16} {'peak MB':>8} {'typed MB':>9} {'time s':>7}")
+    for total_rows in row_counts:
+        workdir = tempfile.mkdtemp(prefix="mojaz_bench_")
+        try:
+            storage = JsonStorage(data_file=os.path.join(workdir, "data.json"), journal_enabled=False)
+            storage.write_all(generate_records(total_rows))
+            size = os.path.getsize(storage.data_file)
+
+            def load_whole():
+                with open(storage.data_file, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                return {table: build_table(table, data.get(table) or []) for table in TABLE_NAMES}
+
+            def load_streaming():
+                with open(storage.data_file, "r", encoding="utf-8") as f:
+                    return load_tables_streaming(f, TABLE_NAMES, memory_limit_mb=memory_limit_mb)
+
+            for label, loader in (("json.load", load_whole), (f"stream {memory_limit_mb} MB", load_streaming)):
+                tracemalloc.start()
+                started = time.perf_counter()
+                frames = loader()
+                elapsed = time.perf_counter() - started
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                typed = sum(df.memory_usage(deep=True).sum() for df in frames.values())
+                del frames
+                print(f"{total_rows:>9} {size / 2**20:>8.1f} {label:<16} {peak / 2**20:>8.1f} {typed / 2**20:>9.1f} {elapsed:>7.2f}")
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+# --- Session Memory ---
+def bench_sessions(row_counts, sessions=50):
+    """Memory added by concurrent sessions holding deep copies of the tables vs. shallow copies of a shared snapshot."""
+    import tracemalloc
+    print(f"{'rows':>9} {'sessions':>9} {'strategy':<15} {'added MB':>9} {'per session MB':>15}")
+    for total_rows in row_counts:
+        data = generate_records(total_rows)
+        shared = {table: build_table(table, data[table]) for table in TABLE_NAMES}
+        for label, copy_frame in (("deep copy", lambda df: df.copy()), ("shallow copy", lambda df: df.copy(deep=False))):
+            tracemalloc.start()
+            before = tracemalloc.get_traced_memory()[0]
+            session_frames = [{table: copy_frame(df) for table, df in shared.items()} for _ in range(sessions)]
+            for frames in session_frames[::10]:
+                column = frames["reminders"]["is_completed"].copy() # Some sessions modify a row, replacing its column as saves do
+                column.iloc[0] = True
+                frames["reminders"]["is_completed"] = column
+            added = tracemalloc.get_traced_memory()[0] - before
+            tracemalloc.stop()
+            del session_frames
+            print(f"{total_rows:>9} {sessions:>9} {label:<15} {added / 2**20:>9.1f} {added / sessions / 2**20:>15.3f}")
+
+# --- Search Index ---
+def bench_search(row_counts, repeat=20):
+    """Client search: str.contains over five columns vs. the trigram index (query, build, incremental update)."""
+    from search_index import SEARCH_FIELDS, SearchIndex
+    from journal import make_change
+    fields = SEARCH_FIELDS["clients"]
+    print(f"{'rows':>9} {'clients':>8} {'query':<16} {'scan ms':>8} {'index ms':>9} {'scan hits':>9} {'index hits':>10}")
+    for total_rows in row_counts:
+        clients = build_table("clients", generate_records(total_rows)["clients"])
+        index = SearchIndex(fields)
+        build_time, _ = _timed(lambda: index.build(clients, "client_id"), 1)
+        for query in ("عميل 4711", "0551", "example.com", "الرياض", "غير موجود"):
+            def scan():
+                mask = pd.Series(False, index=clients.index)
+                for field in fields:
+                    mask |= clients[field].astype(str).str.contains(query, case=False, na=False)
+                return clients[mask]
+            scan_time, scanned = _timed(scan, repeat)
+            index_time, found = _timed(lambda: clients[clients["client_id"].isin(index.search(query))], repeat)
+            # Multi-word queries: the scan needs the exact phrase, the index every word anywhere
+            print(f"{total_rows:>9} {len(clients):>8} {query:<16} {scan_time * 1000:>8.2f} {index_time * 1000:>9.2f} {len(scanned):>9} {len(found):>10}")
+        change = make_change("clients", "update", 1, {"name": "أحمد المحدث"})
+        update_time, _ = _timed(lambda: index.apply_changes([change], clients), repeat)
+        print(f"{total_rows:>9} {len(clients):>8} build {build_time * 1000:.0f} ms, one-row update {update_time * 1000:.3f} ms")
+
+def bench_global_search(row_counts, repeat=20, limit=30):
+    """Ranked search over every indexed table plus case activities (build time, per-query time)."""
+    from search_index import SEARCH_FIELDS, SearchIndex
+    from activity_store import ActivityStore
+    print(f"{'rows':>9} {'query':<16} {'ms':>8} {'hits':>6}")
+    for total_rows in row_counts:
+        data = generate_records(total_rows)
+        frames = {table: build_table(table, data[table]) for table in SEARCH_FIELDS}
+        indexes = {table: SearchIndex(fields) for table, fields in SEARCH_FIELDS.items()}
+        with tempfile.TemporaryDirectory() as tmp:
+            activities = ActivityStore(os.path.join(tmp, "activity.log"))
+            for case_id in range(1, len(frames["cases"]) + 1, 4):
+                activities.import_entries(case_id, [{"timestamp": "2025-01-01 10:00:00", "description": f"اجتماع مع العميل بخصوص القضية {case_id}"}])
+            started = time.perf_counter()
+            for table, index in indexes.items():
+                index.build(frames[table], TABLE_KEYS[table])
+            activities.search("", limit) # Builds the activity index
+            print(f"{total_rows:>9} build {(time.perf_counter() - started) * 1000:.0f} ms")
+            for query in ("عميل 4711", "0551", "تذكير 12", "اجتماع 120", "قضية", "غير موجود"):
+                def search():
+                    hits = [hit for table, index in indexes.items() for hit in index.ranked(query, limit)]
+                    hits += activities.search(query, limit)
+                    return sorted(hits, key=lambda hit: hit[0], reverse=True)[:limit]
+                elapsed, hits = _timed(search, repeat)
+                print(f"{total_rows:>9} {query:<16} {elapsed * 1000:>8.2f} {len(hits):>6}")
+
+# --- Reminder Details ---
+def bench_reminders(reminder_counts, repeat=5):
+    """Related-entity names and status of reminders: the old per-row loop vs. crm_modules.reminder_details."""
+    from crm_modules import reminder_details
+    print(f"{'reminders':>10} {'strategy':<12} {'seconds':>9}")
+    for count in reminder_counts:
+        data = generate_records(count * 5) # Reminders get a fifth of the rows
+        clients, cases, reminders = (build_table(table, data[table]) for table in ("clients", "cases", "reminders"))
+        cases = cases.iloc[::2] # Half of the linked cases were deleted since
+        # A mix of client, case and general reminders (client ids past the last client are missing entities)
+        reminders = reminders.assign(related_type=pd.Categorical(
+            [REMINDER_RELATED_TYPES[i % 3] for i in range(len(reminders))], categories=REMINDER_RELATED_TYPES
+        ))
+        today = pd.Timestamp(date(2022, 6, 1))
+
+        def per_row():
+            related, status = pd.Series("", index=reminders.index, dtype=object), pd.Series("مكتملة", index=reminders.index, dtype=object)
+            for idx, row in reminders.iterrows():
+                if row["related_type"] == "عميل" and row["related_id"] in clients["client_id"].values:
+                    related[idx] = clients[clients["client_id"] == row["related_id"]]["name"].iloc[0]
+                elif row["related_type"] == "قضية" and row["related_id"] in cases["case_id"].values:
+                    related[idx] = cases[cases["case_id"] == row["related_id"]]["case_name"].iloc[0]
+                else:
+                    related[idx] = "لا يوجد"
+                if not row["is_completed"]:
+                    status[idx] = "قادمة" if row["date"] >= today else "متأخرة"
+            return related, status
+
+        def vectorized():
+            client_names = dict(zip(clients["client_id"].tolist(), clients["name"].tolist()))
+            case_names = dict(zip(cases["case_id"].tolist(), cases["case_name"].tolist()))
+            return reminder_details(reminders, client_names, case_names, today)
+
+        vector_time, (related, status) = _timed(vectorized, repeat)
+        loop_time, (loop_related, loop_status) = _timed(per_row, 1) # Slow: run once
+        assert related.equals(loop_related) and status.equals(loop_status)
+        print(f"{len(reminders):>10} {'per row':<12} {loop_time:>9.3f}")
+        print(f"{len(reminders):>10} {'vectorized':<12} {vector_time:>9.3f}")
+
+# --- Contract PDFs ---
+def bench_pdf(contracts, repeat=3):
+    """Per-contract PDF latency with the font parsed for every document vs. the shared font registry."""
+    import pdf_utils
+    data = {
+        "date": date(2025, 1, 1), "party1": "شركة الأمل للتجارة", "party2": "محمد أحمد", "start_date": date(2025, 2, 1),
+        "job_title": "محاسب", "salary": 5000.0, "duration": 12, "non_compete": True, "non_compete_city": "جدة",
+    }
+    print(f"{'strategy':<10} {'first ms':>9} {'ms/contract':>12}")
+    for name, cache in (("add_font", False), ("registry", True)):
+        pdf_utils._fonts = pdf_utils.FontRegistry(cache=cache)
+        start = time.perf_counter()
+        pdf_utils.generate_contract_pdf("عقد عمل", data) # Includes the one-time font parse for the registry
+        first = time.perf_counter() - start
+        elapsed, _ = _timed(lambda: [pdf_utils.generate_contract_pdf("عقد عمل", data) for _ in range(contracts)], repeat)
+        print(f"{name:<10} {first * 1000:>9.1f} {elapsed * 1000 / contracts:>12.2f}")
+
+# --- Arabic Shaping ---
+def bench_reshape(documents, repeat=3):
+    """Shaping the lines of many contracts: uncached per line vs. the cached reshape_arabic and its batch API."""
+    import arabic_reshaper
+    from bidi.algorithm import get_display
+    from pdf_utils import reshape_arabic, reshape_arabic_batch, reshape_cache_stats, _shape
+    # Contract-like lines: fixed clauses plus a few per-document values (names, dates, amounts)
+    documents_lines = [[
+        "بتاريخ 2025-01-%02d، تم الاتفاق بين:" % (i % 28 + 1),
+        f"الطرف الأول: شركة رقم {i % 50}.",
+        f"الطرف الثاني: موظف رقم {i}.",
+        f"براتب شهري قدره: {3000 + i % 20 * 250:.2f} ريال سعودي",
+        "يمكن لأي من الطرفين فسخ العقد بإشعار كتابي مسبق مدته 30 يومًا.",
+        "يخضع هذا العقد لأحكام نظام العمل السعودي ولوائحه التنفيذية.",
+    ] for i in range(documents)]
+
+    def uncached():
+        return [[get_display(arabic_reshaper.reshape(line)) for line in lines] for lines in documents_lines]
+
+    print(f"{'strategy':<10} {'first pass ms/doc':>18} {'repeat ms/doc':>14}")
+    uncached_time, expected = _timed(uncached, repeat)
+    print(f"{'uncached':<10} {uncached_time * 1000 / documents:>18.3f} {uncached_time * 1000 / documents:>14.3f}")
+    for name, shape in (("cached", lambda lines: [reshape_arabic(line) for line in lines]), ("batch", reshape_arabic_batch)):
+        _shape.cache_clear()
+        run = lambda: [shape(lines) for lines in documents_lines]
+        first_time, result = _timed(run, 1) # Starts with an empty cache
+        assert result == expected
+        repeat_time, _ = _timed(run, repeat)
+        print(f"{name:<10} {first_time * 1000 / documents:>18.3f} {repeat_time * 1000 / documents:>14.3f}")
+    stats = reshape_cache_stats()
+    print(f"cache: {stats['size']}/{stats['max_size']} strings, {stats['hits']} hits, {stats['misses']} misses, hit rate {stats['hit_rate']:.1%}")
+
+# --- Bulk Contracts ---
+def bench_bulk(contracts, workers_options):
+    """Wall time of a bulk employment-contract spreadsheet rendered in-process vs. by worker processes."""
+    from bulk_contracts import build_contracts_zip
+    df = pd.DataFrame([{
+        "party1": "شركة الأمل للتجارة", "party2": f"موظف رقم {i}", "date": "2025-07-01", "job_title": "محاسب",
+        "salary": str(4000 + i % 10 * 500), "duration": "12", "termination_clause": "نعم",
+    } for i in range(contracts)])
+    print(f"{'workers':>8} {'seconds':>9} {'ms/contract':>12} {'zip MB':>8}")
+    for workers in workers_options:
+        started = time.perf_counter()
+        zip_bytes, report = build_contracts_zip(df, "عقد عمل", workers=workers)
+        elapsed = time.perf_counter() - started
+        assert report["تم الإنشاء"].all()
+        print(f"{workers:>8} {elapsed:>9.2f} {elapsed * 1000 / contracts:>12.1f} {len(zip_bytes) / 2**20:>8.1f}")
+
+# --- Signature and Stamp Images ---
+def bench_images(contracts, stamp_px=1200):
+    """Per-contract cost of placing a signature and a stamp: temp files (old) vs. in memory vs. in memory with the stamp cache."""
+    import io
+    import numpy as np
+    from fpdf import FPDF
+    from PIL import Image, ImageDraw
+    from pdf_utils import _fit_on_white, StampCache
+    signature = np.zeros((150, 600, 4), dtype=np.uint8)
+    signature[60:80, 50:550] = (0, 0, 0, 255)
+    stamp = Image.new("RGBA", (stamp_px, stamp_px), (0, 0, 0, 0))
+    ImageDraw.Draw(stamp).ellipse((50, 50, stamp_px - 50, stamp_px - 50), outline=(0, 0, 200, 255), width=40)
+    buffer = io.BytesIO()
+    stamp.save(buffer, "PNG")
+    stamp_bytes = buffer.getvalue()
+
+    def fit_via_file(path, max_w, max_h):
+        img = Image.open(path).convert("RGBA") # The old path: write, reopen, resize, save, pass the path
+        ratio = min(max_w / img.width, max_h / img.height)
+        img = img.resize((int(img.width * ratio), int(img.height * ratio)), Image.LANCZOS)
+        bg = Image.new("RGBA", img.size, (255, 255, 255, 255))
+        bg.paste(img, (0, 0), img)
+        bg.convert("RGB").save(path, "PNG")
+        return img.size
+
+    def temp_files(pdf):
+        with tempfile.TemporaryDirectory() as tmp:
+            sig_path, stamp_path = os.path.join(tmp, "sig.png"), os.path.join(tmp, "stamp.png")
+            Image.fromarray(signature).save(sig_path, "PNG")
+            w, h = fit_via_file(sig_path, 70, 50)
+            pdf.image(sig_path, x=pdf.w - 80, y=pdf.h - 70, w=w, h=h)
+            with open(stamp_path, "wb") as f:
+                f.write(stamp_bytes)
+            w, h = fit_via_file(stamp_path, 50, 50)
+            pdf.image(stamp_path, x=20, y=pdf.h - 70, w=w, h=h)
+
+    def in_memory(cache):
+        def place(pdf):
+            sig = _fit_on_white(Image.fromarray(signature), 70, 50)
+            pdf.image(sig, x=pdf.w - 80, y=pdf.h - 70, w=sig.width, h=sig.height)
+            stamp_img = cache.get(stamp_bytes) if cache else _fit_on_white(Image.open(io.BytesIO(stamp_bytes)), 50, 50)
+            pdf.image(stamp_img, x=20, y=pdf.h - 70, w=stamp_img.width, h=stamp_img.height)
+        return place
+
+    print(f"{'strategy':<22} {'ms/contract':>12}")
+    for name, place in (("temp files", temp_files), ("in memory", in_memory(None)), ("in memory + cache", in_memory(StampCache()))):
+        def run():
+            for _ in range(contracts):
+                pdf = FPDF()
+                pdf.add_page()
+                place(pdf)
+                pdf.output()
+        elapsed, _ = _timed(run, 1)
+        print(f"{name:<22} {elapsed * 1000 / contracts:>12.2f}")
+
+# --- Contract Templates ---
+def bench_templates(documents, repeat=3):
+    """Clause rendering per contract (no PDF, no Streamlit): definition parsed and compiled per document vs. compiled once."""
+    from config import CONTRACT_TEMPLATES_FILE
+    from contract_templates import compile_templates
+    with open(CONTRACT_TEMPLATES_FILE, encoding="utf-8") as f:
+        source = f.read()
+    data = {
+        "date": date(2025, 1, 1), "party1": "شركة الأمل للتجارة", "party2": "محمد أحمد", "start_date": date(2025, 2, 1),
+        "cr_number": "1010", "job_title": "محاسب", "salary": 5000.0, "duration": 12, "housing_allowance": True,
+        "housing_percentage": 25, "non_compete": True, "non_compete_city": "جدة", "termination_clause": True,
+    }
+
+    def per_document():
+        return [compile_templates(json.loads(source))["عقد عمل"].render(data) for _ in range(documents)]
+
+    template = compile_templates(json.loads(source))["عقد عمل"]
+    def compiled():
+        return [template.render(data) for _ in range(documents)]
+
+    print(f"{'strategy':<20} {'us/contract':>12}")
+    for name, func in (("compile per document", per_document), ("compiled once", compiled)):
+        elapsed, lines = _timed(func, repeat)
+        assert lines[0] == template.render(data)
+        print(f"{name:<20} {elapsed * 1e6 / documents:>12.1f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mojaz performance benchmarks")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    snapshot_parser = subparsers.add_parser("snapshot", help="Compare snapshot formats (size, cold-start load time)")
+    snapshot_parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    snapshot_parser.add_argument("--repeat", type=int, default=3)
+    dtypes_parser = subparsers.add_parser("dtypes", help="Compare memory and filter/groupby speed of column dtypes")
+    dtypes_parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    dtypes_parser.add_argument("--repeat", type=int, default=5)
+    stream_parser = subparsers.add_parser("stream", help="Compare peak memory of whole-file and streaming JSON loads")
+    stream_parser.add_argument("--rows", type=int, nargs="+", default=[100_000, 500_000])
+    stream_parser.add_argument("--memory-limit", type=int, default=64, help="Streaming buffer limit in MB")
+    sessions_parser = subparsers.add_parser("sessions", help="Compare per-session memory of copied vs. shared tables")
+    sessions_parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000])
+    sessions_parser.add_argument("--sessions", type=int, default=50)
+    search_parser = subparsers.add_parser("search", help="Compare client search by column scan and by the search index")
+    search_parser.add_argument("--rows", type=int, nargs="+", default=[100_000, 500_000])
+    search_parser.add_argument("--repeat", type=int, default=20)
+    global_parser = subparsers.add_parser("global-search", help="Time ranked search across all tables and case activities")
+    global_parser.add_argument("--rows", type=int, nargs="+", default=[100_000])
+    global_parser.add_argument("--repeat", type=int, default=20)
+    reminders_parser = subparsers.add_parser("reminders", help="Compare per-row and vectorized reminder entity/status resolution")
+    reminders_parser.add_argument("--reminders", type=int, nargs="+", default=[50_000])
+    reminders_parser.add_argument("--repeat", type=int, default=5)
+    pdf_parser = subparsers.add_parser("pdf", help="Compare per-contract PDF generation with and without the font registry")
+    pdf_parser.add_argument("--contracts", type=int, default=50)
+    pdf_parser.add_argument("--repeat", type=int, default=3)
+    reshape_parser = subparsers.add_parser("reshape", help="Compare uncached, cached and batched Arabic shaping of contract lines")
+    reshape_parser.add_argument("--documents", type=int, default=1000)
+    reshape_parser.add_argument("--repeat", type=int, default=3)
+    bulk_parser = subparsers.add_parser("bulk", help="Time bulk contract generation with different worker counts")
+    bulk_parser.add_argument("--contracts", type=int, default=300)
+    bulk_parser.add_argument("--workers", type=int, nargs="+", default=[1, os.cpu_count() or 1])
+    images_parser = subparsers.add_parser("images", help="Compare signature/stamp placement via temp files, in memory and with the stamp cache")
+    images_parser.add_argument("--contracts", type=int, default=50)
+    images_parser.add_argument("--stamp-px", type=int, default=1200, help="Side of the uploaded stamp image in pixels")
+    templates_parser = subparsers.add_parser("templates", help="Time contract clause rendering from the compiled templates")
+    templates_parser.add_argument("--documents", type=int, default=10_000)
+    templates_parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.command == "snapshot":
+        bench_snapshot(args.rows, args.repeat)
+    elif args.command == "dtypes":
+        bench_dtypes(args.rows, args.repeat)
+    elif args.command == "stream":
+        bench_stream(args.rows, args.memory_limit)
+    elif args.command == "sessions":
+        bench_sessions(args.rows, args.sessions)
+    elif args.command == "search":
+        bench_search(args.rows, args.repeat)
+    elif args.command == "global-search":
+        bench_global_search(args.rows, args.repeat)
+    elif args.command == "reminders":
+        bench_reminders(args.reminders, args.repeat)
+    elif args.command == "pdf":
+        bench_pdf(args.contracts, args.repeat)
+    elif args.command == "reshape":
+        bench_reshape(args.documents, args.repeat)
+    elif args.command == "bulk":
+        bench_bulk(args.contracts, args.workers)
+    elif args.command == "images":
+        bench_images(args.contracts, args.stamp_px)
+    elif args.command == "templates":
+        bench_templates(args.documents, args.repeat)
@@ -0,0 +1,158 @@
+# bulk_contracts.py
+
+import io
+import os
+import re
+import zipfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date
+import pandas as pd
+
+from config import BULK_CONTRACT_WORKERS, BULK_CONTRACT_CHUNK_SIZE, BULK_CONTRACT_PARALLEL_MIN_ROWS
+from contract_templates import get_template
+from pdf_utils import generate_contract_pdf, warm_up_fonts
+
+# --- Spreadsheet Columns ---
+# One row per contract. Columns are the field names of the contract type's template
+# (see contract_templates.json); the required ones (the parties) must be filled in,
+# the rest are optional. An optional "contract_type" column (Arabic name or English
+# key of a template) overrides the type chosen in the UI for that row.
+# Values by field kind: "bool" takes 1/0, true/false, yes/no or نعم/لا, and "date" any
+# format pandas parses (e.g. 2025-07-23; empty = the contract date).
+_TRUE_VALUES = {"1", "true", "yes", "y", "x", "نعم"}
+_FALSE_VALUES = {"", "0", "false", "no", "n", "لا"}
+
+def template_csv(contract_type):
+    """CSV (UTF-8 with BOM, for Excel) holding the header row of a contract type's spreadsheet."""
+    columns = [field["name"] for field in get_template(contract_type).fields]
+    return pd.DataFrame(columns=columns).to_csv(index=False).encode("utf-8-sig")
+
+def read_contract_rows(uploaded_file):
+    """Reads an uploaded .csv/.xlsx file into a DataFrame of strings ("" for empty cells)."""
+    name = getattr(uploaded_file, "name", "").lower()
+    if name.endswith((".xlsx", ".xls")):
+        df = pd.read_excel(uploaded_file, dtype=str)
+    else:
+        df = pd.read_csv(uploaded_file, dtype=str, keep_default_na=False, encoding="utf-8-sig")
+    df.columns = [str(col).strip() for col in df.columns]
+    return df.fillna("")
+
+def _parse(kind, value, field):
+    value = str(value).strip()
+    try:
+        if kind == "text":
+            return value
+        if kind == "bool":
+            lowered = value.lower()
+            if lowered in _TRUE_VALUES or lowered in _FALSE_VALUES:
+                return lowered in _TRUE_VALUES
+            raise ValueError
+        if not value:
+            return None
+        if kind == "float":
+            return float(value.replace(",", ""))
+        if kind == "int":
+            return int(float(value.replace(",", "")))
+        return pd.to_datetime(value).date() # "date"
+    except (ValueError, TypeError, OverflowError):
+        raise ValueError(f"قيمة غير صالحة في العمود {field}: {value}")
+
+def row_contract(row, default_type):
+    """(contract type, data dict for generate_contract_pdf) of one spreadsheet row. Raises ValueError if it is invalid."""
+    template = get_template(str(row.get("contract_type", "")).strip() or default_type)
+    data = {}
+    for field in template.fields:
+        value = _parse(field["kind"], row.get(field["name"], ""), field["name"])
+        if value is not None:
+            data[field["name"]] = value
+    missing = template.missing(data)
+    if missing:
+        raise ValueError(f"حقول مطلوبة فارغة: {'، '.join(missing)}")
+    data.setdefault("date", date.today())
+    for field in template.contract_fields:
+        if field["kind"] == "date":
+            data.setdefault(field["name"], data["date"]) # As in the form, where dates are never empty
+    return template.name, data
+
+# --- Rendering ---
+# Contracts are independent, so large files are spread over a pool of worker processes
+# in chunks of BULK_CONTRACT_CHUNK_SIZE rows (one task per chunk keeps pickling overhead
+# low). Workers are spawned rather than forked, since forking the multi-threaded server
+# process can copy locks held by other threads; each worker parses the fonts once at
+# start. Small files are rendered in the server process, where starting workers would
+# cost more than it saves.
+def _render_chunk(chunk):
+    """[(row number, PDF bytes or None, error message or "")] for [(row number, contract type, data)]."""
+    results = []
+    for row_number, contract_type, data in chunk:
+        try:
+            pdf_bytes = generate_contract_pdf(contract_type, data)
+            results.append((row_number, pdf_bytes, "") if pdf_bytes else (row_number, None, "تعذر تحميل خط العقد"))
+        except Exception as e:
+            results.append((row_number, None, str(e)))
+    return results
+
+def render_contracts(contracts, workers=BULK_CONTRACT_WORKERS, progress=None):
+    """
+    Renders [(row number, contract type, data)] to {row number: (PDF bytes or None, error)}
+    using up to workers processes (None = one per CPU core). progress(done, total) is
+    called as contracts finish.
+    """
+    results, total = {}, len(contracts)
+    workers = workers or os.cpu_count() or 1
+    chunks = [contracts[i:i + BULK_CONTRACT_CHUNK_SIZE] for i in range(0, total, BULK_CONTRACT_CHUNK_SIZE)]
+    if workers == 1 or total < BULK_CONTRACT_PARALLEL_MIN_ROWS:
+        for chunk in chunks:
+            results.update((row_number, (pdf_bytes, error)) for row_number, pdf_bytes, error in _render_chunk(chunk))
+            if progress:
+                progress(len(results), total)
+        return results
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=warm_up_fonts) as pool:
+        for future in as_completed([pool.submit(_render_chunk, chunk) for chunk in chunks]):
+            results.update((row_number, (pdf_bytes, error)) for row_number, pdf_bytes, error in future.result())
+            if progress:
+                progress(len(results), total)
+    return results
+
+# --- ZIP Output ---
+def _file_name(row_number, contract_type, data):
+    name = f"{row_number:04d}_{contract_type}_{data['party2']}"
+    return re.sub(r'[\\/:*?"<>|\s]+', "_", name).strip("_") + ".pdf"
+
+def build_contracts_zip(df, default_type, workers=BULK_CONTRACT_WORKERS, progress=None):
+    """
+    Renders every row of a contracts spreadsheet. Returns (ZIP bytes, report DataFrame):
+    the ZIP holds one PDF per valid row plus the report as CSV, and the report has the
+    outcome of every row (file name, or why the row failed). Row numbers match the
+    spreadsheet (the header is row 1).
+    """
+    report, contracts = [], []
+    for position, row in enumerate(df.to_dict("records")):
+        row_number = position + 2
+        try:
+            contract_type, data = row_contract(row, default_type)
+            contracts.append((row_number, contract_type, data))
+        except ValueError as e:
+            report.append({"row": row_number, "type": str(row.get("contract_type", "")) or default_type,
+                           "party1": row.get("party1", ""), "party2": row.get("party2", ""), "ok": False, "detail": str(e)})
+    rendered = render_contracts(contracts, workers, progress)
+
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for row_number, contract_type, data in contracts:
+            pdf_bytes, error = rendered[row_number]
+            entry = {"row": row_number, "type": contract_type, "party1": data["party1"], "party2": data["party2"], "ok": pdf_bytes is not None}
+            if pdf_bytes is not None:
+                entry["detail"] = _file_name(row_number, contract_type, data)
+                archive.writestr(entry["detail"], pdf_bytes) # Stored: the PDF streams are already compressed
+            else:
+                entry["detail"] = error
+            report.append(entry)
+        report_df = pd.DataFrame(sorted(report, key=lambda entry: entry["row"]), columns=["row", "type", "party1", "party2", "ok", "detail"])
+        report_df = report_df.rename(columns={
+            "row": "الصف", "type": "نوع العقد", "party1": "الطرف الأول", "party2": "الطرف الثاني", "ok": "تم الإنشاء", "detail": "الملف / سبب الخطأ",
+        })
+        archive.writestr("report.csv", report_df.to_csv(index=False).encode("utf-8-sig"), compress_type=zipfile.ZIP_DEFLATED)
+    return buffer.getvalue(), report_df
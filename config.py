@@ -9,6 +9,8 @@ DATA_FILE = "mojaz_data.json" # File to store application data
 AMIRI_FONT_NAME = "Amiri"
 # Assumes Amiri-Regular.ttf is in the same directory as main_app.py or the project root
 AMIRI_FONT_PATH = os.path.join(os.path.dirname(__file__), "Amiri-Regular.ttf")
+RESHAPE_CACHE_SIZE = 4096 # Distinct strings kept shaped by pdf_utils.reshape_arabic
+STAMP_CACHE_SIZE = 32 # Distinct company stamps kept decoded and resized by pdf_utils
 
 # --- Authentication Configuration ---
 # In a real application, store these securely (e.g., environment variables, database)
@@ -17,14 +19,9 @@ USERS = {
     "lawyer": "lawyerpass" # Example: Username "lawyer", Password "lawyerpass"
 }
 
-# --- Contract Type Options (for consistency) ---
-CONTRACT_TYPE_OPTIONS = {
-    "عقد عمل": "employment_contract",
-    "عقد إيجار": "lease_agreement",
-    "عقد وكالة": "agency_contract",
-    "عقد بيع": "sales_contract",
-    "عقد عدم إفشاء (NDA)": "nda_contract"
-}
+# --- Contract Templates ---
+# Contract types, their form fields and clauses (see contract_templates.py)
+CONTRACT_TEMPLATES_FILE = os.path.join(os.path.dirname(__file__), "contract_templates.json")
 
 # --- Case Type Options ---
 CASE_TYPE_OPTIONS = ["مدني", "جنائي", "تجاري", "إداري", "أحوال شخصية", "عقاري", "عمالي", "أخرى"]
@@ -46,3 +43,91 @@ CLIENT_TYPE_OPTIONS = ["فرد", "شركة", "مؤسسة"]
 
 # --- Time Entry Categories ---
 TIME_ENTRY_CATEGORIES = ["بحث قانوني", "استشارة", "إعداد مستندات", "مرافعة", "اجتماع", "مراسلات", "أخرى"]
+
+# --- Write-Ahead Journal ---
+# When enabled, each mutation is appended to JOURNAL_FILE instead of rewriting DATA_FILE.
+# The journal is folded back into DATA_FILE in the background once it grows past the threshold.
+JOURNAL_ENABLED = True
+JOURNAL_FILE = "mojaz_data.journal"
+JOURNAL_COMPACT_THRESHOLD = 500 # Number of journal records that triggers a compaction
+
+# --- Streaming Loads ---
+# DATA_FILE files larger than STREAM_LOAD_THRESHOLD_MB are parsed row by row into typed
+# column chunks instead of with json.load, keeping the parse buffers under STREAM_MEMORY_LIMIT_MB.
+STREAM_LOAD_THRESHOLD_MB = 50
+STREAM_MEMORY_LIMIT_MB = 64
+
+# --- Snapshots ---
+# Every SNAPSHOT_INTERVAL_SECONDS the changed rows since the previous snapshot are saved,
+# compressed, to SNAPSHOT_DIR; every SNAPSHOT_FULL_EVERY increments a full snapshot starts
+# a new chain. Restore with: python snapshots.py restore --at "YYYY-MM-DD HH:MM"
+SNAPSHOT_DIR = "mojaz_snapshots"
+SNAPSHOT_INTERVAL_SECONDS = 15 * 60
+SNAPSHOT_FULL_EVERY = 96 # About once a day at the default interval
+SNAPSHOT_RETENTION_DAYS = 30
+
+# --- Archiving ---
+# Rows matching a rule are moved out of the working set into cold files in ARCHIVE_DIR
+# (one per table). load_data() never reads them; they stay searchable and restorable
+# from the archive view. "match": column values the row must have; "date_column" and
+# "older_than_days": how old the row must be.
+ARCHIVE_DIR = "mojaz_archive"
+ARCHIVE_RULES = {
+    "cases": {"match": {"status": "مغلقة"}, "date_column": "court_date", "older_than_days": 365},
+    "invoices": {"match": {"paid": True}, "date_column": "due_date", "older_than_days": 365},
+    "reminders": {"match": {"is_completed": True}, "date_column": "date", "older_than_days": 180},
+    "time_entries": {"match": {}, "date_column": "date", "older_than_days": 730},
+}
+
+# --- Case Activity Store ---
+# Case activity entries are appended to their own log, indexed by case and timestamp in memory.
+ACTIVITY_FILE = "mojaz_activity.log"
+ACTIVITY_PAGE_SIZE = 20 # Entries shown per page in the case activity view
+
+# --- List Views ---
+# The CRM lists are paged: only the rows of the current page are prepared and sent to the browser.
+LIST_PAGE_SIZE_OPTIONS = [25, 50, 100, 200] # The first one is the default
+
+# --- Global Search ---
+# The CRM search box looks up clients, cases, invoices, reminders, time entries and case
+# activities through the in-memory text indexes (see search_index.py).
+GLOBAL_SEARCH_LIMIT = 30 # Ranked results shown
+
+# --- Bulk Contracts ---
+# Contracts generated from an uploaded spreadsheet (see bulk_contracts.py).
+BULK_CONTRACT_WORKERS = None # Worker processes; None = one per CPU core
+BULK_CONTRACT_CHUNK_SIZE = 10 # Contracts per worker task
+BULK_CONTRACT_PARALLEL_MIN_ROWS = 50 # Smaller files are rendered without starting workers (~1 s each to start)
+
+# --- Background Writer ---
+# Saves are queued and written by a background thread; bursts of saves are coalesced into one write.
+WRITER_DEBOUNCE_SECONDS = 0.3 # Quiet period after the last save before writing
+WRITER_MAX_DELAY_SECONDS = 2.0 # Upper bound on how long a queued save may wait
+WRITER_RETRY_SECONDS = 5.0 # Delay before retrying a failed write
+WRITER_MAX_ATTEMPTS = 5 # Failed writes of a batch before it is moved to WRITER_FAILED_FILE
+WRITER_FAILED_FILE = "mojaz_failed_saves.jsonl" # Change records that could not be written, one JSON object per line
+WRITER_SHUTDOWN_TIMEOUT_SECONDS = 30.0 # How long the shutdown flush may block
+
+# --- Concurrent Writes ---
+# Writers in every process serialize on LOCK_FILE; saves that change a field another
+# session changed after it was displayed are rejected instead of overwriting it.
+LOCK_FILE = "mojaz_data.lock"
+LOCK_TIMEOUT_SECONDS = 10.0
+
+# --- ID Sequences ---
+# New record IDs come from per-table counters in SEQUENCE_FILE, so deleted IDs are never
+# handed out again. Each process reserves SEQUENCE_BLOCK_SIZE IDs at a time and allocates
+# from memory; IDs of a block left unused when the server stops are skipped.
+SEQUENCE_FILE = "mojaz_sequences.json"
+SEQUENCE_BLOCK_SIZE = 20
+
+# --- Storage Backend ---
+# "json": DATA_FILE snapshot plus the journal above. "sqlite": one table per entity in SQLITE_FILE.
+# "partitioned": one JSON file per table in PARTITION_DIR, rewritten only when that table changes.
+# "columnar": one typed Arrow IPC file per table in COLUMNAR_DIR for fast cold starts (needs pyarrow).
+# Migrate existing data with: python storage_backends.py migrate --to sqlite|partitioned|columnar
+STORAGE_BACKEND = "json"
+SQLITE_FILE = "mojaz_data.db"
+PARTITION_DIR = "mojaz_data" # One <table>.json file per table for the "partitioned" backend
+COLUMNAR_DIR = "mojaz_columnar" # One <table>.arrow file per table for the "columnar" backend
+COLUMNAR_COMPRESSION = "lz4" # "lz4", "zstd" or "uncompressed"
@@ -0,0 +1,197 @@
+# contract_templates.py
+
+import json
+import os
+import string
+import threading
+from datetime import datetime, date
+
+from config import CONTRACT_TEMPLATES_FILE
+
+# --- Template Definitions ---
+# Contract types are declared in CONTRACT_TEMPLATES_FILE (JSON), not in code; adding a
+# type or clause only means editing that file. It holds:
+#   "common_fields"  fields of every contract (the parties and the date)
+#   "preamble"       clauses opening every contract
+#   "contracts"      one entry per type: "name" (Arabic, shown in the UI and as the PDF
+#                    title), "key" (English ID), "title" (form section heading),
+#                    "fields" and "clauses"
+# Field keys: "name", "kind" (see FIELD_KINDS), optional "required", "default" ("today"
+# for dates) and "labels" ([false text, true text] for bool fields used in clause text).
+# The form uses "label", "help", "column" (1/2: side-by-side columns), "multiline",
+# "widget" ("slider"), "min", "max", "step", "value" and "show_if" (a bool field that
+# must be checked for the input to be shown); these don't affect the contract text.
+# Clause keys: "text" (str.format placeholders naming fields) and "when" (fields that
+# must be set for the clause to appear: non-empty, checked, or a positive number). A
+# clause with "parts" joins the parts whose "when" holds with "separator" into its
+# {parts} placeholder, and is left out if none does.
+FIELD_KINDS = ("text", "float", "int", "date", "bool")
+
+def _format_date(value):
+    return value.strftime("%Y-%m-%d") if isinstance(value, (datetime, date)) else str(value)
+
+_FORMATTERS = {
+    "text": str,
+    "float": lambda value: f"{value:.2f}",
+    "int": str,
+    "date": _format_date,
+}
+
+def _is_set(value):
+    """True for values a clause condition accepts: non-empty, checked, or a positive number."""
+    if isinstance(value, bool) or value is None or isinstance(value, str):
+        return bool(value)
+    if isinstance(value, (int, float)):
+        return value > 0
+    return True
+
+def _placeholders(text):
+    return {name for _, name, _, _ in string.Formatter().parse(text) if name}
+
+# --- Compiled Templates ---
+# A definition is validated and compiled once: placeholders are checked against the
+# fields, and each field gets its formatter and default. Rendering a document is then
+# one pass over the clauses with str.format_map, without re-reading the definition.
+class ContractTemplate:
+    """
+    One compiled contract type. fields lists the common fields then the type's own
+    (common_fields / contract_fields); render(data) returns the contract's text lines.
+    """
+
+    def __init__(self, spec, common_fields=(), preamble=()):
+        self.name, self.key = spec["name"], spec["key"]
+        self.title = spec.get("title", spec["name"])
+        self.common_fields, self.contract_fields = list(common_fields), list(spec.get("fields", []))
+        self.fields = self.common_fields + self.contract_fields
+        kinds = {}
+        for field in self.fields:
+            if field["name"] in kinds:
+                self._fail(f"duplicate field {field['name']}")
+            if field.get("kind") not in FIELD_KINDS:
+                self._fail(f"field {field['name']} has unknown kind {field.get('kind')!r}")
+            kinds[field["name"]] = field["kind"]
+        for field in self.fields:
+            if field.get("show_if") and kinds.get(field["show_if"]) != "bool":
+                self._fail(f"field {field['name']} depends on {field['show_if']}, which is not a bool field")
+        self.field_kinds = kinds
+        self.required = [field["name"] for field in self.fields if field.get("required")]
+
+        # Per field: formatter and default; fields that always have a value may appear in any clause
+        self._formatters, self._defaults, always = {}, {}, set(self.required)
+        for field in self.fields:
+            name, kind = field["name"], field["kind"]
+            if kind == "bool":
+                labels = field.get("labels", ["لا", "نعم"])
+                self._formatters[name] = lambda value, labels=labels: labels[bool(value)]
+                self._defaults[name] = False
+                always.add(name)
+            else:
+                self._formatters[name] = _FORMATTERS[kind]
+                if field.get("default") == "today":
+                    self._defaults[name] = "today"
+                    always.add(name)
+        self._clauses = [self._compile(clause, always) for clause in list(preamble) + list(spec.get("clauses", []))]
+
+    def _fail(self, message):
+        raise ValueError(f"Contract template {self.name!r}: {message}")
+
+    def _compile(self, clause, always):
+        """(when, text, [(when, text)] of the parts or None, separator) of one clause definition."""
+        when = tuple(clause.get("when", ()))
+        parts = [self._compile(part, always)[:2] for part in clause["parts"]] if "parts" in clause else None
+        for name in when:
+            if name not in self.field_kinds:
+                self._fail(f"clause condition uses unknown field {name}")
+        for name in _placeholders(clause["text"]):
+            if parts is not None and name == "parts":
+                continue
+            if name not in self.field_kinds:
+                self._fail(f"clause {clause['text']!r} uses unknown field {name}")
+            if name not in when and name not in always:
+                self._fail(f"clause {clause['text']!r} uses {name} without a condition on it")
+        return when, clause["text"], parts, clause.get("separator", ", ")
+
+    def values(self, data):
+        """The field values of data with defaults applied."""
+        values = {}
+        for name in self.field_kinds:
+            value = data.get(name)
+            if value is None or value == "":
+                default = self._defaults.get(name)
+                value = date.today() if default == "today" else (default if default is not None else value)
+            values[name] = value
+        return values
+
+    def missing(self, data):
+        """Labels of the required fields that are empty in data."""
+        return [field.get("label", field["name"]) for field in self.fields if field.get("required") and not _is_set(data.get(field["name"]))]
+
+    def render(self, data):
+        """The text lines of a contract for data ({field name: value})."""
+        values = self.values(data)
+        present = {name for name, value in values.items() if _is_set(value)}
+        text = {name: self._formatters[name](value) for name, value in values.items() if value is not None}
+        lines = []
+        for when, template, parts, separator in self._clauses:
+            if not present.issuperset(when):
+                continue
+            if parts is None:
+                lines.append(template.format_map(text))
+                continue
+            rendered = [part.format_map(text) for part_when, part in parts if present.issuperset(part_when)]
+            if rendered:
+                lines.append(template.format_map({**text, "parts": separator.join(rendered)}))
+        return lines
+
+def compile_templates(definition):
+    """{type name: ContractTemplate} of a parsed definition file, in file order. Raises ValueError if it is invalid."""
+    common_fields, preamble = definition.get("common_fields", []), definition.get("preamble", [])
+    templates = {}
+    for spec in definition["contracts"]:
+        template = ContractTemplate(spec, common_fields, preamble)
+        if template.name in templates or any(other.key == template.key for other in templates.values()):
+            template._fail("duplicate contract name or key")
+        templates[template.name] = template
+    return templates
+
+
+# --- Module-level Registry ---
+# One compiled set per process, recompiled only when the definition file changes (so
+# edited templates are picked up without a restart).
+class TemplateRegistry:
+    """The compiled templates of a definition file."""
+
+    def __init__(self, path=CONTRACT_TEMPLATES_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._signature, self._templates = None, {}
+
+    def templates(self):
+        stat_result = os.stat(self.path)
+        signature = (stat_result.st_mtime_ns, stat_result.st_size)
+        with self._lock:
+            if signature != self._signature:
+                with open(self.path, encoding="utf-8") as f:
+                    self._templates = compile_templates(json.load(f))
+                self._signature = signature
+            return self._templates
+
+_registry = TemplateRegistry()
+
+def contract_templates():
+    """{type name: ContractTemplate} of every contract type, in definition order."""
+    return _registry.templates()
+
+def contract_type_options():
+    """{type name: English key} of every contract type."""
+    return {name: template.key for name, template in contract_templates().items()}
+
+def get_template(contract_type):
+    """The template of a contract type, by Arabic name or English key. Raises ValueError for unknown types."""
+    templates = contract_templates()
+    if contract_type in templates:
+        return templates[contract_type]
+    for template in templates.values():
+        if template.key == contract_type:
+            return template
+    raise ValueError(f"نوع عقد غير معروف: {contract_type}")
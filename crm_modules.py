@@ -2,16 +2,105 @@
 
 import streamlit as st
 import pandas as pd
+import numpy as np
+import time
 from datetime import datetime, timedelta
-import json # Import json for serializing/deserializing activity log
 
 # Import necessary functions/constants from other modules
 from config import (
     CASE_TYPE_OPTIONS, CASE_STATUS_OPTIONS, CASE_PRIORITY_OPTIONS,
     REMINDER_RELATED_TYPES, PAYMENT_STATUS_OPTIONS, CLIENT_TYPE_OPTIONS,
-    TIME_ENTRY_CATEGORIES
+    TIME_ENTRY_CATEGORIES, ACTIVITY_PAGE_SIZE, LIST_PAGE_SIZE_OPTIONS
 )
-from pdf_utils import reshape_arabic # Assuming reshape_arabic is needed here too
+from pdf_utils import reshape_arabic, reshape_arabic_batch # Assuming reshape_arabic is needed here too
+from data_persistence import make_change, form_base, is_referenced, archive_old_records, restore_archived, search_records, search_all, lookup, cached_view # Change records passed to save_data_func
+from schema import TABLE_KEYS, with_display_dates
+from archive import search_archive
+from search_index import normalize_arabic
+from activity_store import add_activity, count_activities, get_activities
+
+# --- Paged List Views ---
+def paged_rows(df, sort_columns, key):
+    """
+    Renders the sort and paging controls of a list view and returns the rows of the
+    current page of df, sorted by the chosen column. sort_columns maps the sortable
+    columns to their Arabic labels (the first is the default). Only the page's rows are
+    copied, so merging, renaming and display formatting can be done on them alone.
+    """
+    controls = st.columns(4)
+    with controls[0]:
+        sort_col = st.selectbox("ترتيب حسب", list(sort_columns), format_func=sort_columns.get, key=f"{key}_sort_select")
+    with controls[1]:
+        descending = st.checkbox("ترتيب تنازلي", key=f"{key}_sort_descending_check")
+    with controls[2]:
+        page_size = st.selectbox("عدد الصفوف في الصفحة", LIST_PAGE_SIZE_OPTIONS, key=f"{key}_page_size_select")
+    page_count = max(1, (len(df) + page_size - 1) // page_size)
+    page_key = f"{key}_page_input"
+    if st.session_state.get(page_key, 1) > page_count:
+        st.session_state[page_key] = page_count # The list got shorter (filter, deletion, larger pages)
+    with controls[3]:
+        page = st.number_input(f"الصفحة (من {page_count})", min_value=1, max_value=page_count, step=1, key=page_key)
+
+    start = (page - 1) * page_size
+    column = df[sort_col].reset_index(drop=True)
+    if not descending and column.is_monotonic_increasing:
+        rows = df.iloc[start:start + page_size] # Already in order (e.g. by ID), nothing to sort
+    else:
+        # Positions of the rows in sort order; only the sort column is sorted, not the whole frame
+        order = column.sort_values(ascending=not descending, kind="stable", na_position="last").index
+        rows = df.iloc[order[start:start + page_size]]
+    if len(df):
+        st.caption(f"عرض {start + 1}–{start + len(rows)} من {len(df)}")
+    return rows
+
+# --- Display Frames ---
+# The list views render from prepared frames (joined names, Arabic labels, plain dates)
+# built by data_persistence.cached_view, so they are only rebuilt when one of the tables
+# they use changes, not on every rerun. They are shared between sessions: never modify them.
+def _clients_view(frames):
+    return frames["clients"].rename(columns={
+        "name": "الاسم", "phone": "الهاتف", "email": "البريد الإلكتروني", "notes": "ملاحظات",
+        "type": "النوع", "address": "العنوان", "company_name": "اسم الشركة", "secondary_contact": "جهة اتصال ثانوية"
+    })
+
+def _cases_view(frames):
+    df = with_display_dates("cases", frames["cases"]) # Copy with plain dates for display
+    df["name"] = df["client_id"].map(lookup("clients", "name"))
+    return df.rename(columns={
+        "name": "العميل", "case_name": "اسم القضية", "case_type": "نوع القضية",
+        "status": "الحالة", "court_date": "تاريخ الجلسة", "opposing_party": "الطرف الخصم",
+        "case_description": "وصف القضية", "responsible_lawyer": "المحامي المسؤول", "notes": "ملاحظات",
+        "priority": "الأولوية"
+    })
+
+def _reminders_view(frames):
+    # Related client/case name and status (Upcoming, Overdue, Completed), from the typed dates
+    related, status = reminder_details(frames["reminders"], lookup("clients", "name"), lookup("cases", "case_name"))
+    df = with_display_dates("reminders", frames["reminders"])
+    df["الكيان المرتبط"] = related
+    df["الحالة"] = status
+    return df.rename(columns={
+        "description": "الوصف", "date": "التاريخ", "related_type": "نوع الربط", "is_completed": "اكتمل؟"
+    })
+
+def _invoices_view(frames):
+    df = with_display_dates("invoices", frames["invoices"])
+    df["name"] = df["client_id"].map(lookup("clients", "name"))
+    df["case_name"] = df["case_id"].map(lookup("cases", "case_name")) # NaN if not linked
+    df["الحالة"] = np.where(df["paid"], "مدفوعة", "غير مدفوعة")
+    return df.rename(columns={
+        "name": "العميل", "case_name": "القضية المرتبطة", "amount": "المبلغ",
+        "date": "تاريخ الفاتورة", "due_date": "تاريخ الاستحقاق"
+    })
+
+def _time_entries_view(frames):
+    df = with_display_dates("time_entries", frames["time_entries"])
+    df["name"] = df["client_id"].map(lookup("clients", "name"))
+    df["case_name"] = df["case_id"].map(lookup("cases", "case_name")) # NaN if not linked
+    return df.rename(columns={
+        "name": "العميل", "case_name": "القضية المرتبطة", "date": "التاريخ",
+        "hours": "الساعات", "category": "الفئة", "description": "الوصف"
+    })
 
 # --- Client Management Functions and UI ---
 def render_client_management(next_id_func, save_data_func, reshape_arabic_func):
@@ -37,46 +126,40 @@ def render_client_management(next_id_func, save_data_func, reshape_arabic_func):
             if submitted_client:
                 if new_client_name and new_client_phone:
                     cid = next_id_func(st.session_state.clients, "client_id")
-                    st.session_state.clients.loc[len(st.session_state.clients)] = [
-                        cid, new_client_name, new_client_phone, new_client_email, new_client_notes,
-                        new_client_type, new_client_address, new_client_company_name, new_client_secondary_contact
-                    ]
-                    save_data_func()
-                    st.success(f"✅ تم إضافة العميل: {reshape_arabic_func(new_client_name)} بنجاح!")
-                    st.rerun()
+                    if save_data_func([make_change("clients", "insert", cid, {
+                        "client_id": cid, "name": new_client_name, "phone": new_client_phone,
+                        "email": new_client_email, "notes": new_client_notes, "type": new_client_type,
+                        "address": new_client_address, "company_name": new_client_company_name,
+                        "secondary_contact": new_client_secondary_contact
+                    })]):
+                        st.success(f"✅ تم إضافة العميل: {reshape_arabic_func(new_client_name)} بنجاح!")
+                        st.rerun()
                 else:
                     st.warning("الرجاء إدخال اسم العميل ورقم الهاتف على الأقل.")
     
     st.markdown("---")
     st.markdown("### 📋 قائمة العملاء")
     if not st.session_state.clients.empty:
-        df_clients_display = st.session_state.clients.copy()
-        df_clients_display = df_clients_display.rename(columns={
-            "name": "الاسم", "phone": "الهاتف", "email": "البريد الإلكتروني", "notes": "ملاحظات",
-            "type": "النوع", "address": "العنوان", "company_name": "اسم الشركة", "secondary_contact": "جهة اتصال ثانوية"
-        })
-        
         search_client = st.text_input("ابحث عن عميل (بالاسم أو الهاتف أو البريد الإلكتروني أو العنوان)", "", key="crm_search_client_input")
-        filtered_clients = df_clients_display[
-            df_clients_display["الاسم"].astype(str).str.contains(search_client, case=False, na=False) |
-            df_clients_display["الهاتف"].astype(str).str.contains(search_client, case=False, na=False) |
-            df_clients_display["البريد الإلكتروني"].astype(str).str.contains(search_client, case=False, na=False) |
-            df_clients_display["العنوان"].astype(str).str.contains(search_client, case=False, na=False) |
-            df_clients_display["اسم الشركة"].astype(str).str.contains(search_client, case=False, na=False)
-        ]
-        
-        st.dataframe(filtered_clients.set_index("client_id"))
+        client_matches = search_records("clients", search_client) # None when the search box is empty
+        filtered_clients = cached_view("clients_list", ["clients"], _clients_view)
+        if client_matches is not None:
+            filtered_clients = filtered_clients[filtered_clients["client_id"].isin(client_matches)]
+
+        page_clients = paged_rows(filtered_clients, {"client_id": "الرقم", "الاسم": "الاسم", "النوع": "النوع", "اسم الشركة": "اسم الشركة"}, "crm_clients_list")
+        st.dataframe(page_clients.set_index("client_id"))
 
         st.markdown("### ✏️ تعديل / حذف عميل")
         if not filtered_clients.empty:
             client_to_edit_id = st.selectbox(
                 "اختر العميل للتعديل أو الحذف", 
                 filtered_clients["client_id"].tolist(), 
-                format_func=lambda x: f"{x} - {st.session_state.clients[st.session_state.clients['client_id'] == x]['name'].iloc[0]}",
+                format_func=lambda x, labels=lookup('clients', 'name'): f"{x} - {labels.get(x, '')}",
                 key="crm_select_client_to_edit"
             )
             
             current_client_data = st.session_state.clients[st.session_state.clients["client_id"] == client_to_edit_id].iloc[0]
+            client_base = form_base("clients", client_to_edit_id) # The row as first shown, to detect concurrent edits
 
             with st.form("edit_client_form"):
                 col_c_edit1, col_c_edit2 = st.columns(2)
@@ -98,23 +181,18 @@ def render_client_management(next_id_func, save_data_func, reshape_arabic_func):
                     delete_client_button = st.form_submit_button("🗑️ حذف العميل")
 
                 if update_client_button:
-                    st.session_state.clients.loc[st.session_state.clients["client_id"] == client_to_edit_id, 
-                        ["name", "phone", "email", "notes", "type", "address", "company_name", "secondary_contact"]] = \
-                        [edited_client_name, edited_client_phone, edited_client_email, edited_client_notes, 
-                         edited_client_type, edited_client_address, edited_client_company_name, edited_client_secondary_contact]
-                    save_data_func()
-                    st.success(f"✅ تم تحديث بيانات العميل: {reshape_arabic_func(edited_client_name)}.")
-                    st.rerun()
+                    if save_data_func([make_change("clients", "update", client_to_edit_id, {
+                        "name": edited_client_name, "phone": edited_client_phone, "email": edited_client_email,
+                        "notes": edited_client_notes, "type": edited_client_type, "address": edited_client_address,
+                        "company_name": edited_client_company_name, "secondary_contact": edited_client_secondary_contact
+                    }, base=client_base)]):
+                        st.success(f"✅ تم تحديث بيانات العميل: {reshape_arabic_func(edited_client_name)}.")
+                        st.rerun()
 
                 if delete_client_button:
-                    if any(st.session_state.cases["client_id"] == client_to_edit_id) or \
-                       any(st.session_state.invoices["client_id"] == client_to_edit_id) or \
-                       any((st.session_state.reminders["related_type"] == "عميل") & (st.session_state.reminders["related_id"] == client_to_edit_id)) or \
-                       any(st.session_state.time_entries["client_id"] == client_to_edit_id): # Check time entries too
-                        st.warning("⚠️ لا يمكن حذف هذا العميل لوجود قضايا، فواتير، تذكيرات أو سجلات وقت مرتبطة به. يرجى حذفها أولاً.")
-                    else:
-                        st.session_state.clients = st.session_state.clients[st.session_state.clients["client_id"] != client_to_edit_id]
-                        save_data_func()
+                    if is_referenced("clients", client_to_edit_id): # Active and archived cases, invoices, reminders and time entries
+                        st.warning("⚠️ لا يمكن حذف هذا العميل لوجود قضايا، فواتير، تذكيرات أو سجلات وقت مرتبطة به (بما فيها المؤرشفة). يرجى حذفها أولاً.")
+                    elif save_data_func([make_change("clients", "delete", client_to_edit_id, base=client_base)]):
                         st.success(f"🗑️ تم حذف العميل: {reshape_arabic_func(current_client_data['name'])}.")
                         st.rerun()
         else:
@@ -131,9 +209,8 @@ def render_case_management(next_id_func, save_data_func, reshape_arabic_func):
     else:
         with st.expander("➕ إضافة قضية جديدة", expanded=False):
             with st.form("add_case_form", clear_on_submit=True):
-                client_names = st.session_state.clients["name"].tolist()
-                selected_client_name = st.selectbox("اختر العميل المرتبط بالقضية", client_names, key="crm_case_client_select")
-                client_id_for_case = st.session_state.clients[st.session_state.clients["name"] == selected_client_name]["client_id"].iloc[0]
+                client_names = lookup("clients", "name")
+                client_id_for_case = st.selectbox("اختر العميل المرتبط بالقضية", list(client_names), format_func=client_names.get, key="crm_case_client_select")
 
                 col_case_add1, col_case_add2 = st.columns(2)
                 with col_case_add1:
@@ -153,56 +230,55 @@ def render_case_management(next_id_func, save_data_func, reshape_arabic_func):
                 if submitted_case:
                     if new_case_name:
                         cid = next_id_func(st.session_state.cases, "case_id")
-                        st.session_state.cases.loc[len(st.session_state.cases)] = [
-                            cid, client_id_for_case, new_case_name, new_case_type, new_case_status, 
-                            new_court_date, new_opposing_party, new_case_description, 
-                            new_responsible_lawyer, new_case_notes, new_case_priority, [] # Initialize empty activity log
-                        ]
-                        save_data_func()
-                        st.success(f"✅ تم إضافة القضية: {reshape_arabic_func(new_case_name)} بنجاح!")
-                        st.rerun()
+                        if save_data_func([make_change("cases", "insert", cid, {
+                            "case_id": cid, "client_id": client_id_for_case, "case_name": new_case_name,
+                            "case_type": new_case_type, "status": new_case_status, "court_date": new_court_date,
+                            "opposing_party": new_opposing_party, "case_description": new_case_description,
+                            "responsible_lawyer": new_responsible_lawyer, "notes": new_case_notes,
+                            "priority": new_case_priority
+                        })]):
+                            st.success(f"✅ تم إضافة القضية: {reshape_arabic_func(new_case_name)} بنجاح!")
+                            st.rerun()
                     else:
                         st.warning("الرجاء إدخال اسم القضية.")
         
         st.markdown("---")
         st.markdown("### 📋 قائمة القضايا")
         if not st.session_state.cases.empty:
-            df_cases_display = st.session_state.cases.copy()
-            df_cases_display = df_cases_display.merge(st.session_state.clients[["client_id", "name"]], on="client_id", how="left", suffixes=('_case', '_client'))
-            df_cases_display = df_cases_display.rename(columns={
-                "name": "العميل", "case_name": "اسم القضية", "case_type": "نوع القضية", 
-                "status": "الحالة", "court_date": "تاريخ الجلسة", "opposing_party": "الطرف الخصم",
-                "case_description": "وصف القضية", "responsible_lawyer": "المحامي المسؤول", "notes": "ملاحظات",
-                "priority": "الأولوية"
-            })
-            
             search_case = st.text_input("ابحث عن قضية (بالاسم أو العميل أو الحالة أو الطرف الخصم)", "", key="crm_search_case_input")
-            filtered_cases = df_cases_display[
-                df_cases_display["اسم القضية"].astype(str).str.contains(search_case, case=False, na=False) |
-                df_cases_display["العميل"].astype(str).str.contains(search_case, case=False, na=False) |
-                df_cases_display["الحالة"].astype(str).str.contains(search_case, case=False, na=False) |
-                df_cases_display["الطرف الخصم"].astype(str).str.contains(search_case, case=False, na=False)
-            ]
-            
-            st.dataframe(filtered_cases[["case_id", "اسم القضية", "العميل", "نوع القضية", "الحالة", "تاريخ الجلسة", "الطرف الخصم", "المحامي المسؤول", "الأولوية"]].set_index("case_id"))
+            case_matches = search_records("cases", search_case)
+            filtered_cases = cached_view("cases_list", ["cases", "clients"], _cases_view)
+            if case_matches is not None:
+                # Cases matching by name or opposing party, by their client, or by status
+                query = normalize_arabic(search_case)
+                matching_statuses = [status for status in CASE_STATUS_OPTIONS if query in normalize_arabic(status)]
+                filtered_cases = filtered_cases[
+                    filtered_cases["case_id"].isin(case_matches) |
+                    filtered_cases["client_id"].isin(search_records("clients", search_case)) |
+                    filtered_cases["الحالة"].isin(matching_statuses)
+                ]
+
+            page_cases = paged_rows(filtered_cases, {"case_id": "الرقم", "اسم القضية": "اسم القضية", "الحالة": "الحالة", "تاريخ الجلسة": "تاريخ الجلسة", "الأولوية": "الأولوية"}, "crm_cases_list")
+            st.dataframe(page_cases[["case_id", "اسم القضية", "العميل", "نوع القضية", "الحالة", "تاريخ الجلسة", "الطرف الخصم", "المحامي المسؤول", "الأولوية"]].set_index("case_id"))
 
             st.markdown("### ✏️ تعديل / حذف قضية / سجل الأنشطة")
             if not filtered_cases.empty:
                 case_to_edit_id = st.selectbox(
                     "اختر القضية للتعديل أو الحذف أو إضافة نشاط", 
                     filtered_cases["case_id"].tolist(), 
-                    format_func=lambda x: f"{x} - {st.session_state.cases[st.session_state.cases['case_id'] == x]['case_name'].iloc[0]}",
+                    format_func=lambda x, labels=lookup('cases', 'case_name'): f"{x} - {labels.get(x, '')}",
                     key="crm_select_case_to_edit"
                 )
                 current_case_data = st.session_state.cases[st.session_state.cases["case_id"] == case_to_edit_id].iloc[0]
+                case_base = form_base("cases", case_to_edit_id) # The row as first shown, to detect concurrent edits
                 
                 current_court_date = pd.to_datetime(current_case_data["court_date"]).date() if pd.notnull(current_case_data["court_date"]) else datetime.today().date()
 
                 with st.form("edit_case_form"):
-                    client_options = st.session_state.clients["name"].tolist()
-                    current_client_name = st.session_state.clients[st.session_state.clients["client_id"] == current_case_data["client_id"]]["name"].iloc[0]
-                    edited_client_name = st.selectbox("العميل المرتبط بالقضية", client_options, index=client_options.index(current_client_name), key="crm_edited_case_client_select")
-                    edited_client_id_for_case = st.session_state.clients[st.session_state.clients["name"] == edited_client_name]["client_id"].iloc[0]
+                    client_names = lookup("clients", "name")
+                    client_options = list(client_names)
+                    current_client_index = client_options.index(current_case_data["client_id"]) if current_case_data["client_id"] in client_names else 0
+                    edited_client_id_for_case = st.selectbox("العميل المرتبط بالقضية", client_options, index=current_client_index, format_func=client_names.get, key="crm_edited_case_client_select")
 
                     col_case_edit1, col_case_edit2 = st.columns(2)
                     with col_case_edit1:
@@ -225,24 +301,20 @@ def render_case_management(next_id_func, save_data_func, reshape_arabic_func):
                         delete_case_button = st.form_submit_button("🗑️ حذف القضية")
 
                     if update_case_button:
-                        st.session_state.cases.loc[st.session_state.cases["case_id"] == case_to_edit_id, 
-                            ["client_id", "case_name", "case_type", "status", "court_date", "opposing_party", 
-                             "case_description", "responsible_lawyer", "notes", "priority"]] = \
-                            [edited_client_id_for_case, edited_case_name, edited_case_type, edited_case_status, 
-                             edited_court_date, edited_opposing_party, edited_case_description, 
-                             edited_responsible_lawyer, edited_case_notes, edited_case_priority]
-                        save_data_func()
-                        st.success(f"✅ تم تحديث بيانات القضية: {reshape_arabic_func(edited_case_name)}.")
-                        st.rerun()
+                        if save_data_func([make_change("cases", "update", case_to_edit_id, {
+                            "client_id": edited_client_id_for_case, "case_name": edited_case_name,
+                            "case_type": edited_case_type, "status": edited_case_status, "court_date": edited_court_date,
+                            "opposing_party": edited_opposing_party, "case_description": edited_case_description,
+                            "responsible_lawyer": edited_responsible_lawyer, "notes": edited_case_notes,
+                            "priority": edited_case_priority
+                        }, base=case_base)]):
+                            st.success(f"✅ تم تحديث بيانات القضية: {reshape_arabic_func(edited_case_name)}.")
+                            st.rerun()
 
                     if delete_case_button:
-                        if any(st.session_state.invoices["case_id"] == case_to_edit_id) or \
-                           any((st.session_state.reminders["related_type"] == "قضية") & (st.session_state.reminders["related_id"] == case_to_edit_id)) or \
-                           any(st.session_state.time_entries["case_id"] == case_to_edit_id): # Check time entries too
-                            st.warning("⚠️ لا يمكن حذف هذه القضية لوجود فواتير، تذكيرات أو سجلات وقت مرتبطة بها. يرجى حذفها أولاً.")
-                        else:
-                            st.session_state.cases = st.session_state.cases[st.session_state.cases["case_id"] != case_to_edit_id]
-                            save_data_func()
+                        if is_referenced("cases", case_to_edit_id): # Active and archived invoices, reminders and time entries
+                            st.warning("⚠️ لا يمكن حذف هذه القضية لوجود فواتير، تذكيرات أو سجلات وقت مرتبطة بها (بما فيها المؤرشفة). يرجى حذفها أولاً.")
+                        elif save_data_func([make_change("cases", "delete", case_to_edit_id, base=case_base)]): # Also purges the case's activities
                             st.success(f"🗑️ تم حذف القضية: {reshape_arabic_func(current_case_data['case_name'])}.")
                             st.rerun()
             else:
@@ -254,36 +326,35 @@ def render_case_management(next_id_func, save_data_func, reshape_arabic_func):
             case_for_activity_id = st.selectbox(
                 "اختر القضية لإضافة/عرض الأنشطة:",
                 st.session_state.cases["case_id"].tolist(),
-                format_func=lambda x: f"{x} - {st.session_state.cases[st.session_state.cases['case_id'] == x]['case_name'].iloc[0]}",
+                format_func=lambda x, labels=lookup('cases', 'case_name'): f"{x} - {labels.get(x, '')}",
                 key="crm_select_case_for_activity"
             )
-            current_case_activity_log = st.session_state.cases[st.session_state.cases["case_id"] == case_for_activity_id]["activity_log"].iloc[0]
 
             with st.form("add_activity_form", clear_on_submit=True):
                 new_activity_description = st.text_area("أضف نشاطاً جديداً:", key="crm_new_activity_description")
                 add_activity_button = st.form_submit_button("إضافة نشاط")
 
                 if add_activity_button and new_activity_description:
-                    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                    new_activity = {"timestamp": timestamp, "description": new_activity_description}
-                    
-                    # Ensure activity_log is a list
-                    if not isinstance(current_case_activity_log, list):
-                        current_case_activity_log = []
-                    
-                    current_case_activity_log.append(new_activity)
-                    st.session_state.cases.loc[st.session_state.cases["case_id"] == case_for_activity_id, "activity_log"] = [current_case_activity_log]
-                    save_data_func()
+                    # Appended to the activity store; the case row itself is not rewritten
+                    add_activity(case_for_activity_id, new_activity_description, user=st.session_state.get("username"))
                     st.success("✅ تم إضافة النشاط بنجاح!")
                     st.rerun()
                 elif add_activity_button:
                     st.warning("الرجاء إدخال وصف للنشاط.")
 
             st.markdown("#### سجل الأنشطة:")
-            if current_case_activity_log:
-                # Display activities in reverse chronological order
-                for activity in reversed(current_case_activity_log):
-                    st.markdown(f"- **{reshape_arabic_func(activity['timestamp'])}**: {reshape_arabic_func(activity['description'])}")
+            activity_count = count_activities(case_for_activity_id)
+            if activity_count:
+                # Only the selected page is read from the store, newest first
+                page_count = (activity_count + ACTIVITY_PAGE_SIZE - 1) // ACTIVITY_PAGE_SIZE
+                activity_page = 1
+                if page_count > 1:
+                    activity_page = st.number_input(f"الصفحة (من {page_count})", min_value=1, max_value=page_count, value=1, step=1, key="crm_activity_page_input")
+                activities = get_activities(case_for_activity_id, page=activity_page - 1)
+                # The page's timestamps and descriptions are shaped in one batch
+                shaped = reshape_arabic_batch([value for activity in activities for value in (activity['timestamp'], activity['description'])])
+                for timestamp, description in zip(shaped[::2], shaped[1::2]):
+                    st.markdown(f"- **{timestamp}**: {description}")
             else:
                 st.info("لا توجد أنشطة مسجلة لهذه القضية بعد.")
         else:
@@ -291,6 +362,27 @@ def render_case_management(next_id_func, save_data_func, reshape_arabic_func):
 
 
 # --- Reminder Management Functions and UI ---
+def reminder_details(reminders, client_names, case_names, today=None):
+    """
+    (related entity name, status) Series for reminder rows. Names come from the
+    {id: name} maps of clients and cases; general reminders and reminders whose client or
+    case no longer exists get 'لا يوجد'. Status is 'مكتملة', 'قادمة' (due today or later)
+    or 'متأخرة', or 'بدون تاريخ' for open reminders without a date.
+    """
+    related = pd.Series(None, index=reminders.index, dtype=object)
+    for related_type, names in (("عميل", client_names), ("قضية", case_names)):
+        mask = reminders["related_type"] == related_type
+        related[mask] = reminders.loc[mask, "related_id"].map(names)
+    related = related.fillna("لا يوجد")
+
+    today = pd.Timestamp(today or datetime.today().date())
+    status = np.select(
+        [reminders["is_completed"].to_numpy(dtype=bool), (reminders["date"] >= today).to_numpy(), (reminders["date"] < today).to_numpy()],
+        ["مكتملة", "قادمة", "متأخرة"],
+        default="بدون تاريخ"
+    )
+    return related, pd.Series(status, index=reminders.index)
+
 def render_reminder_management(next_id_func, save_data_func, reshape_arabic_func):
     """Renders the UI for reminder management."""
     st.header("⏰ إدارة التذكيرات والمهام")
@@ -303,16 +395,14 @@ def render_reminder_management(next_id_func, save_data_func, reshape_arabic_func
             related_entity_id = 0 # Default for 'عام' or if no entity selected
             if reminder_type == "عميل":
                 if not st.session_state.clients.empty:
-                    client_names = st.session_state.clients['name'].tolist()
-                    selected_client_for_reminder = st.selectbox("اختر العميل", client_names, key="crm_reminder_client_select")
-                    related_entity_id = st.session_state.clients[st.session_state.clients["name"] == selected_client_for_reminder]["client_id"].iloc[0]
+                    client_names = lookup("clients", "name")
+                    related_entity_id = st.selectbox("اختر العميل", list(client_names), format_func=client_names.get, key="crm_reminder_client_select")
                 else:
                     st.warning("لا يوجد عملاء لربط التذكير بهم. يرجى إضافة عميل أولاً أو اختر 'قضية' أو 'عام'.")
             elif reminder_type == "قضية":
                 if not st.session_state.cases.empty:
-                    case_names = st.session_state.cases['case_name'].tolist()
-                    selected_case_for_reminder = st.selectbox("اختر القضية", case_names, key="crm_reminder_case_select")
-                    related_entity_id = st.session_state.cases[st.session_state.cases["case_name"] == selected_case_for_reminder]["case_id"].iloc[0]
+                    case_names = lookup("cases", "case_name")
+                    related_entity_id = st.selectbox("اختر القضية", list(case_names), format_func=case_names.get, key="crm_reminder_case_select")
                 else:
                     st.warning("لا توجد قضايا لربط التذكير بها. يرجى إضافة قضية أولاً أو اختر 'عميل' أو 'عام'.")
             
@@ -324,48 +414,33 @@ def render_reminder_management(next_id_func, save_data_func, reshape_arabic_func
             if submitted_reminder:
                 if new_reminder_description and (reminder_type == "عام" or related_entity_id is not None):
                     rid = next_id_func(st.session_state.reminders, "reminder_id")
-                    st.session_state.reminders.loc[len(st.session_state.reminders)] = [rid, reminder_type, related_entity_id, new_reminder_description, new_reminder_date, False]
-                    save_data_func()
-                    st.success(f"✅ تم إضافة التذكير: {reshape_arabic_func(new_reminder_description)} بنجاح!")
-                    st.rerun()
+                    if save_data_func([make_change("reminders", "insert", rid, {
+                        "reminder_id": rid, "related_type": reminder_type, "related_id": related_entity_id,
+                        "description": new_reminder_description, "date": new_reminder_date, "is_completed": False
+                    })]):
+                        st.success(f"✅ تم إضافة التذكير: {reshape_arabic_func(new_reminder_description)} بنجاح!")
+                        st.rerun()
                 else:
                     st.warning("الرجاء إدخال وصف التذكير واختيار الربط المناسب.")
     
     st.markdown("---")
     st.markdown("### 📋 قائمة التذكيرات")
     if not st.session_state.reminders.empty:
-        df_reminders_display = st.session_state.reminders.copy()
-        
-        # Add related client/case name for display
-        df_reminders_display['الكيان المرتبط'] = ''
-        for idx, row in df_reminders_display.iterrows():
-            if row['related_type'] == 'عميل' and row['related_id'] in st.session_state.clients['client_id'].values:
-                df_reminders_display.loc[idx, 'الكيان المرتبط'] = st.session_state.clients[st.session_state.clients['client_id'] == row['related_id']]['name'].iloc[0]
-            elif row['related_type'] == 'قضية' and row['related_id'] in st.session_state.cases['case_id'].values:
-                df_reminders_display.loc[idx, 'الكيان المرتبط'] = st.session_state.cases[st.session_state.cases['case_id'] == row['related_id']]['case_name'].iloc[0]
-            else:
-                df_reminders_display.loc[idx, 'الكيان المرتبط'] = 'لا يوجد' # For 'عام' or if entity was deleted
-
-        # Add 'Status' for reminders (Upcoming, Overdue, Completed)
-        df_reminders_display['الحالة'] = 'مكتملة'
-        df_reminders_display.loc[(df_reminders_display['is_completed'] == False) & (df_reminders_display['date'] >= datetime.today().date()), 'الحالة'] = 'قادمة'
-        df_reminders_display.loc[(df_reminders_display['is_completed'] == False) & (df_reminders_display['date'] < datetime.today().date()), 'الحالة'] = 'متأخرة'
-
-        df_reminders_display = df_reminders_display.rename(columns={
-            "description": "الوصف", "date": "التاريخ", "related_type": "نوع الربط", "is_completed": "اكتمل؟"
-        })
-        
-        st.dataframe(df_reminders_display[["reminder_id", "الوصف", "التاريخ", "الحالة", "نوع الربط", "الكيان المرتبط"]].set_index("reminder_id"))
+        # Statuses depend on the date, so the view is also rebuilt when the day changes
+        df_reminders_display = cached_view("reminders_list", ["reminders", "clients", "cases"], _reminders_view, extra=(datetime.today().date(),))
+        page_reminders = paged_rows(df_reminders_display, {"reminder_id": "الرقم", "التاريخ": "التاريخ", "الوصف": "الوصف", "الحالة": "الحالة"}, "crm_reminders_list")
+        st.dataframe(page_reminders[["reminder_id", "الوصف", "التاريخ", "الحالة", "نوع الربط", "الكيان المرتبط"]].set_index("reminder_id"))
 
         st.markdown("### ✏️ تعديل / حذف / إكمال تذكير")
-        if not df_reminders_display.empty:
+        if not st.session_state.reminders.empty:
             reminder_to_edit_id = st.selectbox(
                 "اختر التذكير للتعديل أو الإكمال أو الحذف", 
-                df_reminders_display["reminder_id"].tolist(), 
-                format_func=lambda x: f"{x} - {st.session_state.reminders[st.session_state.reminders['reminder_id'] == x]['description'].iloc[0]}",
+                st.session_state.reminders["reminder_id"].tolist(), 
+                format_func=lambda x, labels=lookup('reminders', 'description'): f"{x} - {labels.get(x, '')}",
                 key="crm_select_reminder_to_edit"
             )
             current_reminder_data = st.session_state.reminders[st.session_state.reminders["reminder_id"] == reminder_to_edit_id].iloc[0]
+            reminder_base = form_base("reminders", reminder_to_edit_id) # The row as first shown, to detect concurrent edits
             
             with st.form("edit_reminder_form"):
                 edited_reminder_description = st.text_area("وصف التذكير / المهمة", value=current_reminder_data["description"], key="crm_edited_reminder_description_input")
@@ -381,23 +456,22 @@ def render_reminder_management(next_id_func, save_data_func, reshape_arabic_func
                     delete_reminder_button = st.form_submit_button("🗑️ حذف التذكير")
 
                 if update_reminder_button:
-                    st.session_state.reminders.loc[st.session_state.reminders["reminder_id"] == reminder_to_edit_id, ["description", "date", "is_completed"]] = \
-                        [edited_reminder_description, edited_reminder_date, edited_is_completed]
-                    save_data_func()
-                    st.success(f"✅ تم تحديث التذكير: {reshape_arabic_func(edited_reminder_description)}.")
-                    st.rerun()
+                    if save_data_func([make_change("reminders", "update", reminder_to_edit_id, {
+                        "description": edited_reminder_description, "date": edited_reminder_date,
+                        "is_completed": edited_is_completed
+                    }, base=reminder_base)]):
+                        st.success(f"✅ تم تحديث التذكير: {reshape_arabic_func(edited_reminder_description)}.")
+                        st.rerun()
                 
                 if complete_reminder_button:
-                    st.session_state.reminders.loc[st.session_state.reminders["reminder_id"] == reminder_to_edit_id, "is_completed"] = True
-                    save_data_func()
-                    st.success(f"✅ تم وضع علامة 'مكتمل' للتذكير: {reshape_arabic_func(current_reminder_data['description'])}.")
-                    st.rerun()
+                    if save_data_func([make_change("reminders", "update", reminder_to_edit_id, {"is_completed": True}, base=reminder_base)]):
+                        st.success(f"✅ تم وضع علامة 'مكتمل' للتذكير: {reshape_arabic_func(current_reminder_data['description'])}.")
+                        st.rerun()
 
                 if delete_reminder_button:
-                    st.session_state.reminders = st.session_state.reminders[st.session_state.reminders["reminder_id"] != reminder_to_edit_id]
-                    save_data_func()
-                    st.success(f"🗑️ تم حذف التذكير: {reshape_arabic_func(current_reminder_data['description'])}.")
-                    st.rerun()
+                    if save_data_func([make_change("reminders", "delete", reminder_to_edit_id, base=reminder_base)]):
+                        st.success(f"🗑️ تم حذف التذكير: {reshape_arabic_func(current_reminder_data['description'])}.")
+                        st.rerun()
         else:
             st.info("لا توجد تذكيرات لعرضها. يرجى إضافة تذكير أولاً.")
     else:
@@ -414,17 +488,13 @@ def render_invoice_management(next_id_func, save_data_func, reshape_arabic_func)
     else:
         with st.expander("➕ إضافة فاتورة جديدة", expanded=False):
             with st.form("add_invoice_form", clear_on_submit=True):
-                client_names_inv = st.session_state.clients["name"].tolist()
-                selected_client_name_inv = st.selectbox("اختر العميل", client_names_inv, key="crm_inv_client_select")
-                client_id_for_inv = st.session_state.clients[st.session_state.clients["name"] == selected_client_name_inv]["client_id"].iloc[0]
+                client_names = lookup("clients", "name")
+                client_id_for_inv = st.selectbox("اختر العميل", list(client_names), format_func=client_names.get, key="crm_inv_client_select")
 
                 # Option to link invoice to a case
-                cases_for_client = st.session_state.cases[st.session_state.cases["client_id"] == client_id_for_inv]
-                case_options = [""] + cases_for_client["case_name"].tolist() if not cases_for_client.empty else [""]
-                selected_case_name_inv = st.selectbox("الربط بقضية (اختياري)", case_options, key="crm_inv_case_select")
-                case_id_for_inv = None
-                if selected_case_name_inv and not cases_for_client.empty:
-                    case_id_for_inv = cases_for_client[cases_for_client["case_name"] == selected_case_name_inv]["case_id"].iloc[0]
+                case_names = lookup("cases", "case_name")
+                case_options = [None] + [case_id for case_id, owner in lookup("cases", "client_id").items() if owner == client_id_for_inv]
+                case_id_for_inv = st.selectbox("الربط بقضية (اختياري)", case_options, format_func=lambda x: "" if x is None else case_names.get(x, ""), key="crm_inv_case_select")
 
                 col_inv1, col_inv2 = st.columns(2)
                 with col_inv1:
@@ -438,54 +508,40 @@ def render_invoice_management(next_id_func, save_data_func, reshape_arabic_func)
                 if submitted_invoice:
                     if new_invoice_amount > 0:
                         iid = next_id_func(st.session_state.invoices, "invoice_id")
-                        st.session_state.invoices.loc[len(st.session_state.invoices)] = [
-                            iid, client_id_for_inv, case_id_for_inv, new_invoice_amount, 
-                            new_invoice_paid, new_invoice_date, new_invoice_due_date
-                        ]
-                        save_data_func()
-                        st.success(f"✅ تم إضافة فاتورة بمبلغ: {new_invoice_amount:,.2f} ر.س بنجاح!")
-                        st.rerun()
+                        if save_data_func([make_change("invoices", "insert", iid, {
+                            "invoice_id": iid, "client_id": client_id_for_inv, "case_id": case_id_for_inv,
+                            "amount": new_invoice_amount, "paid": new_invoice_paid,
+                            "date": new_invoice_date, "due_date": new_invoice_due_date
+                        })]):
+                            st.success(f"✅ تم إضافة فاتورة بمبلغ: {new_invoice_amount:,.2f} ر.س بنجاح!")
+                            st.rerun()
                     else:
                         st.warning("الرجاء إدخال مبلغ صحيح للفاتورة.")
         
         st.markdown("---")
         st.markdown("### 📋 قائمة الفواتير")
         if not st.session_state.invoices.empty:
-            df_invoices_display = st.session_state.invoices.copy()
-            df_invoices_display = df_invoices_display.merge(st.session_state.clients[["client_id", "name"]], on="client_id", how="left", suffixes=('_inv', '_client'))
-            
-            # Add case name if linked
-            if 'case_id' in df_invoices_display.columns and not st.session_state.cases.empty:
-                df_invoices_display = df_invoices_display.merge(st.session_state.cases[["case_id", "case_name"]], on="case_id", how="left", suffixes=('_inv', '_case'))
-            else:
-                 df_invoices_display['case_name'] = None # Ensure column exists even if no cases
-
-            df_invoices_display['الحالة'] = df_invoices_display['paid'].apply(lambda x: "مدفوعة" if x else "غير مدفوعة")
-            df_invoices_display = df_invoices_display.rename(columns={
-                "name": "العميل", "case_name": "القضية المرتبطة", "amount": "المبلغ", 
-                "date": "تاريخ الفاتورة", "due_date": "تاريخ الاستحقاق"
-            })
-
             # Filter by payment status
             payment_filter = st.selectbox("تصفية حسب حالة الدفع", PAYMENT_STATUS_OPTIONS, key="crm_invoice_payment_filter")
+            filtered_invoices = cached_view("invoices_list", ["invoices", "clients", "cases"], _invoices_view)
             if payment_filter == "مدفوعة":
-                filtered_invoices = df_invoices_display[df_invoices_display['الحالة'] == "مدفوعة"]
+                filtered_invoices = filtered_invoices[filtered_invoices["paid"] == True]
             elif payment_filter == "غير مدفوعة":
-                filtered_invoices = df_invoices_display[df_invoices_display['الحالة'] == "غير مدفوعة"]
-            else:
-                filtered_invoices = df_invoices_display
-            
-            st.dataframe(filtered_invoices[["invoice_id", "العميل", "القضية المرتبطة", "المبلغ", "تاريخ الفاتورة", "تاريخ الاستحقاق", "الحالة"]].set_index("invoice_id"))
+                filtered_invoices = filtered_invoices[filtered_invoices["paid"] == False]
+
+            page_invoices = paged_rows(filtered_invoices, {"invoice_id": "الرقم", "المبلغ": "المبلغ", "تاريخ الفاتورة": "تاريخ الفاتورة", "تاريخ الاستحقاق": "تاريخ الاستحقاق"}, "crm_invoices_list")
+            st.dataframe(page_invoices[["invoice_id", "العميل", "القضية المرتبطة", "المبلغ", "تاريخ الفاتورة", "تاريخ الاستحقاق", "الحالة"]].set_index("invoice_id"))
 
             st.markdown("### ✏️ تعديل / حذف فاتورة")
             if not filtered_invoices.empty:
                 invoice_to_edit_id = st.selectbox(
                     "اختر الفاتورة للتعديل أو الحذف", 
                     filtered_invoices["invoice_id"].tolist(), 
-                    format_func=lambda x: f"{x} - {st.session_state.invoices[st.session_state.invoices['invoice_id'] == x]['amount'].iloc[0]} ر.س",
+                    format_func=lambda x, labels=lookup('invoices', 'amount'): f"{x} - {labels.get(x, '')} ر.س",
                     key="crm_select_invoice_to_edit"
                 )
                 current_invoice_data = st.session_state.invoices[st.session_state.invoices["invoice_id"] == invoice_to_edit_id].iloc[0]
+                invoice_base = form_base("invoices", invoice_to_edit_id) # The row as first shown, to detect concurrent edits
 
                 with st.form("edit_invoice_form"):
                     edited_invoice_amount = st.number_input("المبلغ (ريال سعودي)", value=float(current_invoice_data["amount"]), min_value=0.0, step=50.0, format="%.2f", key="crm_edited_invoice_amount_input")
@@ -500,17 +556,17 @@ def render_invoice_management(next_id_func, save_data_func, reshape_arabic_func)
                         delete_invoice_button = st.form_submit_button("🗑️ حذف الفاتورة")
 
                     if update_invoice_button:
-                        st.session_state.invoices.loc[st.session_state.invoices["invoice_id"] == invoice_to_edit_id, ["amount", "paid", "date", "due_date"]] = \
-                            [edited_invoice_amount, edited_invoice_paid, edited_invoice_date, edited_invoice_due_date]
-                        save_data_func()
-                        st.success(f"✅ تم تحديث الفاتورة رقم {invoice_to_edit_id}.")
-                        st.rerun()
+                        if save_data_func([make_change("invoices", "update", invoice_to_edit_id, {
+                            "amount": edited_invoice_amount, "paid": edited_invoice_paid,
+                            "date": edited_invoice_date, "due_date": edited_invoice_due_date
+                        }, base=invoice_base)]):
+                            st.success(f"✅ تم تحديث الفاتورة رقم {invoice_to_edit_id}.")
+                            st.rerun()
 
                     if delete_invoice_button:
-                        st.session_state.invoices = st.session_state.invoices[st.session_state.invoices["invoice_id"] != invoice_to_edit_id]
-                        save_data_func()
-                        st.success(f"🗑️ تم حذف الفاتورة رقم {invoice_to_edit_id}.")
-                        st.rerun()
+                        if save_data_func([make_change("invoices", "delete", invoice_to_edit_id, base=invoice_base)]):
+                            st.success(f"🗑️ تم حذف الفاتورة رقم {invoice_to_edit_id}.")
+                            st.rerun()
             else:
                 st.info("لا توجد فواتير لعرضها. يرجى إضافة فاتورة أولاً.")
         else:
@@ -527,16 +583,12 @@ def render_time_tracking(next_id_func, save_data_func, reshape_arabic_func):
     else:
         with st.expander("➕ إضافة سجل وقت جديد", expanded=False):
             with st.form("add_time_entry_form", clear_on_submit=True):
-                client_names_time = st.session_state.clients["name"].tolist()
-                selected_client_name_time = st.selectbox("اختر العميل", client_names_time, key="crm_time_client_select")
-                client_id_for_time = st.session_state.clients[st.session_state.clients["name"] == selected_client_name_time]["client_id"].iloc[0]
+                client_names = lookup("clients", "name")
+                client_id_for_time = st.selectbox("اختر العميل", list(client_names), format_func=client_names.get, key="crm_time_client_select")
 
-                cases_for_client_time = st.session_state.cases[st.session_state.cases["client_id"] == client_id_for_time]
-                case_options_time = [""] + cases_for_client_time["case_name"].tolist() if not cases_for_client_time.empty else [""]
-                selected_case_name_time = st.selectbox("الربط بقضية (اختياري)", case_options_time, key="crm_time_case_select")
-                case_id_for_time = None
-                if selected_case_name_time and not cases_for_client_time.empty:
-                    case_id_for_time = cases_for_client_time[cases_for_client_time["case_name"] == selected_case_name_time]["case_id"].iloc[0]
+                case_names = lookup("cases", "case_name")
+                case_options_time = [None] + [case_id for case_id, owner in lookup("cases", "client_id").items() if owner == client_id_for_time]
+                case_id_for_time = st.selectbox("الربط بقضية (اختياري)", case_options_time, format_func=lambda x: "" if x is None else case_names.get(x, ""), key="crm_time_case_select")
 
                 col_time1, col_time2 = st.columns(2)
                 with col_time1:
@@ -551,43 +603,33 @@ def render_time_tracking(next_id_func, save_data_func, reshape_arabic_func):
                 if submitted_time_entry:
                     if new_time_hours > 0 and new_time_description:
                         tid = next_id_func(st.session_state.time_entries, "entry_id")
-                        st.session_state.time_entries.loc[len(st.session_state.time_entries)] = [
-                            tid, client_id_for_time, case_id_for_time, new_time_date, 
-                            new_time_hours, new_time_category, new_time_description
-                        ]
-                        save_data_func()
-                        st.success(f"✅ تم تسجيل {new_time_hours} ساعة بنجاح!")
-                        st.rerun()
+                        if save_data_func([make_change("time_entries", "insert", tid, {
+                            "entry_id": tid, "client_id": client_id_for_time, "case_id": case_id_for_time,
+                            "date": new_time_date, "hours": new_time_hours, "category": new_time_category,
+                            "description": new_time_description
+                        })]):
+                            st.success(f"✅ تم تسجيل {new_time_hours} ساعة بنجاح!")
+                            st.rerun()
                     else:
                         st.warning("الرجاء إدخال الساعات ووصف النشاط.")
         
         st.markdown("---")
         st.markdown("### 📋 سجلات الوقت")
         if not st.session_state.time_entries.empty:
-            df_time_entries_display = st.session_state.time_entries.copy()
-            df_time_entries_display = df_time_entries_display.merge(st.session_state.clients[["client_id", "name"]], on="client_id", how="left", suffixes=('_time', '_client'))
-            
-            if 'case_id' in df_time_entries_display.columns and not st.session_state.cases.empty:
-                df_time_entries_display = df_time_entries_display.merge(st.session_state.cases[["case_id", "case_name"]], on="case_id", how="left", suffixes=('_time', '_case'))
-            else:
-                 df_time_entries_display['case_name'] = None
-
-            df_time_entries_display = df_time_entries_display.rename(columns={
-                "name": "العميل", "case_name": "القضية المرتبطة", "date": "التاريخ", 
-                "hours": "الساعات", "category": "الفئة", "description": "الوصف"
-            })
-            
-            st.dataframe(df_time_entries_display[["entry_id", "العميل", "القضية المرتبطة", "التاريخ", "الساعات", "الفئة", "الوصف"]].set_index("entry_id"))
+            df_time_entries_display = cached_view("time_entries_list", ["time_entries", "clients", "cases"], _time_entries_view)
+            page_time_entries = paged_rows(df_time_entries_display, {"entry_id": "الرقم", "التاريخ": "التاريخ", "الساعات": "الساعات", "الفئة": "الفئة"}, "crm_time_entries_list")
+            st.dataframe(page_time_entries[["entry_id", "العميل", "القضية المرتبطة", "التاريخ", "الساعات", "الفئة", "الوصف"]].set_index("entry_id"))
 
             st.markdown("### ✏️ تعديل / حذف سجل وقت")
-            if not df_time_entries_display.empty:
+            if not st.session_state.time_entries.empty:
                 time_entry_to_edit_id = st.selectbox(
                     "اختر سجل الوقت للتعديل أو الحذف", 
-                    df_time_entries_display["entry_id"].tolist(), 
-                    format_func=lambda x: f"{x} - {st.session_state.time_entries[st.session_state.time_entries['entry_id'] == x]['description'].iloc[0]}",
+                    st.session_state.time_entries["entry_id"].tolist(), 
+                    format_func=lambda x, labels=lookup('time_entries', 'description'): f"{x} - {labels.get(x, '')}",
                     key="crm_select_time_entry_to_edit"
                 )
                 current_time_entry_data = st.session_state.time_entries[st.session_state.time_entries["entry_id"] == time_entry_to_edit_id].iloc[0]
+                time_entry_base = form_base("time_entries", time_entry_to_edit_id) # The row as first shown, to detect concurrent edits
 
                 with st.form("edit_time_entry_form"):
                     edited_time_date = st.date_input("التاريخ", value=current_time_entry_data["date"], key="crm_edited_time_date_input")
@@ -602,19 +644,127 @@ def render_time_tracking(next_id_func, save_data_func, reshape_arabic_func):
                         delete_time_button = st.form_submit_button("🗑️ حذف سجل الوقت")
 
                     if update_time_button:
-                        st.session_state.time_entries.loc[st.session_state.time_entries["entry_id"] == time_entry_to_edit_id, 
-                            ["date", "hours", "category", "description"]] = \
-                            [edited_time_date, edited_time_hours, edited_time_category, edited_time_description]
-                        save_data_func()
-                        st.success(f"✅ تم تحديث سجل الوقت رقم {time_entry_to_edit_id}.")
-                        st.rerun()
+                        if save_data_func([make_change("time_entries", "update", time_entry_to_edit_id, {
+                            "date": edited_time_date, "hours": edited_time_hours,
+                            "category": edited_time_category, "description": edited_time_description
+                        }, base=time_entry_base)]):
+                            st.success(f"✅ تم تحديث سجل الوقت رقم {time_entry_to_edit_id}.")
+                            st.rerun()
 
                     if delete_time_button:
-                        st.session_state.time_entries = st.session_state.time_entries[st.session_state.time_entries["entry_id"] != time_entry_to_edit_id]
-                        save_data_func()
-                        st.success(f"🗑️ تم حذف سجل الوقت رقم {time_entry_to_edit_id}.")
-                        st.rerun()
+                        if save_data_func([make_change("time_entries", "delete", time_entry_to_edit_id, base=time_entry_base)]):
+                            st.success(f"🗑️ تم حذف سجل الوقت رقم {time_entry_to_edit_id}.")
+                            st.rerun()
             else:
                 st.info("لا توجد سجلات وقت لعرضها. يرجى إضافة سجل وقت أولاً.")
         else:
             st.info("لا توجد سجلات وقت لعرضها.")
+
+# --- Global Search Functions and UI ---
+# Per kind of result: its Arabic name, where it is shown, the selectbox that selects the
+# record there and the inputs to reset so that the record is among the selectbox options.
+GLOBAL_SEARCH_TARGETS = {
+    "clients": ("عميل", "إدارة القضايا ← العملاء", "crm_select_client_to_edit", {"crm_search_client_input": ""}),
+    "cases": ("قضية", "إدارة القضايا ← القضايا", "crm_select_case_to_edit", {"crm_search_case_input": ""}),
+    "invoices": ("فاتورة", "إدارة القضايا ← الفواتير", "crm_select_invoice_to_edit", {"crm_invoice_payment_filter": PAYMENT_STATUS_OPTIONS[0]}),
+    "reminders": ("تذكير", "إدارة القضايا ← التذكيرات", "crm_select_reminder_to_edit", {}),
+    "time_entries": ("سجل وقت", "تتبع الوقت", "crm_select_time_entry_to_edit", {}),
+    "activities": ("نشاط قضية", "إدارة القضايا ← القضايا ← سجل الأنشطة", "crm_select_case_for_activity", {}),
+}
+
+def _global_search_row(hit):
+    """(title, details) of a search hit from the session's tables, or None if the record is not there."""
+    table = "cases" if hit["table"] == "activities" else hit["table"]
+    df = st.session_state[table]
+    rows = df[df[TABLE_KEYS[table]] == hit["key"]]
+    if rows.empty:
+        return None
+    row = rows.iloc[0]
+    if hit["table"] == "clients":
+        return row["name"], row["phone"]
+    if hit["table"] == "cases":
+        return row["case_name"], row["status"]
+    if hit["table"] == "invoices":
+        return f"فاتورة رقم {row['invoice_id']}", f"{row['amount']} ر.س - {'مدفوعة' if row['paid'] else 'غير مدفوعة'}"
+    if hit["table"] == "reminders":
+        return row["description"], row["date"].date() if pd.notna(row["date"]) else ""
+    if hit["table"] == "time_entries":
+        return row["description"], f"{row['hours']} ساعة - {row['category']}"
+    return hit["entry"]["description"], f"القضية: {row['case_name']} - {hit['entry'].get('timestamp', '')}"
+
+def _select_search_hit(hit):
+    """Selects a search hit's record in the view that shows it (runs before the next rerun)."""
+    label, place, select_key, resets = GLOBAL_SEARCH_TARGETS[hit["table"]]
+    for key, value in resets.items():
+        st.session_state[key] = value
+    st.session_state[select_key] = int(hit["key"])
+    st.session_state.global_search_notice = f"✅ تم تحديد {label} رقم {int(hit['key'])} في: {place}"
+
+def render_global_search():
+    """Renders one search box over every CRM record, with ranked results that can be opened in their tab."""
+    if st.session_state.get("global_search_notice"):
+        st.success(st.session_state.pop("global_search_notice"))
+    query = st.text_input("🔍 بحث شامل (العملاء، القضايا، الفواتير، التذكيرات، سجلات الوقت، الأنشطة)", "", key="crm_global_search_input")
+    if not query.strip():
+        return
+    started = time.perf_counter()
+    hits = [(hit, row) for hit in search_all(query) if (row := _global_search_row(hit)) is not None]
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    if not hits:
+        st.info("لا توجد نتائج مطابقة.")
+        return
+    st.caption(f"عدد النتائج: {len(hits)} ({elapsed_ms:.0f} ms)")
+    st.dataframe(pd.DataFrame([
+        {"النوع": GLOBAL_SEARCH_TARGETS[hit["table"]][0], "السجل": title, "التفاصيل": details, "المكان": GLOBAL_SEARCH_TARGETS[hit["table"]][1]}
+        for hit, (title, details) in hits
+    ]), hide_index=True)
+    choice = st.selectbox(
+        "اختر نتيجة لفتحها",
+        range(len(hits)),
+        format_func=lambda i: f"{GLOBAL_SEARCH_TARGETS[hits[i][0]['table']][0]}: {hits[i][1][0]}",
+        key="crm_global_search_result_select"
+    )
+    st.button("📌 تحديد السجل في تبويبه", on_click=_select_search_hit, args=(hits[choice][0],), key="crm_global_search_open_button")
+
+# --- Archive Functions and UI ---
+# Arabic names of the tables that can be archived (see ARCHIVE_RULES in config.py)
+ARCHIVE_TABLE_LABELS = {"cases": "القضايا", "invoices": "الفواتير", "reminders": "التذكيرات", "time_entries": "سجلات الوقت"}
+ARCHIVE_RESULTS_LIMIT = 200 # Rows shown per archive search
+
+def render_archive_management():
+    """Renders the UI for archiving old records and searching/restoring archived ones."""
+    st.header("🗄️ الأرشيف")
+    st.markdown("القضايا المغلقة والفواتير المدفوعة والتذكيرات المكتملة وسجلات الوقت القديمة تُنقل إلى الأرشيف فلا تُحمّل مع البيانات النشطة، ويمكن البحث فيها واستعادتها في أي وقت.")
+
+    if st.button("📦 أرشفة السجلات القديمة الآن", key="crm_archive_run_button"):
+        archived = archive_old_records()
+        if archived:
+            st.success("✅ تمت الأرشفة: " + "، ".join(f"{ARCHIVE_TABLE_LABELS[table]}: {count}" for table, count in archived.items()))
+        else:
+            st.info("لا توجد سجلات تستوفي شروط الأرشفة.")
+
+    st.markdown("---")
+    st.markdown("### 🔍 البحث في الأرشيف")
+    archive_table = st.selectbox("نوع السجلات", list(ARCHIVE_TABLE_LABELS), format_func=ARCHIVE_TABLE_LABELS.get, key="crm_archive_table_select")
+    archive_search = st.text_input("ابحث في الأرشيف (نص أو رقم)", "", key="crm_archive_search_input")
+    results = search_archive(archive_table, archive_search)
+    if results.empty:
+        st.info("لا توجد سجلات مؤرشفة مطابقة.")
+        return
+
+    st.caption(f"عدد النتائج: {len(results)}" + (f" (يُعرض أول {ARCHIVE_RESULTS_LIMIT})" if len(results) > ARCHIVE_RESULTS_LIMIT else ""))
+    shown = results.head(ARCHIVE_RESULTS_LIMIT)
+    st.dataframe(with_display_dates(archive_table, shown), use_container_width=True, hide_index=True)
+
+    key_col = TABLE_KEYS[archive_table]
+    keys_to_restore = st.multiselect("اختر السجلات المراد استعادتها", shown[key_col].tolist(), key="crm_archive_restore_select")
+    if st.button("♻️ استعادة السجلات المحددة", key="crm_archive_restore_button") and keys_to_restore:
+        restored, conflicting, orphaned = restore_archived(archive_table, keys_to_restore)
+        if conflicting: # Kept in the archive; restoring them would overwrite the active records
+            st.warning(f"⚠️ لم تتم استعادة السجلات ذات الأرقام {'، '.join(map(str, conflicting))} لأن سجلات نشطة تستخدم الأرقام نفسها، وبقيت في الأرشيف.")
+        if orphaned:
+            st.warning(f"⚠️ لم تتم استعادة السجلات ذات الأرقام {'، '.join(map(str, orphaned))} لأن العميل أو القضية المرتبطة بها غير موجودة في البيانات النشطة. يرجى استعادتها أولاً.")
+        if restored:
+            st.success(f"✅ تمت استعادة {restored} سجل إلى البيانات النشطة.")
+        if not conflicting and not orphaned:
+            st.rerun()
@@ -2,193 +2,827 @@
 
 import streamlit as st
 import pandas as pd
+import numpy as np
 import json
-import os
-from datetime import datetime, date, timedelta # Import timedelta
+import threading
+import time
+import weakref
+from datetime import datetime
 
-from config import DATA_FILE # Import DATA_FILE from config
+from config import JOURNAL_COMPACT_THRESHOLD, LOCK_FILE, LOCK_TIMEOUT_SECONDS, ARCHIVE_RULES, SNAPSHOT_INTERVAL_SECONDS, GLOBAL_SEARCH_LIMIT, WRITER_FAILED_FILE
+from schema import TABLE_COLUMNS, TABLE_NAMES, TABLE_KEYS, empty_table, coerce_table, build_table, concat_tables, to_column_value, to_record_value, encode_table, validate_change
+from journal import make_change, append_changes # make_change is re-exported for the CRM and auth modules
+from storage_backends import get_storage
+from activity_store import import_case_logs, search_activities, purge_case_activities, activity_log_since
+from background_writer import BackgroundWriter
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+from file_lock import FileLock
+from snapshots import SnapshotStore, SNAPSHOT_TABLES, ARCHIVE_PREFIX, store_table, activity_change
+from search_index import SEARCH_FIELDS, SearchIndex
+from archive import cold_rows, load_archive, add_to_archive, remove_from_archive
 
-def load_data():
+# Storage engine selected by config.STORAGE_BACKEND (JSON file + journal, SQLite, partitioned or columnar files)
+_storage = get_storage()
+
+# Held by the writer of any process while it writes the store
+_store_lock = FileLock(LOCK_FILE)
+
+# --- Process-wide Data Cache ---
+# Streamlit re-runs main.py on every widget interaction, but imported modules stay
+# loaded for the lifetime of the server process. The typed DataFrames are therefore
+# kept here and shared by all reruns and sessions; the store is only read again when
+# its signature (file mtime/size, or the SQLite generation) no longer matches.
+_cache_lock = threading.Lock()
+_data_cache = {
+    "signature": None,      # Storage signature the frames reflect
+    "generation": 0,        # Bumped on every reload and every save
+    "frames": {},           # Table name -> typed DataFrame, for the tables loaded so far
+    "versions": {},         # Table name -> counter bumped whenever the table's frame is replaced
+    "journal_records": 0,   # Records in the journal since the last compaction
+    "failed_saves": 0,      # Change records the writer gave up on (moved to WRITER_FAILED_FILE)
+}
+
+# --- Shared Frames ---
+# Sessions do not get their own copies of the tables: st.session_state holds shallow
+# copies of the cached frames, which share every column with the cache. Cached frames
+# are never modified in place (a save replaces the columns it changes), so a session
+# only costs memory for the columns it replaced and the data is held once per process,
+# not once per user.
+
+_session_frames = {} # Session ID -> weak references to the session's frames, for memory_report()
+
+# --- Optimistic Concurrency ---
+# Saves are three-way merges: a save only writes the fields the session actually edited,
+# and editing a field that another session (or another process) changed meanwhile to a
+# different value rejects it. The base of the merge is the row as the edit form first
+# displayed it, which the form keeps in the session (form_base) until the row is saved
+# and sends with its change records, so reruns between rendering the form and submitting
+# it don't move the base. Changes without a base are merged against the tables the
+# session displayed on its previous run (rendered_tables).
+# save_data merges against the process cache. Since another process may write the store
+# while the change waits in the background writer, the writer checks the bases again
+# against the store, under the store lock; a change that conflicts there is dropped and
+# its session is told on its next run.
+CONFLICT_MESSAGE = "⚠️ لم يتم الحفظ: قام مستخدم آخر بتعديل نفس البيانات بعد عرضها لديك. تم تحديث البيانات، يرجى مراجعة التغييرات وإعادة المحاولة."
+LATE_CONFLICT_MESSAGE = "⚠️ لم يتم حفظ بعض التعديلات: قام مستخدم آخر بتعديل نفس البيانات قبل كتابتها. تم تحديث البيانات، يرجى مراجعة التغييرات وإعادة المحاولة."
+_late_conflicts = {} # Session ID -> conflicts found by the writer, shown on the session's next run
+WRITE_ERROR_MESSAGE = "⚠️ تعذر حفظ البيانات على القرص، وتتم إعادة المحاولة تلقائياً."
+WRITE_FAILED_MESSAGE = " لم يمكن حفظ {count} تعديل بعد عدة محاولات، وقد نُقلت إلى الملف {path} لمراجعتها."
+
+def load_data(tables=None):
     """
-    Loads application data from a JSON file into st.session_state.
+    Loads application data from the configured storage backend into st.session_state.
     Initializes empty DataFrames with correct columns if the file does not exist or is empty.
     Ensures all expected columns are present, adding them with defaults if missing.
+
+    The parsed and typed DataFrames are cached process-wide, so a rerun only copies
+    them into the session when the session is behind the cache, and the store itself
+    is only re-read when it has changed.
+
+    tables: names of the tables needed right away (default: all). The others are
+    loaded by ensure_tables() when a view first needs them, which saves reading them
+    on backends that store tables separately (SQLite, partitioned files).
+    """
+    if "save_notice" in st.session_state:
+        st.warning(st.session_state.pop("save_notice")) # Rejected save from the previous run
+    if _writer.last_error is not None: # Cleared by the next successful write
+        failed = _data_cache["failed_saves"]
+        st.error(WRITE_ERROR_MESSAGE + (WRITE_FAILED_MESSAGE.format(count=failed, path=WRITER_FAILED_FILE) if failed else "") + f" ({_writer.last_error})")
+
+    _start_snapshots()
+    with _cache_lock:
+        late_conflicts = _late_conflicts.pop(_session_id(), None)
+        if late_conflicts:
+            st.warning(f"{LATE_CONFLICT_MESSAGE} ({'; '.join(late_conflicts)})")
+        _sync_with_store()
+
+        # The forms about to be submitted were rendered from these frames
+        st.session_state.rendered_tables = {name: st.session_state[name] for name in TABLE_NAMES if name in st.session_state}
+        if st.session_state.get("data_generation") != _data_cache["generation"]:
+            # The session is behind: give it the current copy of every loaded table
+            _copy_cache_to_session()
+
+        _ensure_loaded(tables or TABLE_NAMES)
+        _register_session()
+
+def ensure_tables(*tables):
+    """Makes the given tables available in st.session_state, loading them on first use."""
+    with _cache_lock:
+        _ensure_loaded(tables)
+        _register_session()
+
+def _sync_with_store():
+    """Reloads the cached tables if another process has written the store. Caller holds _cache_lock."""
+    signature = _storage.signature()
+    # While the background writer is behind, memory is newer than the store
+    if signature == _data_cache["signature"] or _writer.busy():
+        return
+    _data_cache["generation"] += 1
+    if _data_cache["frames"]:
+        _data_cache["frames"], _data_cache["journal_records"] = _read_store(list(_data_cache["frames"]))
+        _bump_versions(_data_cache["frames"])
+    _data_cache["signature"] = signature
+
+def _copy_cache_to_session():
+    """Gives the session a shallow copy of every loaded table. Caller holds _cache_lock."""
+    for name, df in _data_cache["frames"].items():
+        st.session_state[name] = df.copy(deep=False)
+    st.session_state.data_generation = _data_cache["generation"]
+
+def _ensure_loaded(tables):
+    """Loads missing tables into the cache and the session. Caller holds _cache_lock."""
+    _ensure_cached(tables)
+    for name in tables:
+        if name not in st.session_state:
+            st.session_state[name] = _data_cache["frames"][name].copy(deep=False)
+
+def _ensure_cached(tables):
+    """Loads missing tables into the cache. Caller holds _cache_lock."""
+    missing = [name for name in tables if name not in _data_cache["frames"]]
+    if missing:
+        if not _storage.lazy_tables:
+            # The backend reads everything at once anyway, so keep all of it
+            missing = [name for name in TABLE_NAMES if name not in _data_cache["frames"]]
+        frames, replayed = _read_store(missing)
+        _data_cache["frames"].update(frames)
+        _bump_versions(frames)
+        _data_cache["journal_records"] = max(_data_cache["journal_records"], replayed)
+
+def _bump_versions(tables):
+    """Marks tables as changed (see cached_view). Caller holds _cache_lock."""
+    for name in tables:
+        _data_cache["versions"][name] = _data_cache["versions"].get(name, 0) + 1
+
+def _read_store(tables):
+    """
+    Reads the given tables from the storage backend and returns a tuple of
+    (dict of typed DataFrames, number of replayed journal records).
+    Falls back to empty DataFrames if the store is missing or cannot be decoded.
+    """
+    try:
+        return _load_frames(tables)
+    except json.JSONDecodeError:
+        st.error("Error decoding data file. Starting with empty data.")
+    except Exception as e:
+        st.error(f"An unexpected error occurred while loading data: {e}. Starting with empty data.")
+    return _initialize_empty_data(tables), 0
+
+def _load_frames(tables):
+    """Like _read_store, but raises on errors (used by the writer, which must never write empty fallbacks)."""
+    # Always start from empty DataFrames with their full column structure
+    frames = _initialize_empty_data(tables)
+    data, replayed = _storage.load(tables)
+
+    # Activity logs saved inside case rows move to the activity store
+    if "cases" in tables and len(data.get("cases", [])):
+        _import_activity_logs(data["cases"])
+
+    # Build typed DataFrames for the tables that have data; the others stay empty.
+    # Columnar backends and streamed JSON loads return frames that are already typed.
+    for name in tables:
+        rows = data.get(name)
+        if isinstance(rows, pd.DataFrame):
+            if not rows.empty:
+                frames[name] = rows[TABLE_COLUMNS[name]]
+        elif rows:
+            frames[name] = build_table(name, rows)
+    # If the store is empty, the empty DataFrames are returned as-is.
+    return frames, replayed
+
+def _import_activity_logs(cases):
+    """Moves the legacy activity_log column of stored cases (records or a typed frame) into the activity store."""
+    if isinstance(cases, pd.DataFrame):
+        if "activity_log" not in cases.columns:
+            return
+        cases = cases[["case_id", "activity_log"]].to_dict(orient="records")
+    import_case_logs(cases)
+
+def _initialize_empty_data(tables=TABLE_NAMES):
+    """Returns a dict of empty DataFrames with the columns and dtypes of the schema registry."""
+    return {name: empty_table(name) for name in tables}
+
+def _apply_changes(frames, changes):
+    """
+    Applies change records to a mapping of table name -> DataFrame by replacing
+    the affected frames. Works on both st.session_state and the cached frames dict.
+    """
+    for change in changes:
+        table, key = change["table"], change["key"]
+        key_col = TABLE_KEYS[table]
+        df = frames[table]
+        if change["op"] == "insert":
+            new_row = coerce_table(table, pd.DataFrame([change["fields"]], columns=df.columns))
+            frames[table] = concat_tables(table, [df, new_row]) if not df.empty else new_row
+        elif change["op"] == "update":
+            df = df.copy(deep=False) # Frames are shared with sessions: replace the updated columns, never write into them
+            rows = df[key_col] == key
+            for col, value in change["fields"].items():
+                value = to_column_value(table, col, value)
+                column = df[col].copy()
+                if isinstance(column.dtype, pd.CategoricalDtype) and value is not None and value not in column.cat.categories:
+                    column = column.cat.add_categories([value])
+                column[rows] = value
+                df[col] = column
+            frames[table] = df
+        elif change["op"] == "delete":
+            frames[table] = df[df[key_col] != key].reset_index(drop=True)
+
+# --- Change Tracking ---
+def _plain_values(column):
+    """Object array of a column with missing values as None, so == compares every dtype alike."""
+    return column.astype(object).where(column.notna(), None).to_numpy()
+
+def _diff_table(name, old, new):
+    """Returns the change records that turn one version of a table into another."""
+    key_col = TABLE_KEYS[name]
+    old_rows, new_rows = old.set_index(key_col, drop=False), new.set_index(key_col, drop=False)
+    changes = [make_change(name, "delete", to_record_value(name, key_col, key)) for key in old_rows.index.difference(new_rows.index)]
+    for key in new_rows.index.difference(old_rows.index):
+        row = new_rows.loc[key]
+        changes.append(make_change(name, "insert", to_record_value(name, key_col, key),
+                                   {col: to_record_value(name, col, row[col]) for col in TABLE_COLUMNS[name]}))
+    common = old_rows.index.intersection(new_rows.index)
+    updates = {}
+    for col in TABLE_COLUMNS[name]:
+        before, after = _plain_values(old_rows.loc[common, col]), _plain_values(new_rows.loc[common, col])
+        for key, value in zip(common[before != after], after[before != after]):
+            updates.setdefault(to_record_value(name, key_col, key), {})[col] = to_record_value(name, col, value)
+    changes += [make_change(name, "update", key, fields) for key, fields in updates.items()]
+    return changes
+
+def _find_row(df, table, key):
+    """The row with the given key as a dict, or None (also when the table is not loaded)."""
+    if df is None:
+        return None
+    rows = df[df[TABLE_KEYS[table]] == key]
+    return None if rows.empty else rows.iloc[0].to_dict()
+
+def _same_value(stored, value):
+    """Equality of a stored value and a submitted one, treating None/NaN/NA/NaT as equal."""
+    stored_missing = stored is None or pd.isna(stored)
+    value_missing = value is None or pd.isna(value)
+    if stored_missing or value_missing:
+        return stored_missing and value_missing
+    return bool(stored == value)
+
+def form_base(table, key):
+    """
+    The row of a table as this session's edit form first displayed it (None if there is
+    no such row). Call it on every run that renders the form and pass the result as the
+    base of the form's change records (make_change(..., base=...)). The row is kept until
+    save_data accepts or rejects a change to it, or the form switches to another row.
+    """
+    bases = st.session_state.setdefault("form_bases", {}) # Table -> (key, row)
+    if table not in bases or bases[table][0] != key:
+        bases[table] = (key, _find_row(st.session_state.get(table), table, key))
+    return bases[table][1]
+
+def _forget_form_bases(changes):
+    """Drops the form bases of the rows of changes, so the forms show the rows afresh."""
+    bases = st.session_state.get("form_bases", {})
+    for change in changes:
+        if change["table"] in bases and bases[change["table"]][0] == change["key"]:
+            del bases[change["table"]]
+
+def _merge_changes(changes, frames, rendered):
+    """
+    Three-way merge of a session's changes with frames (the cache, or the store when the
+    writer checks them). For every field, the value the session displayed (the change's
+    base, or else its row in rendered), the value it submits and the current value are
+    compared: unchanged fields are dropped so other sessions' edits survive, and a field
+    that both sides changed to different values is a conflict.
+    Returns (changes to apply, descriptions of the conflicts).
+    """
+    merged, conflicts = [], []
+    for change in changes:
+        table, key, op = change["table"], change["key"], change["op"]
+        current = _find_row(frames.get(table), table, key)
+        base = change["base"] if "base" in change else _find_row(rendered.get(table), table, key)
+        if op == "insert":
+            if current is not None:
+                conflicts.append(f"{table} #{key}: ID already in use")
+                continue
+        elif op == "update":
+            if current is None:
+                conflicts.append(f"{table} #{key}: deleted by another user")
+                continue
+            fields = {}
+            for field, value in change["fields"].items():
+                value = to_column_value(table, field, value)
+                if base is not None and _same_value(base[field], value):
+                    continue # Submitted as displayed: not edited in this session
+                if base is not None and not _same_value(base[field], current[field]) and not _same_value(current[field], value):
+                    conflicts.append(f"{table} #{key}: {field} changed by another user")
+                fields[field] = change["fields"][field]
+            if not fields:
+                continue
+            change = dict(change, fields=fields)
+        elif op == "delete":
+            if current is None:
+                continue # Already deleted elsewhere
+            if base is not None and any(not _same_value(base[col], current[col]) for col in TABLE_COLUMNS[table]):
+                conflicts.append(f"{table} #{key}: changed by another user")
+                continue
+        merged.append(change)
+    return merged, conflicts
+
+# --- Saving ---
+def save_data(changes=None):
+    """
+    Persists application data from st.session_state.
+
+    changes: optional list of change records (see journal.make_change) describing
+    the mutation. They are applied to the session and cached DataFrames and, when
+    the backend supports it (SQLite, or JSON with the journal enabled), persisted
+    row by row so the cost of a save is proportional to the change. Without change
+    records the session's DataFrames are diffed against the ones it last displayed.
+
+    Saves that would overwrite a field another user changed after this session
+    displayed it are rejected: the session is refreshed and a warning is shown.
+    Returns True if the save was accepted.
+
+    The write itself is queued on the background writer, so this returns as soon
+    as the in-memory data is updated; call flush_data() to wait for the disk.
+    """
+    problems = [problem for change in changes or [] for problem in validate_change(change)]
+    if problems:
+        _reject_save("Error saving data: " + "; ".join(problems))
+        return False
+
+    with _cache_lock:
+        _sync_with_store()
+        rendered = st.session_state.get("rendered_tables", {})
+        if changes is None:
+            changes = [
+                change for name, df in rendered.items() if name in st.session_state
+                for change in _diff_table(name, df, st.session_state[name])
+            ]
+        else:
+            _ensure_loaded(sorted({change["table"] for change in changes}))
+
+        _forget_form_bases(changes)
+        changes, conflicts = _merge_changes(changes, _data_cache["frames"], rendered)
+        if conflicts:
+            _copy_cache_to_session()
+            _reject_save(f"{CONFLICT_MESSAGE} ({'; '.join(conflicts)})")
+            return False
+        if not changes:
+            return True
+
+        _data_cache["generation"] += 1
+        previous = dict(_data_cache["frames"])
+        _apply_changes(_data_cache["frames"], changes)
+        _bump_versions({change["table"] for change in changes})
+        _update_search_indexes(previous, changes)
+        _update_lookups(previous, changes)
+        for change in changes:
+            if change["table"] == "cases" and change["op"] == "delete":
+                purge_case_activities(change["key"]) # Only once the delete is accepted
+        # Share the new frames (with any other sessions' changes) instead of applying the changes twice
+        _copy_cache_to_session()
+        for table in {change["table"] for change in changes} & set(rendered):
+            rendered[table] = st.session_state[table] # A second save in the same run starts from this one
+        _register_session()
+        session = _session_id()
+        _writer.submit(changes=[dict(change, session=session) if "base" in change else change for change in changes])
+    return True
+
+# --- Search Indexes ---
+# One index per searchable table (see search_index.SEARCH_FIELDS), built from the cached
+# frame on the first search and then kept up to date with the change records of every
+# save. When the cached frame is replaced any other way (reload, archiving), the index
+# notices that it no longer reflects the current frame and is rebuilt on the next search.
+_search_indexes = {table: SearchIndex(fields) for table, fields in SEARCH_FIELDS.items()}
+
+def search_records(table, query):
     """
-    # Always initialize empty DataFrames with their full column structure first
-    _initialize_empty_data()
+    Keys of the rows of a table whose indexed fields contain every word of query, with
+    Arabic spelling variants matching each other. Returns None for an empty query.
+    """
+    with _cache_lock:
+        return _current_index(table).search(query)
+
+def _current_index(table):
+    """The index of a table, (re)built if it does not reflect the cached frame. Caller holds _cache_lock."""
+    index = _search_indexes[table]
+    _ensure_cached([table])
+    df = _data_cache["frames"][table]
+    if index.frame is not df:
+        index.build(df, TABLE_KEYS[table])
+    return index
+
+def search_all(query, limit=GLOBAL_SEARCH_LIMIT):
+    """
+    The best matches of query across every indexed table and the case activities, best
+    first: [{"table", "key", "score"}], with "entry" (the activity) for table "activities".
+    """
+    hits = []
+    for table in _search_indexes:
+        with _cache_lock:
+            ranked = _current_index(table).ranked(query, limit)
+        hits.extend({"table": table, "key": key, "score": score} for score, key in ranked)
+    for score, entry in search_activities(query, limit):
+        if entry["case_id"] in _search_indexes["cases"]: # Skip activities of archived cases
+            hits.append({"table": "activities", "key": entry["case_id"], "score": score, "entry": entry})
+    hits.sort(key=lambda hit: hit["score"], reverse=True) # Stable: ties keep the table order
+    return hits[:limit]
+
+def _update_search_indexes(previous, changes):
+    """Applies saved changes to the indexes that were current before them. Caller holds _cache_lock."""
+    for table, index in _search_indexes.items():
+        if index.frame is not None and index.frame is previous.get(table):
+            index.apply_changes([change for change in changes if change["table"] == table], _data_cache["frames"][table])
+
+# --- Lookups ---
+# {key: value} maps of one column of a table (client_id -> name, case_id -> case_name,
+# case_id -> client_id, ...) for selectbox labels and display joins, shared by all sessions.
+# A map is built from the cached frame on first use and updated from the change records of
+# each save; any other replacement of the frame makes it rebuild on the next use. The
+# returned dicts are never modified once handed out (updates work on a copy).
+_lookups = {} # (table, column) -> (frame the map reflects, {key: value})
+
+def lookup(table, column):
+    """{key: value of column} over the rows of a table. Treat the result as read-only."""
+    with _cache_lock:
+        _ensure_cached([table])
+        df = _data_cache["frames"][table]
+        cached = _lookups.get((table, column))
+        if cached is None or cached[0] is not df:
+            cached = _lookups[(table, column)] = (df, dict(zip(df[TABLE_KEYS[table]].tolist(), df[column].tolist())))
+        return cached[1]
+
+def _update_lookups(previous, changes):
+    """Applies saved changes to the lookup maps of the changed tables. Caller holds _cache_lock."""
+    for (table, column), (frame, mapping) in list(_lookups.items()):
+        if frame is not previous.get(table) or frame is _data_cache["frames"][table]:
+            continue # Stale (rebuilt on next use) or not changed by this save
+        mapping = dict(mapping)
+        for change in changes:
+            if change["table"] != table:
+                continue
+            if change["op"] == "delete":
+                mapping.pop(change["key"], None)
+            elif change["op"] == "insert" or column in change["fields"]:
+                mapping[change["key"]] = change["fields"].get(column)
+        _lookups[(table, column)] = (_data_cache["frames"][table], mapping)
+
+# --- Display Frames ---
+# Views prepare display frames from several tables (joined names, Arabic column labels,
+# plain dates). cached_view keeps the latest result of each view with the versions of the
+# tables it was built from, so reruns and other sessions reuse it until one of those
+# tables changes. Results are shared: callers must not modify them.
+_views = {} # View name -> (table versions + extra key, result)
+
+def table_version(table):
+    """Counter that changes whenever the cached frame of a table is replaced."""
+    with _cache_lock:
+        return _data_cache["versions"].get(table, 0)
+
+def cached_view(name, tables, build, extra=()):
+    """
+    build({table: cached frame}) for the current versions of tables, computed only when
+    one of them (or extra, e.g. today's date for date-dependent columns) has changed.
+    """
+    with _cache_lock:
+        _ensure_cached(tables)
+        key = tuple(_data_cache["versions"].get(table, 0) for table in tables) + tuple(extra)
+        frames = {table: _data_cache["frames"][table] for table in tables}
+        cached = _views.get(name)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    result = build(frames) # Outside the lock; frames are never modified in place
+    with _cache_lock:
+        _views[name] = (key, result)
+    return result
+
+# --- Archiving ---
+# Archived rows leave the working set: they are deleted from the store like any other
+# save and kept in the cold archive (see archive.py). Both directions write the copy
+# that survives first (the archive when archiving, the store when restoring), so a
+# crash in between leaves a row in both places; the next run of either cleans it up.
+# Rows of other tables that refer to a client or a case: (table, ID column, (type column,
+# type value) the row must also have, or None). A referenced row can't be deleted while
+# a working-set or archived row refers to it, and an archived row is only restored when
+# the rows it refers to are in the working set.
+REFERENCES = {
+    "clients": [("cases", "client_id", None), ("invoices", "client_id", None),
+                ("reminders", "related_id", ("related_type", "عميل")), ("time_entries", "client_id", None)],
+    "cases": [("invoices", "case_id", None), ("reminders", "related_id", ("related_type", "قضية")), ("time_entries", "case_id", None)],
+}
+
+def _referring(df, column, condition, keys):
+    """Mask of the rows of df whose column holds one of keys (and that meet condition)."""
+    mask = df[column].isin(keys)
+    if condition is not None:
+        mask &= df[condition[0]] == condition[1]
+    return mask
+
+def is_referenced(table, key):
+    """True if a working-set or archived row refers to the given client or case."""
+    references = REFERENCES.get(table, [])
+    with _store_lock, _cache_lock:
+        _sync_with_store()
+        _ensure_cached([name for name, _, _ in references])
+        for name, column, condition in references:
+            frames = [_data_cache["frames"][name]] + ([load_archive(name)] if name in ARCHIVE_RULES else [])
+            if any(_referring(df, column, condition, [key]).any() for df in frames):
+                return True
+    return False
+
+def _orphans(table, rows):
+    """Mask of rows (of table) that refer to a client or case missing from the working set. Caller holds _cache_lock."""
+    mask = pd.Series(False, index=rows.index)
+    for parent, references in REFERENCES.items():
+        for name, column, condition in references:
+            if name == table:
+                _ensure_cached([parent])
+                refers = rows[column].notna() & (rows[column] != 0) # 0: not linked (older data)
+                if condition is not None:
+                    refers &= rows[condition[0]] == condition[1]
+                mask |= refers & ~rows[column].isin(_data_cache["frames"][parent][TABLE_KEYS[parent]])
+    return mask
+
+def archive_old_records(today=None):
+    """Moves the rows matching config.ARCHIVE_RULES into the archive. Returns {table: rows archived}."""
+    archived = {}
+    with _store_lock, _cache_lock:
+        _sync_with_store()
+        _ensure_cached(list(ARCHIVE_RULES))
+        changes = []
+        for table in ARCHIVE_RULES:
+            df = _data_cache["frames"][table]
+            mask = cold_rows(table, df, today)
+            if not mask.any():
+                continue
+            cold = df[mask].reset_index(drop=True)
+            add_to_archive(table, cold)
+            _data_cache["frames"][table] = df[~mask].reset_index(drop=True)
+            _bump_versions([table])
+            key_col = TABLE_KEYS[table]
+            changes += [make_change(table, "delete", to_record_value(table, key_col, key)) for key in cold[key_col]]
+            archived[table] = len(cold)
+        if changes:
+            _data_cache["generation"] += 1
+            _writer.submit(changes=changes)
+    return archived
+
+def restore_archived(table, keys):
+    """
+    Moves archived rows back into the working set. Returns (number of rows restored,
+    keys left in the archive because a working-set row already uses that ID, keys left
+    in the archive because the client or case they refer to is not in the working set).
+    """
+    with _store_lock, _cache_lock:
+        _sync_with_store()
+        _ensure_cached([table])
+        key_col = TABLE_KEYS[table]
+        rows = load_archive(table)
+        hot = _data_cache["frames"][table]
+        rows = rows[rows[key_col].isin(keys)]
+        taken = rows[key_col].isin(hot[key_col])
+        conflicting = [to_record_value(table, key_col, key) for key in rows.loc[taken, key_col]]
+        rows = rows[~taken]
+        orphan = _orphans(table, rows)
+        orphaned = [to_record_value(table, key_col, key) for key in rows.loc[orphan, key_col]]
+        rows = rows[~orphan].reset_index(drop=True)
+        if not rows.empty:
+            _data_cache["frames"][table] = concat_tables(table, [hot, rows]) if not hot.empty else rows
+            _bump_versions([table])
+            _data_cache["generation"] += 1
+            _writer.submit(changes=[
+                make_change(table, "insert", record[key_col], record) for record in encode_table(table, rows)
+            ])
+    # The rows must be in the store before they leave the archive
+    if rows.empty or not flush_data(LOCK_TIMEOUT_SECONDS) or _writer.last_error is not None:
+        return len(rows), conflicting, orphaned
+    with _store_lock:
+        remove_from_archive(table, rows[key_col].tolist())
+    return len(rows), conflicting, orphaned
+
+def max_id(table):
+    """Highest ID of a table in the store or its archive (0 if there are none), for seeding and checking ID sequences."""
+    key_col = TABLE_KEYS[table]
+    with _store_lock, _cache_lock:
+        _sync_with_store()
+        _ensure_cached([table])
+        ids = [_data_cache["frames"][table][key_col].max(), load_archive(table)[key_col].max()]
+    return max([int(value) for value in ids if not pd.isna(value)], default=0)
+
+# --- Snapshots ---
+# Backups are taken on a timer thread, holding the store lock so every process sees one
+# consistent chain: a full snapshot of every table, the archive and the activity log,
+# then increments with just the rows that changed (found by diffing against the data of
+# the previous snapshot, kept here) and the activities appended since.
+_snapshots = SnapshotStore()
+_snapshot_state = {"name": None, "frames": None, "activity_log": None, "thread": None} # Newest snapshot, its data and [file ID, size] of the log it covers
+
+def take_snapshot(full=False):
+    """
+    Saves an incremental (or full) snapshot of the store unless nothing changed since
+    the previous one. Returns the snapshot file name, or None if none was needed.
+    """
+    with _store_lock:
+        with _cache_lock:
+            store_is_ours = _storage.signature() == _data_cache["signature"]
+            frames = dict(_data_cache["frames"]) if store_is_ours else {}
+        missing = [name for name in TABLE_NAMES if name not in frames]
+        if missing:
+            frames.update(_load_frames(missing)[0])
+        frames.update({ARCHIVE_PREFIX + table: load_archive(table) for table in ARCHIVE_RULES})
 
-    if os.path.exists(DATA_FILE):
+        latest = _snapshots.latest()
+        if latest is not None and latest[2] != _snapshot_state["name"]:
+            # Taken by another process (or before a restart): rebuild its data from the chain
+            records, _ = _snapshots.records_at(latest[0])
+            _snapshot_state["frames"] = {name: build_table(store_table(name), records.get(name) or []) for name in SNAPSHOT_TABLES} if records else None
+            log = (records or {}).get("activities")
+            _snapshot_state["activity_log"] = [log["file"], log["size"]] if log else None
+            _snapshot_state["name"] = latest[2]
+
+        base, covered = _snapshot_state["frames"], _snapshot_state["activity_log"]
+        if covered is not None:
+            file_id, size, entries = activity_log_since(covered[1])
+            if file_id != covered[0]:
+                covered = None # The log was replaced (restored) since: start a new chain
+        if full or base is None or covered is None or _snapshots.needs_full():
+            file_id, size, entries = activity_log_since(0)
+            records = {name: encode_table(store_table(name), frames[name]) for name in SNAPSHOT_TABLES}
+            records["activities"] = {"file": file_id, "size": size, "entries": entries}
+            name = _snapshots.write_full(records)
+            _snapshots.prune()
+        else:
+            # Unchanged tables are still the very same (immutable) frame objects
+            changes = [
+                dict(change, table=name) for name in SNAPSHOT_TABLES if frames[name] is not base[name]
+                for change in _diff_table(store_table(name), base[name], frames[name])
+            ]
+            if entries:
+                changes.append(activity_change(file_id, size, entries))
+            if not changes:
+                return None
+            name = _snapshots.write_increment(changes)
+        _snapshot_state["name"], _snapshot_state["frames"], _snapshot_state["activity_log"] = name, frames, [file_id, size]
+        return name
+
+def _snapshot_loop():
+    while True:
+        time.sleep(SNAPSHOT_INTERVAL_SECONDS)
+        latest = _snapshots.latest()
+        if latest is not None and (datetime.now() - latest[0]).total_seconds() < SNAPSHOT_INTERVAL_SECONDS * 0.9:
+            continue # Another process took one recently
         try:
-            with open(DATA_FILE, "r", encoding="utf-8") as f:
-                data = json.load(f)
-
-            # Load data into already structured DataFrames, if data exists in JSON
-            # Then, ensure all expected columns are present in the loaded DataFrame
-            # before type conversions.
-
-            # Clients
-            if data.get("clients"):
-                loaded_clients_df = pd.DataFrame(data["clients"])
-                for col in st.session_state.clients.columns: # Iterate over expected columns
-                    if col not in loaded_clients_df.columns:
-                        loaded_clients_df[col] = None # Add missing column with None
-                st.session_state.clients = loaded_clients_df
-            
-            # Cases
-            if data.get("cases"):
-                loaded_cases_df = pd.DataFrame(data["cases"])
-                for col in st.session_state.cases.columns:
-                    if col not in loaded_cases_df.columns:
-                        loaded_cases_df[col] = None
-                st.session_state.cases = loaded_cases_df
-
-            # Invoices
-            if data.get("invoices"):
-                loaded_invoices_df = pd.DataFrame(data["invoices"])
-                for col in st.session_state.invoices.columns:
-                    if col not in loaded_invoices_df.columns:
-                        loaded_invoices_df[col] = None
-                st.session_state.invoices = loaded_invoices_df
-
-            # Reminders
-            if data.get("reminders"):
-                loaded_reminders_df = pd.DataFrame(data["reminders"])
-                for col in st.session_state.reminders.columns:
-                    if col not in loaded_reminders_df.columns:
-                        loaded_reminders_df[col] = None
-                st.session_state.reminders = loaded_reminders_df
-            
-            # Users
-            if data.get("users"):
-                loaded_users_df = pd.DataFrame(data["users"])
-                for col in st.session_state.users.columns:
-                    if col not in loaded_users_df.columns:
-                        loaded_users_df[col] = None
-                st.session_state.users = loaded_users_df
-
-            # Time Entries (NEW)
-            if data.get("time_entries"):
-                loaded_time_entries_df = pd.DataFrame(data["time_entries"])
-                for col in st.session_state.time_entries.columns:
-                    if col not in loaded_time_entries_df.columns:
-                        loaded_time_entries_df[col] = None
-                st.session_state.time_entries = loaded_time_entries_df
-
-
-            # Apply type conversions only if the DataFrames are not empty after loading
-            # Clients
-            if not st.session_state.clients.empty:
-                st.session_state.clients['client_id'] = st.session_state.clients['client_id'].astype(int)
-                st.session_state.clients['type'] = st.session_state.clients['type'].fillna('فرد')
-                st.session_state.clients['address'] = st.session_state.clients['address'].fillna('')
-                st.session_state.clients['company_name'] = st.session_state.clients['company_name'].fillna('')
-                st.session_state.clients['secondary_contact'] = st.session_state.clients['secondary_contact'].fillna('')
-
-
-            # Cases
-            if not st.session_state.cases.empty:
-                st.session_state.cases['case_id'] = st.session_state.cases['case_id'].astype(int)
-                st.session_state.cases['client_id'] = st.session_state.cases['client_id'].astype(int)
-                st.session_state.cases['court_date'] = pd.to_datetime(st.session_state.cases['court_date'], errors='coerce').dt.date
-                st.session_state.cases['court_date'] = st.session_state.cases['court_date'].fillna(datetime.today().date())
-                st.session_state.cases['priority'] = st.session_state.cases['priority'].fillna('متوسطة')
-                # Deserialize activity log
-                st.session_state.cases['activity_log'] = st.session_state.cases['activity_log'].apply(lambda x: json.loads(x) if isinstance(x, str) else [])
-
-
-            # Invoices
-            if not st.session_state.invoices.empty:
-                st.session_state.invoices['invoice_id'] = st.session_state.invoices['invoice_id'].astype(int)
-                st.session_state.invoices['client_id'] = st.session_state.invoices['client_id'].astype(int)
-                if 'case_id' in st.session_state.invoices.columns:
-                    st.session_state.invoices['case_id'] = st.session_state.invoices['case_id'].fillna(0).astype(int)
-                st.session_state.invoices['amount'] = st.session_state.invoices['amount'].astype(float)
-                st.session_state.invoices['paid'] = st.session_state.invoices['paid'].astype(bool)
-                st.session_state.invoices['date'] = pd.to_datetime(st.session_state.invoices['date'], errors='coerce').dt.date
-                st.session_state.invoices['date'] = st.session_state.invoices['date'].fillna(datetime.today().date())
-                st.session_state.invoices['due_date'] = pd.to_datetime(st.session_state.invoices['due_date'], errors='coerce').dt.date
-                st.session_state.invoices['due_date'] = st.session_state.invoices['due_date'].fillna(datetime.today().date() + timedelta(days=30))
-
-            # Reminders
-            if not st.session_state.reminders.empty:
-                st.session_state.reminders['reminder_id'] = st.session_state.reminders['reminder_id'].astype(int)
-                st.session_state.reminders['related_id'] = st.session_state.reminders['related_id'].astype(int)
-                st.session_state.reminders['date'] = pd.to_datetime(st.session_state.reminders['date'], errors='coerce').dt.date
-                st.session_state.reminders['date'] = st.session_state.reminders['date'].fillna(datetime.today().date())
-                st.session_state.reminders['is_completed'] = st.session_state.reminders['is_completed'].astype(bool)
-            
-            # Time Entries (NEW)
-            if not st.session_state.time_entries.empty:
-                st.session_state.time_entries['entry_id'] = st.session_state.time_entries['entry_id'].astype(int)
-                st.session_state.time_entries['client_id'] = st.session_state.time_entries['client_id'].astype(int)
-                st.session_state.time_entries['case_id'] = st.session_state.time_entries['case_id'].fillna(0).astype(int)
-                st.session_state.time_entries['hours'] = st.session_state.time_entries['hours'].astype(float)
-                st.session_state.time_entries['date'] = pd.to_datetime(st.session_state.time_entries['date'], errors='coerce').dt.date
-                st.session_state.time_entries['date'] = st.session_state.time_entries['date'].fillna(datetime.today().date())
-
-
-        except json.JSONDecodeError:
-            st.error("Error decoding data file. Starting with empty data.")
+            take_snapshot()
         except Exception as e:
-            st.error(f"An unexpected error occurred while loading data: {e}. Starting with empty data.")
-    # If DATA_FILE doesn't exist, _initialize_empty_data() already set the session state.
-
-def _initialize_empty_data():
-    """Initializes empty DataFrames in session state with predefined columns."""
-    st.session_state.clients = pd.DataFrame(columns=["client_id", "name", "phone", "email", "notes", "type", "address", "company_name", "secondary_contact"])
-    st.session_state.cases = pd.DataFrame(columns=["case_id", "client_id", "case_name", "case_type", "status", "court_date", "opposing_party", "case_description", "responsible_lawyer", "notes", "priority", "activity_log"])
-    st.session_state.invoices = pd.DataFrame(columns=["invoice_id", "client_id", "case_id", "amount", "paid", "date", "due_date"])
-    st.session_state.reminders = pd.DataFrame(columns=["reminder_id", "related_type", "related_id", "description", "date", "is_completed"])
-    st.session_state.users = pd.DataFrame(columns=["username", "password"])
-    st.session_state.time_entries = pd.DataFrame(columns=["entry_id", "client_id", "case_id", "date", "hours", "category", "description"]) # NEW
-
-
-def save_data():
-    """
-    Saves current application data from st.session_state to a JSON file.
-    Converts date objects to strings for JSON serialization.
-    Serializes complex objects like activity_log.
-    """
-    # Convert date objects in DataFrames to string format for JSON serialization
-    clients_data = st.session_state.clients.to_dict(orient="records")
-    
-    cases_data = st.session_state.cases.copy()
-    if not cases_data.empty:
-        cases_data['court_date'] = cases_data['court_date'].apply(lambda x: x.isoformat() if isinstance(x, date) else x)
-        # Serialize activity log to JSON string
-        cases_data['activity_log'] = cases_data['activity_log'].apply(lambda x: json.dumps(x) if isinstance(x, list) else '[]')
-    cases_data = cases_data.to_dict(orient="records")
-
-    invoices_data = st.session_state.invoices.copy()
-    if not invoices_data.empty:
-        invoices_data['date'] = invoices_data['date'].apply(lambda x: x.isoformat() if isinstance(x, date) else x)
-        invoices_data['due_date'] = invoices_data['due_date'].apply(lambda x: x.isoformat() if isinstance(x, date) else x)
-    invoices_data = invoices_data.to_dict(orient="records")
-
-    reminders_data = st.session_state.reminders.copy()
-    if not reminders_data.empty:
-        reminders_data['date'] = reminders_data['date'].apply(lambda x: x.isoformat() if isinstance(x, date) else x)
-    reminders_data = reminders_data.to_dict(orient="records")
-
-    users_data = st.session_state.users.to_dict(orient="records")
-
-    time_entries_data = st.session_state.time_entries.copy() # NEW
-    if not time_entries_data.empty:
-        time_entries_data['date'] = time_entries_data['date'].apply(lambda x: x.isoformat() if isinstance(x, date) else x)
-    time_entries_data = time_entries_data.to_dict(orient="records")
-
-
-    data = {
-        "clients": clients_data,
-        "cases": cases_data,
-        "invoices": invoices_data,
-        "reminders": reminders_data,
-        "users": users_data,
-        "time_entries": time_entries_data # NEW
-    }
-    
+            print(f"Snapshot failed: {e}")
+
+def _start_snapshots():
+    """Starts the snapshot timer thread once per process."""
+    if _snapshot_state["thread"] is None:
+        _snapshot_state["thread"] = threading.Thread(target=_snapshot_loop, name="mojaz-snapshots", daemon=True)
+        _snapshot_state["thread"].start()
+
+# --- Memory Report ---
+def _session_id():
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx is not None else "local"
+
+def _register_session():
+    """Notes the current session's frames (weakly, so ended sessions drop out). Caller holds _cache_lock."""
+    _session_frames[_session_id()] = weakref.WeakValueDictionary(
+        {name: st.session_state[name] for name in TABLE_NAMES if name in st.session_state}
+    )
+
+def _shares_column(a, b):
+    """True if two columns are backed by the same data (e.g. a shallow copy whose column was not replaced)."""
+    if isinstance(a.dtype, np.dtype):
+        return np.shares_memory(a.to_numpy(), b.to_numpy())
+    return a.array is b.array # Extension arrays (Int32, Categorical) are shared by reference
+
+def _private_bytes(name, df):
+    """Bytes of a session's frame that are not shared with the cached frame of the same table."""
+    cached = _data_cache["frames"].get(name)
+    return int(sum(
+        df[col].memory_usage(deep=True, index=False) for col in df.columns
+        if cached is None or col not in cached.columns or not _shares_column(df[col], cached[col])
+    ))
+
+def memory_report():
+    """
+    Memory held by the process-wide data: {"shared_bytes": bytes of the cached frames,
+    "tables": bytes per cached table, "session_bytes": {session ID: bytes of that
+    session's own (modified) columns}}. Deep object sizes are measured, so this scans
+    every string; call it on demand, not on every rerun.
+    """
+    with _cache_lock:
+        tables = {name: int(df.memory_usage(deep=True).sum()) for name, df in _data_cache["frames"].items()}
+        sessions = {}
+        for session_id, refs in list(_session_frames.items()):
+            frames = dict(refs)
+            if not frames:
+                del _session_frames[session_id] # Session ended and its frames were freed
+                continue
+            sessions[session_id] = sum(_private_bytes(name, df) for name, df in frames.items())
+    return {"shared_bytes": sum(tables.values()), "tables": tables, "session_bytes": sessions}
+
+def _reject_save(message):
+    """Shows why a save was rejected, now and (since callers usually rerun right away) on the next run."""
+    st.error(message)
+    st.session_state.save_notice = message
+
+def flush_data(timeout=None):
+    """Waits until every queued save has reached the store. Returns False on timeout."""
+    return _writer.flush(timeout)
+
+def dirty_tables():
+    """Returns the tables with saves that have not been written to the store yet."""
+    return _writer.pending_tables()
+
+# --- Background Writes ---
+# These run on the writer thread, holding the store lock so writers in other processes
+# wait. Cached frames are replaced, never mutated, after a save, so a reference taken
+# under the cache lock is a consistent snapshot to encode.
+def _discard_changes(changes, error):
+    """
+    Moves a batch the store keeps rejecting to WRITER_FAILED_FILE, so the saves queued
+    behind it can go through. The cache holds changes the store never got, so it is
+    re-read from the store on the next run.
+    """
     try:
-        with open(DATA_FILE, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=4)
+        append_changes([make_change(change["table"], change["op"], change["key"], change["fields"]) for change in changes], WRITER_FAILED_FILE)
     except Exception as e:
-        st.error(f"Error saving data: {e}")
+        print(f"Could not record the failed changes in {WRITER_FAILED_FILE}: {e}")
+    with _cache_lock:
+        _data_cache["failed_saves"] += len(changes)
+        _data_cache["signature"] = None
+
+def _write_changes(changes):
+    """
+    Persists change records. Backends with row writes (SQLite, the JSON journal) store
+    just the changes, which merge with other processes' rows. Other backends rewrite the
+    touched tables; if another process wrote the store since this one last saw it, the
+    tables are re-read from disk and the changes applied on top instead of overwriting.
+    """
+    with _store_lock:
+        with _cache_lock:
+            store_is_ours = _storage.signature() == _data_cache["signature"]
+            frames = dict(_data_cache["frames"])
+        tables = TABLE_NAMES if _storage.whole_store_writes else sorted({change["table"] for change in changes})
+        if not store_is_ours and (not _storage.supports_row_writes or any("base" in change for change in changes)):
+            # Another process wrote the store since save_data merged these changes against the cache
+            frames, _ = _load_frames(tables)
+            changes = _check_against_store(changes, frames)
+        if _storage.supports_row_writes:
+            _storage.apply_changes([make_change(change["table"], change["op"], change["key"], change["fields"]) for change in changes])
+        else:
+            _write_tables(frames, tables)
+
+        with _cache_lock:
+            if _storage.name == "json" and _storage.supports_row_writes:
+                _data_cache["journal_records"] += len(changes)
+                needs_compaction = _data_cache["journal_records"] >= JOURNAL_COMPACT_THRESHOLD
+            else:
+                needs_compaction = False
+        if needs_compaction:
+            # The cached frames may already include saves still queued behind this one; they
+            # are appended to the fresh journal afterwards and replaying them is idempotent.
+            if not store_is_ours:
+                frames, _ = _load_frames(TABLE_NAMES)
+            _write_tables(frames, TABLE_NAMES)
+            with _cache_lock:
+                _data_cache["journal_records"] = 0
+
+        if store_is_ours:
+            # Otherwise the signature stays stale so load_data re-reads the other process' changes
+            with _cache_lock:
+                _data_cache["signature"] = _storage.signature()
+
+def _check_against_store(changes, frames):
+    """
+    Applies changes to frames loaded from the store, one by one, dropping those whose
+    base conflicts with the stored row; their sessions are told on their next run.
+    Returns the changes that were applied. Caller holds _store_lock.
+    """
+    applied = []
+    for change in changes:
+        if "base" in change:
+            merged, conflicts = _merge_changes([change], frames, {})
+            if conflicts:
+                with _cache_lock:
+                    _late_conflicts.setdefault(change.get("session"), []).extend(conflicts)
+                continue
+        else:
+            merged = [change]
+        _apply_changes(frames, merged)
+        applied += merged
+    return applied
+
+def _write_tables(frames, tables):
+    """Re-encodes and writes the given tables (every table for single-document backends)."""
+    if _storage.whole_store_writes:
+        tables = TABLE_NAMES
+    if _storage.typed_frames:
+        _storage.write_tables({name: frames[name] for name in tables})
+    else:
+        _storage.write_tables({name: encode_table(name, frames[name]) for name in tables})
+
+_writer = BackgroundWriter(_write_changes, _discard_changes)
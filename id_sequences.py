@@ -0,0 +1,78 @@
+# id_sequences.py
+
+import json
+import os
+import threading
+
+from config import SEQUENCE_FILE, SEQUENCE_BLOCK_SIZE
+from file_lock import FileLock
+
+# --- Sequence File ---
+# {"clients": 120, "cases": 340, ...}: the highest ID ever reserved per table, across
+# every process. Counters only move forward, so an ID is never reused after its record
+# is deleted (invoices and time entries may still refer to it). Each reservation also
+# checks the counter against the highest ID in the data, so a lost or stale file can't
+# hand out IDs that are already taken.
+
+class IdSequences:
+    """Per-table ID allocator; IDs are reserved from the sequence file in blocks and handed out from memory."""
+
+    def __init__(self, path=SEQUENCE_FILE, block_size=SEQUENCE_BLOCK_SIZE):
+        self.path = path
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        self._file_lock = FileLock(path + ".lock") # Own lock file: reserving IDs must not wait for data writes
+        self._leases = {} # table -> [next free ID, last reserved ID] of this process' current block
+
+    def allocate(self, table, count=1, current_max=None):
+        """
+        Returns a range of count new IDs for a table.
+        current_max: callable returning the highest ID in the table's data (working set
+        and archive); called whenever a block is reserved, and the block starts above it.
+        """
+        with self._lock:
+            lease = self._leases.get(table)
+            if lease is None or lease[1] - lease[0] + 1 < count:
+                start, end = self._reserve(table, max(count, self.block_size), current_max)
+                lease = self._leases[table] = [start, end]
+            first = lease[0]
+            lease[0] += count
+            return range(first, first + count)
+
+    def _reserve(self, table, count, current_max):
+        """Moves the table's counter in the sequence file forward by count and returns the reserved (first, last) IDs."""
+        data_max = int(current_max() or 0) if current_max is not None else 0 # Outside the file lock: may read the store
+        with self._file_lock:
+            sequences = self._read()
+            last = max(sequences.get(table, 0), data_max)
+            sequences[table] = last + count
+            self._write(sequences)
+        return last + 1, last + count
+
+    def _read(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def _write(self, sequences):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(sequences, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path) # Atomic: a crash never leaves a half-written counter file
+
+
+# --- Module-level Allocator ---
+# One allocator per process, shared by all Streamlit sessions.
+_sequences = IdSequences()
+
+def allocate_id(table, current_max=None):
+    """Returns one new ID for a table."""
+    return _sequences.allocate(table, 1, current_max)[0]
+
+def allocate_ids(table, count, current_max=None):
+    """Returns a range of count consecutive new IDs for a table (bulk imports)."""
+    return _sequences.allocate(table, count, current_max)
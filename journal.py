@@ -0,0 +1,93 @@
+# journal.py
+
+import json
+import os
+from datetime import datetime, date
+
+from config import JOURNAL_FILE
+
+# --- Change Records ---
+# A change record describes one mutation of one row:
+#   {"table": "clients", "op": "update", "key": 3, "fields": {"phone": "0500000000"}}
+# "insert" carries the full row in "fields", "update" only the changed columns and
+# "delete" no fields at all. Applying the same record twice has the same effect as
+# applying it once, which keeps journal replay safe after an interrupted compaction.
+# Updates and deletes made from an edit form may also carry "base", the row as the form
+# displayed it (see data_persistence.form_base); it is used to detect conflicting edits
+# and is never written to the store.
+CHANGE_OPS = ("insert", "update", "delete")
+
+def make_change(table, op, key, fields=None, base=None):
+    """Builds a change record for a single row mutation."""
+    if op not in CHANGE_OPS:
+        raise ValueError(f"Unknown change operation: {op}")
+    change = {"table": table, "op": op, "key": key, "fields": fields or {}}
+    if base is not None:
+        change["base"] = base
+    return change
+
+def _json_default(value):
+    """Serializes the non-JSON types that appear in DataFrame rows."""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if hasattr(value, "item"): # NumPy scalars (e.g. IDs produced by next_id)
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def encode_change(change):
+    """Encodes a change record as one compact JSON line."""
+    return json.dumps(change, ensure_ascii=False, separators=(",", ":"), default=_json_default) + "\n"
+
+# --- Journal File ---
+def append_changes(changes, path=JOURNAL_FILE):
+    """
+    Appends change records to the journal and fsyncs it.
+    Cost is proportional to the size of the change, not of the database.
+    """
+    payload = "".join(encode_change(change) for change in changes)
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(payload)
+        f.flush()
+        os.fsync(f.fileno())
+
+def read_changes(path=JOURNAL_FILE):
+    """
+    Returns the list of change records stored in the journal.
+    A torn last line (crash in the middle of an append) is ignored.
+    """
+    if not os.path.exists(path):
+        return []
+    changes = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.endswith("\n"):
+                break # Incomplete trailing record
+            try:
+                changes.append(json.loads(line))
+            except json.JSONDecodeError:
+                break
+    return changes
+
+# --- Replay ---
+def apply_changes_to_records(data, changes, table_keys):
+    """
+    Replays change records onto the raw JSON data ({table: [row dicts]}) in place.
+    Used when loading the snapshot + journal, before DataFrames are built.
+    """
+    indexed = {}
+    for change in changes:
+        table = change["table"]
+        if table not in indexed:
+            key_col = table_keys[table]
+            indexed[table] = {row.get(key_col): row for row in data.get(table) or []}
+        rows = indexed[table]
+        if change["op"] == "insert":
+            rows[change["key"]] = dict(change["fields"])
+        elif change["op"] == "update":
+            if change["key"] in rows:
+                rows[change["key"]].update(change["fields"])
+        elif change["op"] == "delete":
+            rows.pop(change["key"], None)
+    for table, rows in indexed.items():
+        data[table] = list(rows.values())
+    return data
@@ -0,0 +1,191 @@
+# json_stream.py
+
+import json
+import re
+import pandas as pd
+
+from config import STREAM_MEMORY_LIMIT_MB
+from schema import TABLE_COLUMNS, TABLE_KEYS, empty_table, coerce_table, concat_tables
+from activity_store import import_case_logs
+
+# --- Streaming Reader ---
+# DATA_FILE is one JSON object of tables, each a list of row objects:
+#   {"clients": [{"client_id": 1, ...}, ...], "cases": [...], ...}
+# json.load() would materialize the whole document as Python objects (several times the
+# file size) before any DataFrame is built. The reader below walks the document in
+# fixed-size text chunks and decodes one row at a time; the loader buffers the decoded
+# rows and turns them into typed DataFrame chunks whenever the buffered rows reach the
+# memory limit, so peak memory is the typed data plus one bounded batch.
+
+_CHUNK_CHARS = 1 << 20 # Characters read from the file at a time
+_WHITESPACE = re.compile(r"[ \t\r\n]*")
+_SEPARATOR = re.compile(r"[ \t\r\n]*([,\]])[ \t\r\n]*") # Between array elements, with the whitespace around it
+
+# Rough bytes of Python objects (dicts, str, int) per character of row JSON, used to
+# estimate the size of the buffered rows without measuring every object
+_OBJECT_BYTES_PER_CHAR = 6
+
+class _Reader:
+    """Character cursor over a text file that keeps only the unread part of the current chunk in memory."""
+
+    def __init__(self, f):
+        self._file = f
+        self._buffer = ""
+        self._pos = 0
+        self._decoder = json.JSONDecoder()
+
+    def _fill(self):
+        """Reads the next chunk, dropping what was consumed. Returns False at end of file."""
+        chunk = self._file.read(_CHUNK_CHARS)
+        if not chunk:
+            return False
+        self._buffer = self._buffer[self._pos:] + chunk
+        self._pos = 0
+        return True
+
+    def peek(self):
+        """Next non-whitespace character (not consumed), or "" at end of file."""
+        while True:
+            self._pos = _WHITESPACE.match(self._buffer, self._pos).end()
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise json.JSONDecodeError(f"Expected {char!r}", self._buffer, self._pos)
+        self._pos += 1
+
+    def value(self):
+        """Decodes the next JSON value. Returns (value, length of its JSON text)."""
+        if self._pos >= len(self._buffer) or self._buffer[self._pos] in " \t\r\n":
+            self.peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buffer, self._pos)
+            except json.JSONDecodeError:
+                if self._fill():
+                    continue # The value continues in the next chunk
+                raise
+            if end == len(self._buffer) and self._fill():
+                continue # A number or literal may continue in the next chunk
+            length, self._pos = end - self._pos, end
+            return value, length
+
+    def array(self):
+        """Yields (value, length of its JSON text) for each element of the array at the cursor."""
+        self.expect("[")
+        if self.peek() == "]":
+            self._pos += 1
+            return
+        while True:
+            yield self.value()
+            # Fast path: the separator and the start of the next element are already buffered
+            match = _SEPARATOR.match(self._buffer, self._pos)
+            if match is not None and match.end() < len(self._buffer):
+                self._pos = match.end()
+                separator = match.group(1)
+            else:
+                separator = self.peek()
+                self.expect(separator)
+            if separator == "]":
+                return
+            if separator != ",":
+                raise json.JSONDecodeError("Expected ',' or ']'", self._buffer, self._pos)
+
+def iter_rows(f):
+    """Yields (table, row dict, length of the row's JSON text) for every row of a DATA_FILE document."""
+    reader = _Reader(f)
+    if reader.peek() == "":
+        return # Empty file
+    reader.expect("{")
+    if reader.peek() == "}":
+        return
+    while True:
+        table, _ = reader.value()
+        reader.expect(":")
+        if reader.peek() == "[":
+            for row, length in reader.array():
+                yield table, row, length
+        else:
+            reader.value() # Not a list of rows (e.g. null): nothing to load
+        if reader.peek() != ",":
+            break
+        reader.expect(",")
+    reader.expect("}")
+
+# --- Streaming Loader ---
+def _replay(row, changes):
+    """Applies a row's journal changes in order; returns the final row dict, or None if it ends deleted."""
+    for change in changes:
+        if change["op"] == "insert":
+            row = dict(change["fields"])
+        elif change["op"] == "update" and row is not None:
+            row = {**row, **change["fields"]}
+        elif change["op"] == "delete":
+            row = None
+    return row
+
+def load_tables_streaming(f, tables, changes=(), memory_limit_mb=STREAM_MEMORY_LIMIT_MB):
+    """
+    Builds typed DataFrames for the given tables from an open DATA_FILE, replaying
+    journal change records onto the rows as they stream past. Returns {table: DataFrame}.
+
+    memory_limit_mb bounds the (estimated) size of the rows buffered before they are
+    converted into a typed chunk; it does not include the typed frames themselves.
+    """
+    limit = memory_limit_mb * 2**20
+    pending = {} # table -> {key: [changes]} still to replay
+    for change in changes:
+        if change["table"] in tables:
+            pending.setdefault(change["table"], {}).setdefault(change["key"], []).append(change)
+    buffers = {table: [] for table in tables} # Rows not converted yet
+    chunks = {table: [] for table in tables}
+    legacy_logs = [] # Case rows still carrying an embedded activity_log
+    buffered = 0
+
+    def add_row(table, row):
+        buffers[table].append(row)
+        if table == "cases" and row.get("activity_log"):
+            legacy_logs.append({"case_id": row.get("case_id"), "activity_log": row["activity_log"]})
+
+    def flush():
+        for table, rows in buffers.items():
+            if rows:
+                # One DataFrame construction per batch; missing columns become NaN
+                chunks[table].append(coerce_table(table, pd.DataFrame(rows, columns=TABLE_COLUMNS[table])))
+                buffers[table] = []
+        import_case_logs(legacy_logs)
+        legacy_logs.clear()
+
+    for table, row, length in iter_rows(f):
+        if table not in buffers or not isinstance(row, dict):
+            continue
+        row_changes = pending.get(table, {}).pop(row.get(TABLE_KEYS[table]), None)
+        if row_changes:
+            row = _replay(row, row_changes)
+            if row is None:
+                continue
+        add_row(table, row)
+        buffered += length * _OBJECT_BYTES_PER_CHAR
+        if buffered >= limit:
+            flush()
+            buffered = 0
+    # Rows that only exist in the journal
+    for table, rows in pending.items():
+        for row_changes in rows.values():
+            row = _replay(None, row_changes)
+            if row is not None:
+                add_row(table, row)
+    flush()
+
+    frames = {}
+    for table in tables:
+        if not chunks[table]:
+            frames[table] = empty_table(table)
+        elif len(chunks[table]) == 1:
+            frames[table] = chunks[table][0]
+        else:
+            frames[table] = concat_tables(table, chunks[table])
+    return frames
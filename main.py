@@ -1,20 +1,27 @@
 import streamlit as st
 from datetime import datetime, timedelta
+from itertools import groupby
 import pandas as pd
 import base64
 from streamlit_drawable_canvas import st_canvas
 import plotly.express as px # For charts
 
 # Import modular components
-from config import DATA_FILE, AMIRI_FONT_NAME, AMIRI_FONT_PATH, CONTRACT_TYPE_OPTIONS, CASE_STATUS_OPTIONS
-from data_persistence import load_data, save_data
-from pdf_utils import generate_contract_pdf, reshape_arabic, get_font_path
+from config import DATA_FILE, AMIRI_FONT_NAME, AMIRI_FONT_PATH, CASE_STATUS_OPTIONS
+from data_persistence import load_data, ensure_tables, save_data, memory_report, max_id
+from schema import TABLE_KEYS
+from id_sequences import allocate_id
+from contract_templates import contract_type_options, get_template
+from bulk_contracts import template_csv, read_contract_rows, build_contracts_zip
+from pdf_utils import generate_contract_pdf, reshape_arabic, get_font_path, warm_up_fonts, reshape_cache_stats
 from crm_modules import (
     render_client_management,
     render_case_management,
     render_reminder_management,
     render_invoice_management,
-    render_time_tracking # NEW: Import time tracking module
+    render_time_tracking, # NEW: Import time tracking module
+    render_archive_management,
+    render_global_search
 )
 from styles import custom_css
 from auth import authenticate_user # Import authentication function
@@ -35,14 +42,56 @@ st.set_page_config(
 st.markdown(custom_css, unsafe_allow_html=True)
 
 # --- Initialize Session State and Load Data ---
-load_data()
+# Only the users table is needed to log in; the rest is loaded once authenticated
+load_data(["users"])
 
 # --- Helper for ID Generation ---
+# Table whose primary key is each ID column, e.g. "client_id" -> "clients"
+KEY_TABLES = {key: table for table, key in TABLE_KEYS.items()}
+
 def next_id(df, col):
-    """Generates the next sequential ID for a DataFrame."""
-    if df.empty:
-        return 1
-    return df[col].max() + 1
+    """
+    Allocates a new ID for the table keyed by col. IDs come from a persisted sequence and
+    are never reused; the sequence is kept above the IDs in the store and the archive, so
+    df (the session's table) is not consulted.
+    """
+    table = KEY_TABLES[col]
+    return allocate_id(table, current_max=lambda: max_id(table))
+
+# --- Contract Form Fields ---
+# Inputs for template fields (see contract_templates.py): consecutive fields with a
+# "column" share a two-column row, others take the full width.
+def contract_form_fields(fields, key_prefix):
+    """Renders the inputs of template fields inside a form. Returns {field name: value}."""
+    values = {}
+    for in_columns, group in groupby(fields, key=lambda field: bool(field.get("column"))):
+        group = list(group)
+        columns = st.columns(2) if in_columns else None
+        for field in group:
+            if field.get("show_if") and not values.get(field["show_if"]):
+                continue # Shown only when its checkbox is ticked
+            if columns:
+                with columns[field["column"] - 1]:
+                    values[field["name"]] = _contract_input(field, f"{key_prefix}_{field['name']}")
+            else:
+                values[field["name"]] = _contract_input(field, f"{key_prefix}_{field['name']}")
+    return values
+
+def _contract_input(field, key):
+    label, kind = field.get("label", field["name"]), field["kind"]
+    if kind == "bool":
+        return st.checkbox(label, help=field.get("help"), key=key)
+    if kind == "date":
+        return st.date_input(label, datetime.today(), help=field.get("help"), key=key)
+    if kind == "float":
+        return st.number_input(label, min_value=float(field.get("min", 0.0)), step=float(field.get("step", 1.0)), format="%.2f", help=field.get("help"), key=key)
+    if kind == "int" and field.get("widget") == "slider":
+        return st.slider(label, field.get("min", 0), field.get("max", 100), field.get("value", field.get("min", 0)), help=field.get("help"), key=key)
+    if kind == "int":
+        return st.number_input(label, min_value=int(field.get("min", 0)), step=int(field.get("step", 1)), help=field.get("help"), key=key)
+    if field.get("multiline"):
+        return st.text_area(label, help=field.get("help"), key=key)
+    return st.text_input(label, help=field.get("help"), key=key)
 
 # --- Authentication Check and Page Rendering ---
 # The authenticate_user function now handles the UI for login/signup
@@ -52,6 +101,8 @@ if not authenticate_user(save_data): # Pass save_data for signup persistence
 else:
     # --- Main Application Layout (visible only after authentication) ---
     st.title("🧑‍⚖️ موجز - إدارة العقود والمحاماة")
+    ensure_tables("clients", "cases", "invoices", "reminders", "time_entries")
+    warm_up_fonts() # Parses the contract font once per process, not on the first contract
 
     # Display logout button for authenticated users
     st.sidebar.success(f"مرحباً، {st.session_state.username}!")
@@ -63,6 +114,17 @@ else:
             del st.query_params["auth_token"]
         st.rerun()
 
+    # Memory held by the shared data and by each session's own changes (measured on demand)
+    if st.sidebar.button("📈 تقرير استهلاك الذاكرة", key="sidebar_memory_report_button"):
+        report = memory_report()
+        st.sidebar.write(f"البيانات المشتركة: {report['shared_bytes'] / 2**20:.1f} MB")
+        st.sidebar.write(f"الجلسات النشطة: {len(report['session_bytes'])}")
+        shaping = reshape_cache_stats()
+        st.sidebar.write(f"ذاكرة تشكيل النصوص: {shaping['size']} نص، نسبة الإصابة {shaping['hit_rate']:.0%}")
+        st.sidebar.dataframe(pd.DataFrame(
+            [{"الجلسة": session_id[:8], "الذاكرة الخاصة (KB)": round(size / 1024, 1)} for session_id, size in report["session_bytes"].items()]
+        ), hide_index=True)
+
     # --- Dashboard KPIs ---
     st.markdown("---")
     st.header("📊 لوحة المعلومات")
@@ -78,7 +140,7 @@ else:
         st.markdown(f'<div class="kpi-box">المبالغ المحصلة<br><strong>{total_paid:,.2f} ر.س</strong></div>', unsafe_allow_html=True)
     with col_kpi4:
         upcoming_reminders_count = st.session_state.reminders[
-            (st.session_state.reminders['date'] >= datetime.today().date()) &
+            (st.session_state.reminders['date'] >= pd.Timestamp(datetime.today().date())) &
             (st.session_state.reminders['is_completed'] == False)
         ].shape[0]
         st.markdown(f'<div class="kpi-box">تذكيرات قادمة<br><strong>{upcoming_reminders_count}</strong></div>', unsafe_allow_html=True)
@@ -91,7 +153,7 @@ else:
     with chart_col1:
         st.markdown("#### توزيع القضايا حسب الحالة")
         if not st.session_state.cases.empty:
-            case_status_counts = st.session_state.cases['status'].value_counts().reset_index()
+            case_status_counts = st.session_state.cases['status'].value_counts().loc[lambda counts: counts > 0].reset_index() # Skip unused categories
             case_status_counts.columns = ['الحالة', 'العدد']
             fig_cases_status = px.pie(case_status_counts, values='العدد', names='الحالة', title='توزيع القضايا',
                                       color_discrete_sequence=px.colors.qualitative.Pastel)
@@ -192,70 +254,15 @@ else:
         st.subheader("📄 مولد العقود القانونية")
         st.markdown("استخدم هذه الأداة لإنشاء عقود قانونية مخصصة بسرعة وسهولة.")
 
-        selected_contract_type_ar = st.selectbox("اختر نوع العقد", list(CONTRACT_TYPE_OPTIONS.keys()), key="tab1_contract_type_select")
+        selected_contract_type_ar = st.selectbox("اختر نوع العقد", list(contract_type_options()), key="tab1_contract_type_select")
+        contract_template = get_template(selected_contract_type_ar)
         
         with st.form("contract_generation_form", clear_on_submit=False):
+            # The inputs are generated from the contract type's template (contract_templates.json)
             st.markdown("### 📌 بيانات الأطراف")
-            col1, col2 = st.columns(2)
-            with col1:
-                party1_name = st.text_input("اسم الطرف الأول", help="الجهة الأولى في العقد (مثلاً: الشركة المؤجرة، صاحب العمل).", key="tab1_party1_name_contract")
-                party2_name = st.text_input("اسم الطرف الثاني", help="الجهة الثانية في العقد (مثلاً: المستأجر، الموظف).", key="tab1_party2_name_contract")
-            with col2:
-                contract_date = st.date_input("تاريخ العقد", datetime.today(), key="tab1_contract_date_input")
-
-            contract_details = {}
-            if selected_contract_type_ar == "عقد عمل":
-                st.markdown("### 📝 تفاصيل عقد العمل")
-                col_emp1, col_emp2 = st.columns(2)
-                with col_emp1:
-                    contract_details["cr_number"] = st.text_input("السجل التجاري للطرف الأول", key="tab1_emp_cr_number")
-                    contract_details["id_number"] = st.text_input("رقم هوية الطرف الثاني / الإقامة", key="tab1_emp_id_number")
-                    contract_details["salary"] = st.number_input("الراتب الشهري (بالريال السعودي)", min_value=0.0, step=100.0, format="%.2f", key="tab1_emp_salary")
-                    contract_details["job_title"] = st.text_input("المسمى الوظيفي", key="tab1_emp_job_title")
-                    contract_details["start_date"] = st.date_input("تاريخ بدء العمل", datetime.today(), key="tab1_emp_start_date")
-                with col_emp2:
-                    contract_details["address"] = st.text_input("عنوان الطرف الأول", key="tab1_emp_address")
-                    contract_details["duration"] = st.number_input("مدة العقد (بالأشهر)", min_value=1, step=1, key="tab1_emp_duration")
-                    contract_details["housing_allowance"] = st.checkbox("يشمل بدل سكن؟", key="tab1_emp_housing_allowance_check")
-                    if contract_details["housing_allowance"]:
-                        contract_details["housing_percentage"] = st.slider("نسبة بدل السكن (%)", 0, 50, 25, key="tab1_emp_housing_percentage")
-                    contract_details["non_compete"] = st.checkbox("إضافة شرط عدم المنافسة؟", key="tab1_emp_non_compete_check")
-                    if contract_details["non_compete"]:
-                        contract_details["non_compete_city"] = st.text_input("المدينة المشمولة بالشرط", key="tab1_emp_non_compete_city")
-                    contract_details["penalty_clause"] = st.checkbox("إضافة شرط جزائي؟", key="tab1_emp_penalty_clause_check")
-                    if contract_details["penalty_clause"]:
-                        contract_details["penalty_amount"] = st.number_input("قيمة الشرط الجزائي (ريال)", min_value=0.0, step=100.0, format="%.2f", key="tab1_emp_penalty_amount")
-                    contract_details["termination_clause"] = st.checkbox("إمكانية فسخ العقد بإشعار مسبق؟", key="tab1_emp_termination_clause_check")
-
-            elif selected_contract_type_ar == "عقد إيجار":
-                st.markdown("### 📝 تفاصيل عقد الإيجار")
-                contract_details["property_address"] = st.text_area("عنوان العقار المؤجر بالتفصيل", key="tab1_lease_property_address")
-                col_lease1, col_lease2 = st.columns(2)
-                with col_lease1:
-                    contract_details["duration"] = st.number_input("مدة الإيجار (بالأشهر)", min_value=1, step=1, key="tab1_lease_duration")
-                    contract_details["rent"] = st.number_input("قيمة الإيجار الشهري (ريال)", min_value=0.0, step=100.0, format="%.2f", key="tab1_lease_rent")
-                with col_lease2:
-                    contract_details["deposit"] = st.number_input("قيمة التأمين (إن وجد) (ريال)", min_value=0.0, step=50.0, format="%.2f", key="tab1_lease_deposit")
-                    contract_details["maintenance"] = st.checkbox("هل المؤجر مسؤول عن الصيانة الرئيسية؟", key="tab1_lease_maintenance_check")
-
-            elif selected_contract_type_ar == "عقد وكالة":
-                st.markdown("### 📝 تفاصيل عقد الوكالة")
-                contract_details["agency_scope"] = st.text_area("نطاق ومسؤوليات الوكالة بالتفصيل", key="tab1_agency_scope")
-                contract_details["duration"] = st.number_input("مدة الوكالة (بالأشهر)", min_value=1, step=1, key="tab1_agency_duration")
-
-            elif selected_contract_type_ar == "عقد بيع":
-                st.markdown("### 📝 تفاصيل عقد البيع")
-                contract_details["item_description"] = st.text_area("وصف الأصل أو الممتلكات المباعة بالتفصيل", key="tab1_sales_item_description")
-                col_sales1, col_sales2 = st.columns(2)
-                with col_sales1:
-                    contract_details["price"] = st.number_input("قيمة البيع الإجمالية (ريال)", min_value=0.0, step=100.0, format="%.2f", key="tab1_sales_price")
-                with col_sales2:
-                    contract_details["delivery_date"] = st.date_input("تاريخ التسليم المتوقع", datetime.today(), key="tab1_sales_delivery_date")
-
-            elif selected_contract_type_ar == "عقد عدم إفشاء (NDA)":
-                st.markdown("### 📝 تفاصيل عقد عدم الإفشاء (NDA)")
-                contract_details["scope"] = st.text_area("طبيعة ونطاق المعلومات السرية المشمولة بالعقد", key="tab1_nda_scope")
-                contract_details["duration"] = st.number_input("مدة الالتزام بالسرية (بالأشهر)", min_value=1, step=1, key="tab1_nda_duration")
+            contract_data_for_pdf = contract_form_fields(contract_template.common_fields, "tab1_contract")
+            st.markdown(f"### {contract_template.title}")
+            contract_data_for_pdf.update(contract_form_fields(contract_template.contract_fields, f"tab1_{contract_template.key}"))
 
             st.markdown("---")
             st.markdown("### ✍️ التوقيع والختم")
@@ -293,16 +300,13 @@ else:
             generate_button = st.form_submit_button("✨ توليد العقد والتحميل")
 
         if generate_button:
-            if not party1_name or not party2_name:
-                st.warning("الرجاء إدخال اسمي الطرف الأول والثاني للمتابعة.")
+            missing_fields = contract_template.missing(contract_data_for_pdf)
+            if missing_fields:
+                st.warning(f"الرجاء إدخال {' و'.join(missing_fields)} للمتابعة.")
             else:
-                contract_data_for_pdf = {
-                    "party1": party1_name,
-                    "party2": party2_name,
-                    "date": contract_date,
-                    **contract_details
-                }
-                
+                party1_name, party2_name = contract_data_for_pdf["party1"], contract_data_for_pdf["party2"]
+                contract_date = contract_data_for_pdf["date"]
+
                 signature_image_array = None
                 if signature_data and signature_data.image_data is not None:
                     if signature_data.image_data.sum() < (signature_data.image_data.size * 255 * 3) * 0.98:
@@ -350,13 +354,59 @@ else:
                     st.error(f"حدث خطأ أثناء توليد العقد: {e}")
                     st.exception(e)
 
+        # --- Bulk Contract Generation ---
+        # One contract per spreadsheet row, rendered in parallel and returned as a ZIP
+        st.markdown("---")
+        st.subheader("📦 إنشاء العقود بالجملة من ملف")
+        st.markdown("ارفع ملف CSV أو Excel يحتوي على صف لكل عقد. يُستخدم نوع العقد المختار أعلاه ما لم يحدد عمود contract_type غيره.")
+        st.download_button(
+            label="📄 تحميل نموذج الأعمدة (CSV)",
+            data=template_csv(selected_contract_type_ar),
+            file_name=f"{contract_template.key}_template.csv",
+            mime="text/csv",
+            key="tab1_bulk_template_download"
+        )
+        bulk_file = st.file_uploader("📂 ملف العقود", type=["csv", "xlsx"], key="tab1_bulk_contracts_uploader")
+        if bulk_file is not None and st.button("✨ توليد جميع العقود", key="tab1_bulk_generate_button"):
+            bulk_rows = None
+            try:
+                bulk_rows = read_contract_rows(bulk_file)
+            except Exception as e:
+                st.error(f"تعذرت قراءة الملف: {e}")
+            if bulk_rows is not None and bulk_rows.empty:
+                st.warning("الملف لا يحتوي على أي صفوف.")
+            elif bulk_rows is not None:
+                progress_bar = st.progress(0.0, text="جاري توليد العقود...")
+                zip_bytes, bulk_report = build_contracts_zip(
+                    bulk_rows, selected_contract_type_ar,
+                    progress=lambda done, total: progress_bar.progress(done / total, text=f"تم توليد {done} من {total} عقد")
+                )
+                progress_bar.empty()
+                st.session_state.bulk_contracts_result = (bulk_file.name, zip_bytes, bulk_report) # Kept across the download rerun
+        if st.session_state.get("bulk_contracts_result"):
+            source_name, zip_bytes, bulk_report = st.session_state.bulk_contracts_result
+            succeeded = int(bulk_report["تم الإنشاء"].sum())
+            if succeeded == len(bulk_report):
+                st.success(f"✅ تم إنشاء {succeeded} عقد من الملف {source_name}.")
+            else:
+                st.warning(f"تم إنشاء {succeeded} من {len(bulk_report)} عقد من الملف {source_name}. راجع التقرير للصفوف التي فشلت.")
+            st.download_button(
+                label="📥 تحميل العقود (ZIP)",
+                data=zip_bytes,
+                file_name=f"{source_name.rsplit('.', 1)[0]}_contracts.zip",
+                mime="application/zip",
+                key="tab1_bulk_zip_download"
+            )
+            st.dataframe(bulk_report, hide_index=True)
+
 
     # --- CRM Tab (Delegated to crm_modules.py) ---
     with tab2:
         st.subheader("⚖️ نظام إدارة القضايا والعملاء (CRM)")
         st.markdown("نظام متكامل لإدارة بيانات العملاء، القضايا، التذكيرات، والفواتير المرتبطة.")
+        render_global_search()
 
-        clients_tab, cases_tab, reminders_tab, invoices_tab = st.tabs(["👥 العملاء", "⚖️ القضايا", "⏰ التذكيرات", "💰 الفواتير"])
+        clients_tab, cases_tab, reminders_tab, invoices_tab, archive_tab = st.tabs(["👥 العملاء", "⚖️ القضايا", "⏰ التذكيرات", "💰 الفواتير", "🗄️ الأرشيف"])
 
         with clients_tab:
             render_client_management(next_id, save_data, reshape_arabic)
@@ -370,6 +420,9 @@ else:
         with invoices_tab:
             render_invoice_management(next_id, save_data, reshape_arabic)
 
+        with archive_tab:
+            render_archive_management()
+
     # --- Time Tracking Tab (NEW) ---
     with tab3:
         st.subheader("⏰ تتبع الوقت")
@@ -5,19 +5,46 @@ import arabic_reshaper
 from bidi.algorithm import get_display
 from PIL import Image
 from io import BytesIO
-import tempfile
+from functools import lru_cache
+from collections import OrderedDict
+import hashlib
+import copy
+import threading
 import os
-from datetime import datetime, date # Import date for type checking
+from datetime import datetime
 
 import streamlit as st # Used for st.error and st.stop in get_font_path
 
-from config import AMIRI_FONT_NAME, AMIRI_FONT_PATH # Import font constants
+from contract_templates import get_template
+from config import AMIRI_FONT_NAME, AMIRI_FONT_PATH, RESHAPE_CACHE_SIZE, STAMP_CACHE_SIZE # Import font constants
+
+# --- Arabic Shaping ---
+# Shaping is pure and the same strings recur constantly (contract boilerplate, dates,
+# names shown on every rerun), so shaped strings are kept in a bounded LRU cache shared
+# by all sessions. Repeats cost a dict lookup instead of a reshape and bidi pass.
+@lru_cache(maxsize=RESHAPE_CACHE_SIZE)
+def _shape(text):
+    return get_display(arabic_reshaper.reshape(text))
 
 def reshape_arabic(text):
     """Reshapes Arabic text for proper display in PDF and Streamlit."""
     if not isinstance(text, str):
         return text # Return as is if not a string (e.g., numbers, None)
-    return get_display(arabic_reshaper.reshape(text))
+    return _shape(text)
+
+def reshape_arabic_batch(texts):
+    """Reshapes a list of values at once (each shaped as by reshape_arabic, duplicates only once)."""
+    shaped = {text: _shape(text) for text in dict.fromkeys(text for text in texts if isinstance(text, str))}
+    return [shaped.get(text, text) if isinstance(text, str) else text for text in texts]
+
+def reshape_cache_stats():
+    """Hit counters of the shaping cache: {"hits", "misses", "hit_rate", "size", "max_size"}."""
+    info = _shape.cache_info()
+    calls = info.hits + info.misses
+    return {
+        "hits": info.hits, "misses": info.misses, "hit_rate": info.hits / calls if calls else 0.0,
+        "size": info.currsize, "max_size": info.maxsize,
+    }
 
 def get_font_path(font_name=AMIRI_FONT_NAME):
     """Returns the path to the specified font, with error handling."""
@@ -38,6 +65,150 @@ def get_font_path(font_name=AMIRI_FONT_NAME):
         raise FileNotFoundError(f"Font file not found: {path}") # Raise specific error for clarity
     return path
 
+# --- Font Registry ---
+# fpdf2 parses the whole TTF (glyph widths, cmap, metrics) on every add_font, which
+# costs tens of milliseconds per contract. The registry parses each font once per
+# process and gives every document a shallow copy of that parsed font. Only the state
+# fpdf2 changes while writing a document is made fresh per copy: the used-glyph subset,
+# the missing-glyph list and the fontTools font, which fpdf2 subsets in place on output
+# and which is reopened lazily from the cached file bytes with the glyph order preset.
+# This relies on fpdf2 internals (see requirements.txt for the tested versions), so each
+# font is checked once when it is loaded: two documents written at the same time with
+# copies must come out byte for byte like documents using add_font, or the registry
+# falls back to add_font for that font.
+_PROBE_TEXTS = ("بسم الله 123", "Contract عقد 2025") # Different glyphs, so a shared subset would show
+_PROBE_DATE = datetime(2025, 1, 1)
+
+class FontRegistry:
+    """Parsed fonts shared by all PDF documents of the process."""
+
+    def __init__(self, cache=True):
+        self.cache = cache # False registers fonts the uncached way (add_font per document)
+        self._lock = threading.Lock()
+        self._fonts = {} # font name -> (parsed template font, file bytes), or None if it can't be copied
+
+    def _template(self, font_name):
+        """The parsed template and bytes of a font, loaded on first use."""
+        with self._lock:
+            if font_name not in self._fonts:
+                path = get_font_path(font_name)
+                loader = FPDF()
+                loader.add_font(font_name, "", path)
+                template = next(iter(loader.fonts.values()))
+                with open(path, "rb") as f:
+                    font_bytes = f.read()
+                try:
+                    copies_match = self._probe(font_name, lambda pdf: pdf.add_font(font_name, "", path)) == \
+                        self._probe(font_name, lambda pdf: self._add_copy(pdf, template, font_bytes))
+                except Exception: # Other fpdf2 internals
+                    copies_match = False
+                if not copies_match:
+                    print(f"Font registry: copies of {font_name} don't match add_font with this fpdf2 version; using add_font")
+                self._fonts[font_name] = (template, font_bytes) if copies_match else None
+            return self._fonts[font_name]
+
+    def _probe(self, font_name, add_font):
+        """PDF bytes of two small documents written side by side, with fonts added by add_font(pdf)."""
+        documents = []
+        for text in _PROBE_TEXTS:
+            pdf = FPDF()
+            pdf.set_creation_date(_PROBE_DATE)
+            add_font(pdf)
+            pdf.add_page()
+            pdf.set_font(font_name, size=14)
+            documents.append((pdf, text))
+        for pdf, text in documents:
+            pdf.cell(text=text)
+        return [bytes(pdf.output()) for pdf, _ in documents]
+
+    def _add_copy(self, pdf, template, font_bytes):
+        if template.fontkey not in pdf.fonts:
+            pdf.fonts[template.fontkey] = self._copy(template, font_bytes, len(pdf.fonts) + 1)
+            if template.is_cff and template.is_cid_keyed:
+                pdf._set_min_pdf_version("1.6") # As add_font does for CID-keyed CFF fonts
+
+    def _copy(self, template, font_bytes, number):
+        from fontTools import ttLib
+        from fpdf.fonts import SubsetMap
+        font = copy.copy(template)
+        font.i = number
+        font.ttfont = ttLib.TTFont(BytesIO(font_bytes), recalcTimestamp=False, lazy=True)
+        font.ttfont.setGlyphOrder(list(template.ttfont.getGlyphOrder())) # Saves re-deriving glyph names from the post table
+        font.subset = SubsetMap(font)
+        font.missing_glyphs = []
+        font.biggest_size_pt = 0
+        font._hbfont = None
+        return font
+
+    def warm_up(self, font_names=(AMIRI_FONT_NAME,)):
+        """Parses fonts ahead of the first contract."""
+        if self.cache:
+            for font_name in font_names:
+                self._template(font_name)
+
+    def register(self, pdf, font_name=AMIRI_FONT_NAME):
+        """Makes a font usable in pdf (like pdf.add_font). Raises FileNotFoundError if the font file is missing."""
+        cached = self._template(font_name) if self.cache else None
+        if cached is None:
+            pdf.add_font(font_name, "", get_font_path(font_name))
+            return
+        self._add_copy(pdf, *cached)
+
+
+# --- Module-level Registry ---
+# One registry per process, shared by all Streamlit sessions.
+_fonts = FontRegistry()
+
+def warm_up_fonts():
+    """Loads the contract fonts ahead of time (called once at startup)."""
+    try:
+        _fonts.warm_up()
+    except FileNotFoundError as e:
+        print(f"Font warm-up failed: {e}") # Reported again when a contract is generated
+
+def register_fonts(pdf):
+    """Adds the contract fonts to a new FPDF document."""
+    _fonts.register(pdf)
+
+# --- Signature and Stamp Images ---
+def _fit_on_white(img, max_w, max_h):
+    """Scales an image to fit max_w x max_h (keeping its aspect ratio) and flattens it onto white. Returns an RGB image."""
+    img = img.convert("RGBA")
+    ratio = min(max_w / img.width, max_h / img.height)
+    img = img.resize((int(img.width * ratio), int(img.height * ratio)), Image.LANCZOS)
+    bg = Image.new("RGBA", img.size, (255, 255, 255, 255))
+    bg.paste(img, (0, 0), img)
+    return bg.convert("RGB")
+
+class StampCache:
+    """Prepared stamp images keyed by the SHA-256 of the uploaded file, least recently used dropped first."""
+
+    def __init__(self, max_size=STAMP_CACHE_SIZE):
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._images = OrderedDict() # digest -> prepared RGB image (only read afterwards, so shared)
+
+    def get(self, stamp_bytes):
+        """The stamp decoded, scaled to fit 50 x 50 and flattened onto white; prepared once per distinct file."""
+        digest = hashlib.sha256(stamp_bytes).digest()
+        with self._lock:
+            if digest in self._images:
+                self._images.move_to_end(digest)
+                return self._images[digest]
+        image = _fit_on_white(Image.open(BytesIO(stamp_bytes)), 50, 50) # Prepared outside the lock
+        with self._lock:
+            self._images[digest] = image
+            while len(self._images) > self.max_size:
+                self._images.popitem(last=False)
+        return image
+
+# One cache per process: the same company stamp is reused across contracts and sessions.
+_stamps = StampCache()
+
+def prepared_stamp(stamp_bytes):
+    """The prepared (cached) image of an uploaded stamp file's bytes."""
+    return _stamps.get(stamp_bytes)
+
 def generate_contract_pdf(contract_type, data, signature_img_data=None, stamp_file_data=None):
     """
     Generates a PDF contract based on type and data, with optional signature and stamp.
@@ -46,8 +217,7 @@ def generate_contract_pdf(contract_type, data, signature_img_data=None, stamp_fi
     pdf.add_page()
 
     try:
-        amiri_font_path = get_font_path(AMIRI_FONT_NAME)
-        pdf.add_font(AMIRI_FONT_NAME, "", amiri_font_path, uni=True)
+        register_fonts(pdf) # Parsed once per process, see FontRegistry
         pdf.set_font(AMIRI_FONT_NAME, size=14)
     except FileNotFoundError as e:
         print(f"PDF generation failed: {e}")
@@ -60,143 +230,29 @@ def generate_contract_pdf(contract_type, data, signature_img_data=None, stamp_fi
 
     pdf.set_font(AMIRI_FONT_NAME, size=12)
 
-    # Convert date objects to string for PDF display
-    formatted_date = data['date'].strftime("%Y-%m-%d") if isinstance(data['date'], (datetime, date)) else data['date']
-    
-    content_lines = []
-    
-    # General contract preamble
-    content_lines.append(f"بتاريخ {formatted_date}، تم الاتفاق بين:")
-    content_lines.append(f"الطرف الأول: {data['party1']}.")
-    content_lines.append(f"الطرف الثاني: {data['party2']}.")
-
-    if contract_type == "عقد عمل":
-        start_date_formatted = data['start_date'].strftime("%Y-%m-%d") if isinstance(data['start_date'], (datetime, date)) else data['start_date']
-        
-        if data.get('cr_number'):
-            content_lines.append(f"سجل تجاري رقم الطرف الأول: {data['cr_number']}.")
-        if data.get('address'):
-            content_lines.append(f"عنوان الطرف الأول: {data['address']}.")
-        if data.get('id_number'):
-            content_lines.append(f"رقم هوية/إقامة الطرف الثاني: {data['id_number']}.")
-        
-        # Build the employment details line conditionally
-        employment_details_parts = []
-        if data.get('job_title'):
-            employment_details_parts.append(f"بوظيفة: {data['job_title']}")
-        if data.get('salary', 0) > 0:
-            employment_details_parts.append(f"براتب شهري قدره: {data['salary']:.2f} ريال سعودي")
-        if data.get('duration', 0) > 0:
-            employment_details_parts.append(f"لمدة: {data['duration']} شهرًا")
-        if start_date_formatted:
-            employment_details_parts.append(f"تبدأ في: {start_date_formatted}")
-
-        if employment_details_parts: # Only add if there are actual details
-            content_lines.append(f"بموجب هذا العقد، يلتزم الطرف الثاني بالعمل لدى الطرف الأول: {', '.join(employment_details_parts)}.")
-
-        if data.get("housing_allowance") and data.get("housing_percentage"):
-            content_lines.append(f"يشمل العقد بدل سكن بنسبة {data['housing_percentage']}% من الراتب الأساسي.")
-        if data.get("non_compete") and data.get("non_compete_city"):
-            content_lines.append(f"يتعهد الطرف الثاني بعدم المنافسة أو العمل لدى جهة أخرى مماثلة في مدينة {data['non_compete_city']} لمدة 6 أشهر بعد انتهاء العقد.")
-        if data.get("penalty_clause") and data.get("penalty_amount", 0) > 0:
-            content_lines.append(f"في حال الإخلال ببنود العقد، تفرض غرامة مالية قدرها {data['penalty_amount']:.2f} ريال سعودي على الطرف المخل.")
-        if data.get("termination_clause"):
-            content_lines.append("يمكن لأي من الطرفين فسخ العقد بإشعار كتابي مسبق مدته 30 يومًا.")
-        content_lines.append("يخضع هذا العقد لأحكام نظام العمل السعودي ولوائحه التنفيذية.")
-
-    elif contract_type == "عقد إيجار":
-        if data.get('property_address'):
-            content_lines.append(f"العقار المؤجر: {data['property_address']}.")
-        if data.get('duration', 0) > 0:
-            content_lines.append(f"مدة الإيجار: {data['duration']} شهرًا، تبدأ من تاريخ توقيع العقد.")
-        if data.get('rent', 0) > 0:
-            content_lines.append(f"قيمة الإيجار الشهري: {data['rent']:.2f} ريال سعودي.")
-        if data.get('deposit', 0) > 0:
-            content_lines.append(f"قيمة التأمين: {data['deposit']:.2f} ريال سعودي.")
-        content_lines.append(f"مسؤولية الصيانة: {'على المؤجر' if data.get('maintenance') else 'على المستأجر'}.")
-
-    elif contract_type == "عقد وكالة":
-        if data.get('duration', 0) > 0:
-            content_lines.append(f"مدة الوكالة: {data['duration']} شهرًا.")
-        if data.get('agency_scope'):
-            content_lines.append(f"نطاق الوكالة: {data['agency_scope']}.")
-
-    elif contract_type == "عقد بيع":
-        delivery_date_formatted = data['delivery_date'].strftime("%Y-%m-%d") if isinstance(data['delivery_date'], (datetime, date)) else data['delivery_date']
-        if data.get('item_description'):
-            content_lines.append(f"وصف الأصل المباع: {data['item_description']}.")
-        if data.get('price', 0) > 0:
-            content_lines.append(f"قيمة البيع الإجمالية: {data['price']:.2f} ريال سعودي.")
-        if delivery_date_formatted:
-            content_lines.append(f"تاريخ التسليم المتوقع: {delivery_date_formatted}.")
-
-    elif contract_type == "عقد عدم إفشاء (NDA)":
-        if data.get('duration', 0) > 0:
-            content_lines.append(f"مدة الالتزام بالسرية: {data['duration']} شهرًا.")
-        if data.get('scope'):
-            content_lines.append(f"طبيعة المعلومات المشمولة بالسرية: {data['scope']}.")
+    # Clause text comes from the compiled declarative template of the contract type
+    content_lines = get_template(contract_type).render(data)
     
     # Calculate effective page width for multi_cell
     effective_width = pdf.w - pdf.l_margin - pdf.r_margin - 10 
 
-    for line in content_lines:
-        pdf.multi_cell(effective_width, 10, txt=reshape_arabic(line), align="R")
+    for line in reshape_arabic_batch(content_lines):
+        pdf.multi_cell(effective_width, 10, txt=line, align="R")
     
     pdf.ln(20)
 
     # --- Signature Handling ---
+    # Images are prepared in memory and handed to FPDF as PIL images (no temp files)
     if signature_img_data is not None:
-        tmp_sig_path = None
-        try:
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".png") as tmp_sig:
-                tmp_sig_path = tmp_sig.name 
-
-            sig_img = Image.fromarray(signature_img_data.astype('uint8')).convert("RGBA")
-            max_w, max_h = 70, 50
-            sig_w, sig_h = sig_img.size
-            ratio = min(max_w / sig_w, max_h / sig_h)
-            new_w = int(sig_w * ratio)
-            new_h = int(sig_h * ratio)
-            sig_img = sig_img.resize((new_w, new_h), Image.LANCZOS)
-            
-            bg = Image.new("RGBA", sig_img.size, (255, 255, 255, 255))
-            bg.paste(sig_img, (0, 0), sig_img)
-            final_sig_img = bg.convert("RGB")
-            
-            final_sig_img.save(tmp_sig_path, "PNG")
-
-            pdf.image(tmp_sig_path, x=pdf.w - 80, y=pdf.h - 70, w=new_w, h=new_h)
-        finally:
-            if tmp_sig_path and os.path.exists(tmp_sig_path):
-                os.unlink(tmp_sig_path)
+        sig_img = Image.fromarray(signature_img_data.astype('uint8'))
+        final_sig_img = _fit_on_white(sig_img, 70, 50)
+        pdf.image(final_sig_img, x=pdf.w - 80, y=pdf.h - 70, w=final_sig_img.width, h=final_sig_img.height)
 
     # --- Stamp Handling ---
     if stamp_file_data:
-        tmp_stamp_path = None
-        try:
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".png") as tmp_stamp:
-                tmp_stamp_path = tmp_stamp.name 
-                stamp_file_data.seek(0) # Ensure file pointer is at the beginning
-                tmp_stamp.write(stamp_file_data.read())
-            
-            stamp_img = Image.open(tmp_stamp_path).convert("RGBA")
-            max_w_stamp, max_h_stamp = 50, 50
-            stamp_w, stamp_h = stamp_img.size
-            ratio_stamp = min(max_w_stamp / stamp_w, max_h_stamp / stamp_h)
-            new_w_stamp = int(stamp_w * ratio_stamp)
-            new_h_stamp = int(stamp_h * ratio_stamp)
-            stamp_img = stamp_img.resize((new_w_stamp, new_h_stamp), Image.LANCZOS)
-            
-            bg_stamp = Image.new("RGBA", stamp_img.size, (255, 255, 255, 255))
-            bg_stamp.paste(stamp_img, (0, 0), stamp_img)
-            final_stamp_img = bg_stamp.convert("RGB")
-            
-            final_stamp_img.save(tmp_stamp_path, "PNG")
-
-            pdf.image(tmp_stamp_path, x=20, y=pdf.h - 70, w=new_w_stamp, h=new_h_stamp)
-        finally:
-            if tmp_stamp_path and os.path.exists(tmp_stamp_path):
-                os.unlink(tmp_stamp_path)
+        stamp_file_data.seek(0) # Ensure file pointer is at the beginning
+        final_stamp_img = prepared_stamp(stamp_file_data.read())
+        pdf.image(final_stamp_img, x=20, y=pdf.h - 70, w=final_stamp_img.width, h=final_stamp_img.height)
 
     pdf_output_raw = pdf.output(dest="S")
     if isinstance(pdf_output_raw, str):
@@ -0,0 +1,244 @@
+# schema.py
+
+import pandas as pd
+from datetime import datetime, date, timedelta
+
+from config import (
+    CASE_TYPE_OPTIONS, CASE_STATUS_OPTIONS, CASE_PRIORITY_OPTIONS, CLIENT_TYPE_OPTIONS,
+    REMINDER_RELATED_TYPES, TIME_ENTRY_CATEGORIES,
+)
+
+# --- Schema Registry ---
+# Every table is declared once here; column order, primary keys, empty frames, dtype
+# coercion, the JSON encoding and validation of change records are all derived from it.
+#
+# Column kinds:
+#   "id"       nullable Int32 (primary and foreign keys; 0 means "none" for optional links)
+#   "float"    float64
+#   "bool"     bool
+#   "text"     free text
+#   "category" pandas Categorical over "options" (values outside the list are kept as extra categories)
+#   "date"     datetime64[ns] at midnight, stored as "YYYY-MM-DD"
+# Case activity entries are not a column; they live in activity_store.
+# Optional keys: "key" (primary key), "default" (fill value for missing entries;
+# for dates, "default_days" = days from today), "options" (for categories).
+TABLE_SCHEMAS = {
+    "clients": {
+        "client_id": {"kind": "id", "key": True},
+        "name": {"kind": "text"},
+        "phone": {"kind": "text"},
+        "email": {"kind": "text"},
+        "notes": {"kind": "text"},
+        "type": {"kind": "category", "options": CLIENT_TYPE_OPTIONS, "default": "فرد"},
+        "address": {"kind": "text", "default": ""},
+        "company_name": {"kind": "text", "default": ""},
+        "secondary_contact": {"kind": "text", "default": ""},
+    },
+    "cases": {
+        "case_id": {"kind": "id", "key": True},
+        "client_id": {"kind": "id"},
+        "case_name": {"kind": "text"},
+        "case_type": {"kind": "category", "options": CASE_TYPE_OPTIONS},
+        "status": {"kind": "category", "options": CASE_STATUS_OPTIONS},
+        "court_date": {"kind": "date", "default_days": 0},
+        "opposing_party": {"kind": "text"},
+        "case_description": {"kind": "text"},
+        "responsible_lawyer": {"kind": "text"},
+        "notes": {"kind": "text"},
+        "priority": {"kind": "category", "options": CASE_PRIORITY_OPTIONS, "default": "متوسطة"},
+    },
+    "invoices": {
+        "invoice_id": {"kind": "id", "key": True},
+        "client_id": {"kind": "id"},
+        "case_id": {"kind": "id", "default": 0},
+        "amount": {"kind": "float"},
+        "paid": {"kind": "bool"},
+        "date": {"kind": "date", "default_days": 0},
+        "due_date": {"kind": "date", "default_days": 30},
+    },
+    "reminders": {
+        "reminder_id": {"kind": "id", "key": True},
+        "related_type": {"kind": "category", "options": REMINDER_RELATED_TYPES},
+        "related_id": {"kind": "id"},
+        "description": {"kind": "text"},
+        "date": {"kind": "date", "default_days": 0},
+        "is_completed": {"kind": "bool"},
+    },
+    "users": {
+        "username": {"kind": "text", "key": True},
+        "password": {"kind": "text"},
+    },
+    "time_entries": {
+        "entry_id": {"kind": "id", "key": True},
+        "client_id": {"kind": "id"},
+        "case_id": {"kind": "id", "default": 0},
+        "date": {"kind": "date", "default_days": 0},
+        "hours": {"kind": "float"},
+        "category": {"kind": "category", "options": TIME_ENTRY_CATEGORIES},
+        "description": {"kind": "text"},
+    },
+}
+
+# --- Table Definitions ---
+# Column order of each table, shared by the DataFrames in session state and the storage backends.
+TABLE_COLUMNS = {name: list(columns) for name, columns in TABLE_SCHEMAS.items()}
+
+TABLE_NAMES = list(TABLE_COLUMNS)
+
+# Primary key column of each table, used to address rows in change records
+TABLE_KEYS = {
+    name: next(col for col, spec in columns.items() if spec.get("key"))
+    for name, columns in TABLE_SCHEMAS.items()
+}
+
+# pandas dtype of each column kind ("category" dtypes are built per column from its options)
+_KIND_DTYPES = {"id": "Int32", "float": "float64", "bool": "bool", "text": object, "date": "datetime64[ns]"}
+
+def columns_of_kind(name, kind):
+    """Returns the columns of a table declared with the given kind, e.g. all "date" columns."""
+    return [col for col, spec in TABLE_SCHEMAS[name].items() if spec["kind"] == kind]
+
+def _default_value(spec):
+    if "default_days" in spec:
+        return pd.Timestamp(datetime.today().date() + timedelta(days=spec["default_days"]))
+    return spec.get("default")
+
+def _category_dtype(spec, values=None):
+    """Categorical dtype over the configured options plus any other values present in the data."""
+    categories = list(spec["options"])
+    if values is not None:
+        known = set(categories)
+        categories += sorted(v for v in pd.unique(values.dropna()) if v not in known)
+    return pd.CategoricalDtype(categories)
+
+def empty_table(name):
+    """Returns an empty DataFrame with the table's columns and dtypes."""
+    return pd.DataFrame({
+        col: pd.Series(dtype=_category_dtype(spec) if spec["kind"] == "category" else _KIND_DTYPES[spec["kind"]])
+        for col, spec in TABLE_SCHEMAS[name].items()
+    })
+
+# --- Typing ---
+def coerce_table(name, df):
+    """
+    Converts every column of a DataFrame to the dtype declared in TABLE_SCHEMAS and
+    fills declared defaults, one vectorized pass per column.
+    Used when loading records from the store and for rows inserted through change
+    records, so cached frames keep the same dtypes as freshly loaded ones.
+    """
+    for col, spec in TABLE_SCHEMAS[name].items():
+        kind = spec["kind"]
+        column = df[col]
+        if kind == "id":
+            column = pd.to_numeric(column, errors="coerce").astype("Int32")
+        elif kind == "float":
+            column = pd.to_numeric(column, errors="coerce").astype("float64")
+        elif kind == "bool":
+            column = column.astype("boolean").fillna(False).astype(bool)
+        elif kind == "date":
+            if not pd.api.types.is_datetime64_any_dtype(column):
+                # Stored dates are ISO strings; rows from change records carry date objects
+                column = pd.to_datetime(column.map(lambda x: x.isoformat() if isinstance(x, date) else x), errors="coerce")
+            column = column.astype("datetime64[ns]")
+        default = _default_value(spec)
+        if default is not None:
+            column = column.fillna(default)
+        if kind == "category":
+            column = column.astype(object).astype(_category_dtype(spec, column))
+        df[col] = column
+    return df
+
+def build_table(name, rows):
+    """
+    Builds the typed DataFrame of a table from raw records ([row dicts]).
+    Missing columns are added with None before the type conversions.
+    """
+    if not rows:
+        return empty_table(name)
+    df = pd.DataFrame(rows)
+    for col in TABLE_COLUMNS[name]: # Iterate over expected columns
+        if col not in df.columns:
+            df[col] = None # Add missing column with None
+    return coerce_table(name, df[TABLE_COLUMNS[name]].copy()) # Drop columns no longer in the schema
+
+def has_schema_dtypes(name, df):
+    """True if a frame's columns already have the registry's dtypes (e.g. frames read from columnar files)."""
+    for col, spec in TABLE_SCHEMAS[name].items():
+        if col not in df.columns:
+            return False
+        if spec["kind"] == "category":
+            if not isinstance(df[col].dtype, pd.CategoricalDtype):
+                return False
+        elif spec["kind"] != "text" and df[col].dtype != _KIND_DTYPES[spec["kind"]]:
+            return False
+    return True
+
+def concat_tables(name, frames):
+    """Concatenates frames of one table, merging category lists so Categorical columns stay Categorical."""
+    for col in columns_of_kind(name, "category"):
+        categories = pd.api.types.union_categoricals([df[col] for df in frames]).categories
+        frames = [df.assign(**{col: df[col].cat.set_categories(categories)}) for df in frames]
+    return pd.concat(frames, ignore_index=True)
+
+def to_column_value(name, col, value):
+    """Converts a value from a change record to what is stored in the column (dates become Timestamps)."""
+    kind = TABLE_SCHEMAS[name][col]["kind"]
+    if kind == "date" and value is not None and not isinstance(value, pd.Timestamp):
+        return pd.Timestamp(value)
+    return value
+
+def with_display_dates(name, df):
+    """Returns a copy of a table with its date columns as datetime.date objects, for st.dataframe and comparisons with date.today()."""
+    df = df.copy(deep=False) # Only the converted date columns are new
+    for col in columns_of_kind(name, "date"):
+        df[col] = df[col].dt.date
+    return df
+
+def to_record_value(name, col, value):
+    """Converts a value read from a typed frame to a plain Python value for a change record (dates as date)."""
+    if value is None or pd.isna(value):
+        return None
+    if TABLE_SCHEMAS[name][col]["kind"] == "date":
+        return value.date()
+    if hasattr(value, "item"): # NumPy scalars
+        return value.item()
+    return value
+
+# --- Encoding ---
+def encode_table(name, df):
+    """
+    Converts a typed DataFrame to the raw records exchanged with the storage backends:
+    dates as "YYYY-MM-DD" strings and categories as plain strings.
+    """
+    if df.empty:
+        return []
+    df = df.astype({col: object for col in df.columns if not pd.api.types.is_datetime64_any_dtype(df[col])})
+    for col in columns_of_kind(name, "date"):
+        df[col] = df[col].dt.strftime("%Y-%m-%d").astype(object)
+    return df.astype(object).where(df.notna(), None).to_dict(orient="records")
+
+# --- Validation ---
+def validate_change(change):
+    """
+    Checks a change record against the registry and returns a list of problems
+    (empty if the change is valid): unknown table or columns, a missing key,
+    non-numeric IDs and values outside the option list of a category column.
+    """
+    table = change["table"]
+    if table not in TABLE_SCHEMAS:
+        return [f"Unknown table: {table}"]
+    columns = TABLE_SCHEMAS[table]
+    problems = []
+    if change["key"] is None:
+        problems.append(f"{table}: missing {TABLE_KEYS[table]}")
+    for col, value in change["fields"].items():
+        spec = columns.get(col)
+        if spec is None:
+            problems.append(f"{table}: unknown column {col}")
+        elif value is None:
+            continue
+        elif spec["kind"] == "id" and pd.isna(pd.to_numeric(value, errors="coerce")):
+            problems.append(f"{table}.{col}: {value!r} is not a valid ID")
+        elif spec["kind"] == "category" and value not in spec["options"]:
+            problems.append(f"{table}.{col}: {value!r} is not one of the allowed options")
+    return problems
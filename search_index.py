@@ -0,0 +1,165 @@
+# search_index.py
+
+import heapq
+import re
+import pandas as pd
+
+# --- Indexed Fields ---
+# Columns searched by the list views and the global search, per table, most important first
+SEARCH_FIELDS = {
+    "clients": ["name", "phone", "email", "address", "company_name"],
+    "cases": ["case_name", "opposing_party", "case_description"],
+    "invoices": ["invoice_id", "amount"], # Found by number or amount
+    "reminders": ["description"],
+    "time_entries": ["description", "category"],
+}
+
+# --- Arabic Normalization ---
+# Text is indexed and queried in one normalized form, so spelling variants match:
+# diacritics and tatweel are dropped, alef/hamza forms, alef maqsura and taa marbuta are
+# unified, Arabic-Indic digits become ASCII digits and Latin letters are lower-cased.
+_DIACRITICS = re.compile("[\u0610-\u061a\u064b-\u065f\u0670\u06d6-\u06ed]") # Harakat, tanween, shadda, sukun, Quranic marks
+_CHAR_MAP = str.maketrans({
+    "أ": "ا", "إ": "ا", "آ": "ا", "ٱ": "ا",
+    "ى": "ي", "ئ": "ي", "ؤ": "و", "ة": "ه",
+    "\u0640": None, # Tatweel
+    **{chr(0x0660 + digit): str(digit) for digit in range(10)}, # Arabic-Indic digits
+    **{chr(0x06F0 + digit): str(digit) for digit in range(10)}, # Extended (Persian) digits
+})
+
+def normalize_arabic(text):
+    """Returns the normalized, lower-cased form of a value used for indexing and queries ("" for missing values)."""
+    if text is None or (not isinstance(text, str) and pd.isna(text)):
+        return ""
+    text = _DIACRITICS.sub("", str(text)).translate(_CHAR_MAP).lower()
+    return " ".join(text.split())
+
+# --- Inverted Index ---
+# Each row is indexed by the character trigrams of its normalized fields. A query word
+# of three or more characters is looked up by intersecting the posting sets of its
+# trigrams; shorter words use the postings of every trigram containing them. Candidates
+# are then checked with a substring test, so results are exactly the rows whose fields
+# contain every query word, at a cost that depends on the matches, not the table size.
+_GRAM = 3
+
+def _grams(text):
+    if len(text) < _GRAM:
+        return {text} if text else set() # Short values are indexed whole
+    return {text[i:i + _GRAM] for i in range(len(text) - _GRAM + 1)}
+
+class SearchIndex:
+    """Trigram index over some text columns of one table, keyed by the table's primary key."""
+
+    def __init__(self, fields):
+        self.fields = fields
+        self.frame = None    # The DataFrame the index currently reflects
+        self._docs = {}      # key -> (normalized field values, joined text)
+        self._postings = {}  # trigram -> set of keys
+
+    def build(self, df, key_col):
+        """(Re)indexes every row of a DataFrame."""
+        self._docs, self._postings = {}, {}
+        for key, *values in zip(df[key_col], *(df[field] for field in self.fields)):
+            self._add(key, [normalize_arabic(value) for value in values])
+        self.frame = df
+
+    def add(self, key, row):
+        """Indexes (or re-indexes) one row given as a dict of field values."""
+        self.remove(key)
+        self._add(key, [normalize_arabic(row.get(field)) for field in self.fields])
+
+    def remove(self, key):
+        """Drops one row from the index (no-op for unknown keys)."""
+        doc = self._docs.pop(key, None)
+        if doc is None:
+            return
+        for gram in _grams(doc[1]):
+            keys = self._postings.get(gram)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._postings[gram]
+
+    def __len__(self):
+        return len(self._docs)
+
+    def __contains__(self, key):
+        return key in self._docs
+
+    def _add(self, key, values):
+        text = "\n".join(values) # Fields are joined with a character no query word contains
+        self._docs[key] = (values, text)
+        for gram in _grams(text):
+            self._postings.setdefault(gram, set()).add(key)
+
+    def apply_changes(self, changes, frame):
+        """Updates the index for change records (see journal.make_change) already applied to frame."""
+        for change in changes:
+            key, fields = change["key"], change["fields"]
+            if change["op"] == "insert":
+                self.add(key, fields)
+            elif change["op"] == "update" and key in self._docs and any(field in fields for field in self.fields):
+                values = [
+                    normalize_arabic(fields[field]) if field in fields else old
+                    for field, old in zip(self.fields, self._docs[key][0])
+                ]
+                self.remove(key)
+                self._add(key, values)
+            elif change["op"] == "delete":
+                self.remove(key)
+        self.frame = frame
+
+    def search(self, query):
+        """Keys of the rows containing every word of query (after normalization); None if the query is empty."""
+        words = normalize_arabic(query).split()
+        if not words:
+            return None
+        result = None
+        for word in sorted(words, key=len, reverse=True): # Longest (most selective) words first
+            matches = self._match(word, result)
+            result = matches if result is None else result & matches
+            if not result:
+                return set()
+        return result
+
+    def _match(self, word, within=None):
+        if len(word) >= _GRAM:
+            postings = sorted((self._postings.get(gram, set()) for gram in _grams(word)), key=len)
+            candidates = set.intersection(*postings) if postings[0] else set()
+        else:
+            candidates = set().union(*(keys for gram, keys in self._postings.items() if word in gram))
+        if within is not None:
+            candidates &= within
+        return {key for key in candidates if word in self._docs[key][1]}
+
+    # --- Ranking ---
+    # A row scores, for each query word, the best match quality over its fields times the
+    # field's weight: the whole field (4), the start of the field (3), the start of a word
+    # in it (2) or anywhere else (1). The first field counts fully, the others half.
+    def ranked(self, query, limit):
+        """[(score, key)] of the best rows matching query, best first."""
+        keys = self.search(query)
+        if not keys:
+            return []
+        words = normalize_arabic(query).split()
+        weights = [1.0] + [0.5] * (len(self.fields) - 1)
+        score = lambda key: _score(self._docs[key][0], words, weights)
+        return [(score(key), key) for key in heapq.nlargest(limit, keys, key=score)]
+
+def _score(values, words, weights):
+    score = 0.0
+    for word in words:
+        best = 0.0
+        for value, weight in zip(values, weights):
+            if word in value:
+                if value == word:
+                    quality = 4
+                elif value.startswith(word):
+                    quality = 3
+                elif " " + word in value:
+                    quality = 2
+                else:
+                    quality = 1
+                best = max(best, quality * weight)
+        score += best
+    return score
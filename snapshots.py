@@ -0,0 +1,176 @@
+# snapshots.py
+
+import argparse
+import gzip
+import json
+import os
+from datetime import datetime
+
+from config import SNAPSHOT_DIR, SNAPSHOT_FULL_EVERY, SNAPSHOT_RETENTION_DAYS, LOCK_FILE, ARCHIVE_RULES
+from schema import TABLE_NAMES, TABLE_KEYS
+from journal import encode_change, apply_changes_to_records
+from storage_backends import get_storage
+from file_lock import FileLock
+from archive import replace_archive
+from activity_store import replace_activity_log
+
+# --- Snapshot Files ---
+# A backup chain is one full snapshot followed by incremental ones, all gzip-compressed:
+#   20250723-101500-000000-full.json.gz   {table: [row dicts]} of every table
+#   20250723-103000-000000-incr.jsonl.gz  change records (see journal.make_change) since the previous file
+# Increments hold only the rows that changed, so they stay small and cheap to take often.
+# The data as of any time is the last full snapshot before it plus the increments up to it.
+# Besides the store tables, snapshots cover the data that leaves them, so a restore brings
+# everything back to the same moment:
+#   "archive/<table>"  the archived rows of a table (see archive.py), handled like a table
+#   "activities"       the case activity log (see activity_store.py): {"file": file ID,
+#                      "size": bytes covered, "entries": [entries and tombstones]}; an
+#                      increment holds the entries appended since the previous snapshot
+#                      as one {"table": "activities", "op": "append"} record
+_TIMESTAMP_FORMAT = "%Y%m%d-%H%M%S-%f"
+ARCHIVE_PREFIX = "archive/"
+SNAPSHOT_TABLES = TABLE_NAMES + [ARCHIVE_PREFIX + table for table in ARCHIVE_RULES]
+
+def store_table(name):
+    """The schema table of a snapshot table name ("archive/cases" -> "cases")."""
+    return name[len(ARCHIVE_PREFIX):] if name.startswith(ARCHIVE_PREFIX) else name
+
+_SNAPSHOT_KEYS = {name: TABLE_KEYS[store_table(name)] for name in SNAPSHOT_TABLES}
+
+def activity_change(file_id, size, entries):
+    """Increment record of the activity entries appended up to size bytes."""
+    return {"table": "activities", "op": "append", "key": file_id, "fields": {"size": size, "entries": entries}}
+
+class SnapshotStore:
+    """Full and incremental snapshots of the data store in one directory."""
+
+    def __init__(self, snapshot_dir=SNAPSHOT_DIR):
+        self.snapshot_dir = snapshot_dir
+        os.makedirs(snapshot_dir, exist_ok=True)
+
+    def entries(self):
+        """[(timestamp, kind, file name)] of every snapshot, oldest first."""
+        entries = []
+        for name in os.listdir(self.snapshot_dir):
+            stamp, _, rest = name.rpartition("-")
+            kind = rest.split(".", 1)[0]
+            if kind not in ("full", "incr") or not name.endswith(".gz"):
+                continue
+            try:
+                entries.append((datetime.strptime(stamp, _TIMESTAMP_FORMAT), kind, name))
+            except ValueError:
+                continue # Not a snapshot (e.g. a temp file)
+        return sorted(entries)
+
+    def latest(self):
+        """The newest (timestamp, kind, file name), or None."""
+        entries = self.entries()
+        return entries[-1] if entries else None
+
+    def increments_since_full(self):
+        """Number of incremental snapshots after the newest full one."""
+        count = 0
+        for _, kind, _ in reversed(self.entries()):
+            if kind == "full":
+                break
+            count += 1
+        return count
+
+    def write_full(self, records, timestamp=None):
+        """Writes a full snapshot of {table: [row dicts]}. Returns its file name."""
+        name = f"{(timestamp or datetime.now()).strftime(_TIMESTAMP_FORMAT)}-full.json.gz"
+        self._write(name, json.dumps(records, ensure_ascii=False, separators=(",", ":")))
+        return name
+
+    def write_increment(self, changes, timestamp=None):
+        """Writes an incremental snapshot of change records. Returns its file name."""
+        name = f"{(timestamp or datetime.now()).strftime(_TIMESTAMP_FORMAT)}-incr.jsonl.gz"
+        self._write(name, "".join(encode_change(change) for change in changes))
+        return name
+
+    def _write(self, name, text):
+        path = os.path.join(self.snapshot_dir, name)
+        with gzip.open(path + ".tmp", "wt", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(path + ".tmp", path) # Never leave a truncated snapshot under a valid name
+
+    def records_at(self, moment=None):
+        """
+        Rebuilds {snapshot table: [row dicts]} (plus "activities") as of a moment (default: the newest snapshot).
+        Returns (records, timestamp of the last snapshot applied), or (None, None) if
+        there is no full snapshot at or before the moment.
+        """
+        entries = [entry for entry in self.entries() if moment is None or entry[0] <= moment]
+        fulls = [i for i, (_, kind, _) in enumerate(entries) if kind == "full"]
+        if not fulls:
+            return None, None
+        chain = entries[fulls[-1]:]
+        with gzip.open(os.path.join(self.snapshot_dir, chain[0][2]), "rt", encoding="utf-8") as f:
+            records = json.load(f)
+        for _, _, name in chain[1:]:
+            with gzip.open(os.path.join(self.snapshot_dir, name), "rt", encoding="utf-8") as f:
+                changes = [json.loads(line) for line in f if line.strip()]
+            for change in changes:
+                if change["table"] == "activities" and "activities" in records:
+                    log = records["activities"]
+                    log["file"], log["size"] = change["key"], change["fields"]["size"]
+                    log["entries"] += change["fields"]["entries"]
+            apply_changes_to_records(records, [change for change in changes if change["table"] != "activities"], _SNAPSHOT_KEYS)
+        return records, chain[-1][0]
+
+    def prune(self, retention_days=SNAPSHOT_RETENTION_DAYS, now=None):
+        """Deletes chains that ended more than retention_days ago; the newest chain is always kept."""
+        entries = self.entries()
+        fulls = [i for i, (_, kind, _) in enumerate(entries) if kind == "full"]
+        now = now or datetime.now()
+        for start, end in zip(fulls, fulls[1:]):
+            # A chain is needed until the next full snapshot is older than the retention period
+            if (now - entries[end][0]).days > retention_days:
+                for _, _, name in entries[start:end]:
+                    os.remove(os.path.join(self.snapshot_dir, name))
+
+    def needs_full(self):
+        """True if the next snapshot should be a full one (no chain yet, or the chain is long)."""
+        return not any(kind == "full" for _, kind, _ in self.entries()) or self.increments_since_full() >= SNAPSHOT_FULL_EVERY
+
+
+# --- Point-in-time Restore ---
+def restore_store(moment, snapshot_dir=SNAPSHOT_DIR):
+    """
+    Replaces the contents of the configured store, the archive and the case activity
+    log with the data as of moment (snapshots taken before they covered the archive and
+    the log only restore the store). Running servers pick the restored data up on their
+    next rerun. Returns the row counts and the timestamp of the snapshot the data comes from.
+    """
+    records, taken_at = SnapshotStore(snapshot_dir).records_at(moment)
+    if records is None:
+        raise ValueError(f"No full snapshot at or before {moment}")
+    with FileLock(LOCK_FILE):
+        get_storage().write_all(records)
+        for name in SNAPSHOT_TABLES:
+            if name.startswith(ARCHIVE_PREFIX) and name in records:
+                replace_archive(store_table(name), records[name])
+        if "activities" in records:
+            replace_activity_log(records["activities"]["entries"])
+    counts = {name: len(records.get(name) or []) for name in SNAPSHOT_TABLES}
+    counts["activities"] = len(records["activities"]["entries"]) if "activities" in records else 0
+    return counts, taken_at
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mojaz snapshots")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    list_parser = subparsers.add_parser("list", help="List the snapshots")
+    list_parser.add_argument("--dir", default=SNAPSHOT_DIR)
+    restore_parser = subparsers.add_parser("restore", help="Rebuild the store as of a given time")
+    restore_parser.add_argument("--at", default=None, help='Time to restore, e.g. "2025-07-23 10:30" (default: newest snapshot)')
+    restore_parser.add_argument("--dir", default=SNAPSHOT_DIR)
+    args = parser.parse_args()
+
+    if args.command == "list":
+        for taken_at, kind, name in SnapshotStore(args.dir).entries():
+            print(f"{taken_at:%Y-%m-%d %H:%M:%S}  {kind:<4}  {os.path.getsize(os.path.join(args.dir, name)) / 1024:>10.1f} KB  {name}")
+    elif args.command == "restore":
+        moment = datetime.fromisoformat(args.at) if args.at else None
+        counts, taken_at = restore_store(moment, args.dir)
+        print(f"Restored data as of {taken_at:%Y-%m-%d %H:%M:%S}: {counts}")
@@ -0,0 +1,388 @@
+# storage_backends.py
+
+import json
+import os
+import sqlite3
+import argparse
+import pandas as pd
+from contextlib import contextmanager
+from datetime import datetime, date
+
+from config import DATA_FILE, JOURNAL_FILE, JOURNAL_ENABLED, STREAM_LOAD_THRESHOLD_MB, STORAGE_BACKEND, SQLITE_FILE, PARTITION_DIR, COLUMNAR_DIR, COLUMNAR_COMPRESSION
+from schema import TABLE_COLUMNS, TABLE_NAMES, TABLE_KEYS, build_table, coerce_table, has_schema_dtypes, encode_table
+from journal import append_changes, read_changes, apply_changes_to_records
+from json_stream import load_tables_streaming
+from activity_store import import_case_logs
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError: # pyarrow is only needed for the "columnar" backend
+    feather = None
+
+# Every backend exchanges data as raw JSON-style records: {table: [row dicts]} with dates
+# as ISO strings. Typing into DataFrames is left to
+# data_persistence, so all backends load into identical frames. The exception is the
+# columnar backend (typed_frames = True), which stores and returns the typed frames, and
+# large JSON files, which are streamed straight into typed frames (see json_stream).
+
+class StorageBackend:
+    """Interface implemented by the storage engines behind load_data/save_data."""
+    name = None
+    supports_row_writes = False # True if apply_changes() persists change records directly
+    whole_store_writes = False  # True if write_tables() must always be given every table
+    lazy_tables = True          # True if load() can read a subset of tables cheaply
+    typed_frames = False        # True if load()/write_tables() exchange typed DataFrames instead of records
+
+    def signature(self):
+        """Returns a cheap value that changes whenever the stored data changes."""
+        raise NotImplementedError
+
+    def load(self, tables=None):
+        """
+        Returns a tuple of ({table: [row dicts]}, number of journal records replayed)
+        for the given tables (default: all). A table may also come back as a typed
+        DataFrame (columnar backend, streamed JSON loads).
+        """
+        raise NotImplementedError
+
+    def write_tables(self, data):
+        """Replaces the tables present in the given {table: [row dicts]}, leaving the others untouched."""
+        raise NotImplementedError
+
+    def write_all(self, data):
+        """Replaces the whole store with the given {table: [row dicts]}."""
+        self.write_tables({table: data.get(table) or [] for table in TABLE_NAMES})
+
+    def apply_changes(self, changes):
+        """Persists a list of change records (see journal.make_change)."""
+        raise NotImplementedError
+
+
+# --- JSON File Backend ---
+class JsonStorage(StorageBackend):
+    """DATA_FILE snapshot with an optional append-only journal of changes on top."""
+    name = "json"
+    whole_store_writes = True # Everything lives in one document
+    lazy_tables = False
+
+    def __init__(self, data_file=DATA_FILE, journal_file=JOURNAL_FILE, journal_enabled=JOURNAL_ENABLED,
+                 stream_threshold_mb=STREAM_LOAD_THRESHOLD_MB):
+        self.data_file = data_file
+        self.journal_file = journal_file
+        self.journal_enabled = journal_enabled
+        self.stream_threshold_mb = stream_threshold_mb
+        self.supports_row_writes = journal_enabled
+
+    def signature(self):
+        return (_file_signature(self.data_file), _file_signature(self.journal_file))
+
+    def load(self, tables=None):
+        data = {}
+        changes = read_changes(self.journal_file) if self.journal_enabled else []
+        if os.path.exists(self.data_file):
+            with open(self.data_file, "r", encoding="utf-8") as f:
+                if os.path.getsize(self.data_file) >= self.stream_threshold_mb * 2**20:
+                    # Large file: parse row by row straight into typed frames
+                    return load_tables_streaming(f, tables or TABLE_NAMES, changes), len(changes)
+                data = json.load(f)
+        apply_changes_to_records(data, changes, TABLE_KEYS)
+        return data, len(changes)
+
+    def write_tables(self, data):
+        _atomic_write_json(self.data_file, data, indent=4)
+        if os.path.exists(self.journal_file):
+            os.remove(self.journal_file) # The new snapshot already contains every journaled change
+
+    def apply_changes(self, changes):
+        append_changes(changes, self.journal_file)
+
+
+# --- Partitioned Files Backend ---
+class PartitionedStorage(StorageBackend):
+    """
+    One compact JSON file per table in PARTITION_DIR, so a save rewrites only the
+    tables it touched and a view reads only the tables it shows.
+    """
+    name = "partitioned"
+
+    def __init__(self, partition_dir=PARTITION_DIR):
+        self.partition_dir = partition_dir
+        os.makedirs(partition_dir, exist_ok=True)
+
+    def table_path(self, table):
+        return os.path.join(self.partition_dir, f"{table}.json")
+
+    def signature(self):
+        return tuple(_file_signature(self.table_path(table)) for table in TABLE_NAMES)
+
+    def load(self, tables=None):
+        data = {}
+        for table in tables or TABLE_NAMES:
+            path = self.table_path(table)
+            if os.path.exists(path):
+                with open(path, "r", encoding="utf-8") as f:
+                    data[table] = json.load(f)
+        return data, 0
+
+    def write_tables(self, data):
+        for table, rows in data.items():
+            _atomic_write_json(self.table_path(table), rows)
+
+
+# --- Columnar Files Backend ---
+class ColumnarStorage(StorageBackend):
+    """
+    One Arrow IPC (Feather v2) file per table in COLUMNAR_DIR. Column dtypes are stored
+    with the data, so a cold start memory-maps the columns instead of parsing JSON and
+    re-running the astype/to_datetime/fillna passes. Requires pyarrow.
+    """
+    name = "columnar"
+    typed_frames = True
+
+    def __init__(self, columnar_dir=COLUMNAR_DIR, compression=COLUMNAR_COMPRESSION):
+        if feather is None:
+            raise RuntimeError("The columnar storage backend requires pyarrow (pip install pyarrow).")
+        self.columnar_dir = columnar_dir
+        self.compression = compression
+        os.makedirs(columnar_dir, exist_ok=True)
+
+    def table_path(self, table):
+        return os.path.join(self.columnar_dir, f"{table}.arrow")
+
+    def signature(self):
+        return tuple(_file_signature(self.table_path(table)) for table in TABLE_NAMES)
+
+    def load(self, tables=None):
+        frames = {}
+        for table in tables or TABLE_NAMES:
+            path = self.table_path(table)
+            if not os.path.exists(path):
+                continue
+            # Categorical, Int32 and datetime64 columns are restored from the stored pandas metadata
+            df = feather.read_table(path, memory_map=True).to_pandas()
+            if not df.empty and not has_schema_dtypes(table, df):
+                df = coerce_table(table, df) # File written before a schema change
+            frames[table] = df
+        return frames, 0
+
+    def write_tables(self, frames):
+        for table, df in frames.items():
+            if isinstance(df, list): # Raw records, e.g. from write_all() during a migration
+                df = build_table(table, df)
+            df = df.reset_index(drop=True)
+            path = self.table_path(table)
+            tmp_path = path + ".tmp"
+            feather.write_feather(pa.Table.from_pandas(df, preserve_index=False), tmp_path, compression=self.compression)
+            os.replace(tmp_path, path)
+            _fsync_directory(path)
+
+
+# --- SQLite Backend ---
+# Column affinities that differ from TEXT; dates are stored as ISO text so they sort correctly.
+_SQL_TYPES = {
+    "client_id": "INTEGER", "case_id": "INTEGER", "invoice_id": "INTEGER", "reminder_id": "INTEGER",
+    "related_id": "INTEGER", "entry_id": "INTEGER", "amount": "REAL", "hours": "REAL",
+    "paid": "INTEGER", "is_completed": "INTEGER",
+}
+# Columns that get a secondary index wherever they exist
+_INDEXED_COLUMNS = ["client_id", "case_id", "date", "status"]
+
+def _sql_value(value):
+    """Converts a row value to something sqlite3 can bind, matching the JSON encoding."""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, (list, dict)):
+        return json.dumps(value, ensure_ascii=False)
+    if hasattr(value, "item"): # NumPy scalars
+        value = value.item()
+    if isinstance(value, float) and value != value: # NaN
+        return None
+    return value
+
+class SqliteStorage(StorageBackend):
+    """One table per entity in a WAL-mode SQLite database, written row by row."""
+    name = "sqlite"
+    supports_row_writes = True
+
+    def __init__(self, db_file=SQLITE_FILE):
+        self.db_file = db_file
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._create_schema(conn)
+
+    @contextmanager
+    def _connect(self):
+        """Yields a short-lived connection inside a transaction (safe across Streamlit's session threads)."""
+        conn = sqlite3.connect(self.db_file, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA synchronous=NORMAL")
+        try:
+            with conn: # Commits on success, rolls back on error
+                yield conn
+        finally:
+            conn.close()
+
+    def _create_schema(self, conn):
+        for table, columns in TABLE_COLUMNS.items():
+            key = TABLE_KEYS[table]
+            column_defs = ", ".join(
+                f"{col} {_SQL_TYPES.get(col, 'TEXT')}{' PRIMARY KEY' if col == key else ''}" for col in columns
+            )
+            conn.execute(f"CREATE TABLE IF NOT EXISTS {table} ({column_defs})")
+            for col in _INDEXED_COLUMNS:
+                if col in columns and col != key:
+                    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_{col} ON {table} ({col})")
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER)")
+        conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('generation', 0)")
+
+    def _bump_generation(self, conn):
+        conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'generation'")
+
+    def signature(self):
+        with self._connect() as conn:
+            return conn.execute("SELECT value FROM meta WHERE key = 'generation'").fetchone()[0]
+
+    def load(self, tables=None):
+        data = {}
+        with self._connect() as conn:
+            for table in tables or TABLE_NAMES:
+                data[table] = [dict(row) for row in conn.execute(f"SELECT * FROM {table}")]
+        return data, 0
+
+    def write_tables(self, data):
+        with self._connect() as conn:
+            for table, rows in data.items():
+                conn.execute(f"DELETE FROM {table}")
+                if rows:
+                    columns = TABLE_COLUMNS[table]
+                    placeholders = ", ".join("?" for _ in columns)
+                    conn.executemany(
+                        f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})",
+                        [[_sql_value(row.get(col)) for col in columns] for row in rows],
+                    )
+            self._bump_generation(conn)
+
+    def apply_changes(self, changes):
+        with self._connect() as conn: # One transaction for the whole batch
+            for change in changes:
+                table, key = change["table"], change["key"]
+                key_col = TABLE_KEYS[table]
+                fields = {col: value for col, value in change["fields"].items() if col in TABLE_COLUMNS[table]}
+                if change["op"] == "insert":
+                    columns = list(fields)
+                    conn.execute(
+                        f"INSERT OR REPLACE INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})",
+                        [_sql_value(fields[col]) for col in columns],
+                    )
+                elif change["op"] == "update" and fields:
+                    assignments = ", ".join(f"{col} = ?" for col in fields)
+                    conn.execute(
+                        f"UPDATE {table} SET {assignments} WHERE {key_col} = ?",
+                        [_sql_value(value) for value in fields.values()] + [_sql_value(key)],
+                    )
+                elif change["op"] == "delete":
+                    conn.execute(f"DELETE FROM {table} WHERE {key_col} = ?", [_sql_value(key)])
+            self._bump_generation(conn)
+
+    def fetch_rows(self, table, **criteria):
+        """Indexed lookup, e.g. fetch_rows("invoices", client_id=3, status=...)."""
+        where = " AND ".join(f"{col} = ?" for col in criteria) or "1 = 1"
+        with self._connect() as conn:
+            rows = conn.execute(f"SELECT * FROM {table} WHERE {where}", [_sql_value(v) for v in criteria.values()])
+            return [dict(row) for row in rows]
+
+
+def _file_signature(path):
+    """Returns a cheap (mtime_ns, size) signature for a file, or None if it is missing."""
+    try:
+        stat_result = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (stat_result.st_mtime_ns, stat_result.st_size)
+
+def _atomic_write_json(path, data, indent=None):
+    """
+    Writes JSON to a temp file, fsyncs it, then atomically renames it over path, so a
+    crash mid-write leaves either the old or the new file, never a truncated one.
+    """
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=indent, separators=None if indent else (",", ":"))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    _fsync_directory(path)
+
+def _fsync_directory(path):
+    """Flushes a rename in the file's directory to disk (no-op where unsupported, e.g. Windows)."""
+    try:
+        dir_fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(dir_fd)
+    except OSError:
+        pass
+    finally:
+        os.close(dir_fd)
+
+def get_storage(backend=STORAGE_BACKEND):
+    """Returns the storage engine selected in config.STORAGE_BACKEND."""
+    if backend == "json":
+        return JsonStorage()
+    if backend == "sqlite":
+        return SqliteStorage()
+    if backend == "partitioned":
+        return PartitionedStorage()
+    if backend == "columnar":
+        return ColumnarStorage()
+    raise ValueError(f"Unknown storage backend: {backend}")
+
+# --- Migration ---
+def migrate_json_store(target, json_file=DATA_FILE, destination=None):
+    """
+    One-shot copy of DATA_FILE (plus its journal) into the "sqlite", "partitioned" or
+    "columnar" backend. destination overrides the database file / partition directory.
+    Legacy activity_log lists of the cases are moved into the activity store first, since
+    the other backends don't keep that column. Returns row counts (and "activities", the
+    number of imported log entries).
+    """
+    data, _ = JsonStorage(data_file=json_file).load()
+    cases = data.get("cases")
+    if isinstance(cases, pd.DataFrame):
+        cases = cases.to_dict(orient="records") if "activity_log" in cases.columns else []
+    activities = import_case_logs(cases or [])
+    if target == "sqlite":
+        storage = SqliteStorage(destination or SQLITE_FILE)
+    elif target == "partitioned":
+        storage = PartitionedStorage(destination or PARTITION_DIR)
+    elif target == "columnar":
+        storage = ColumnarStorage(destination or COLUMNAR_DIR)
+    else:
+        raise ValueError(f"Unknown migration target: {target}")
+    if not storage.typed_frames:
+        data = {table: encode_table(table, rows) if isinstance(rows, pd.DataFrame) else rows for table, rows in data.items()}
+    storage.write_all(data)
+    counts = {table: len(data[table]) if table in data else 0 for table in TABLE_NAMES}
+    counts["activities"] = activities
+    return counts
+
+def migrate_json_to_sqlite(json_file=DATA_FILE, db_file=SQLITE_FILE):
+    """One-shot copy of DATA_FILE (plus its journal) into a SQLite database. Returns row counts."""
+    return migrate_json_store("sqlite", json_file, db_file)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mojaz storage utilities")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    migrate_parser = subparsers.add_parser("migrate", help="Copy the JSON data file into another backend")
+    migrate_parser.add_argument("--json", default=DATA_FILE)
+    migrate_parser.add_argument("--to", choices=["sqlite", "partitioned", "columnar"], default="sqlite")
+    migrate_parser.add_argument("--db", default=None, help="Destination database file or partition directory")
+    args = parser.parse_args()
+
+    if args.command == "migrate":
+        counts = migrate_json_store(args.to, args.json, args.db)
+        destination = args.db or {"sqlite": SQLITE_FILE, "partitioned": PARTITION_DIR, "columnar": COLUMNAR_DIR}[args.to]
+        print(f"Migrated {args.json} -> {destination}: {counts}")
+        print(f"Set STORAGE_BACKEND = \"{args.to}\" in config.py to use it.")